@@ -0,0 +1,177 @@
+'''
+Offline benchmarks of the agents against a local stub of the OpenRouter API.
+
+Usage (from the repository root):
+    python -m benchmarks.run --iterations 200 --latency 0.005 --error-rate 0.05 --output results.json
+
+The results are printed (or written to --output) as JSON.
+'''
+import os
+import sys
+import json
+import logging
+import platform
+import argparse
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from agent.agent import OpenRouterAgent
+from agent.catalog import ModelCatalog
+from agent.chatbot import Formats
+from agent.models import Descriptions
+from agent.retry import RetryPolicy
+from agent.utils import generate_tool
+
+from .stub_server import StubOpenRouterServer, PAID_MODEL
+
+# plan returned by the stub for the execute benchmark
+PLAN=[{'id': 'a', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}},
+      {'id': 'b', 'function': {'name': 'add', 'arguments': {'a': 3, 'b': 4}}},
+      {'id': 'c', 'function': {'name': 'add', 'arguments': {'a': '$a', 'b': '$b'}}}]
+
+class BenchAgent(OpenRouterAgent):
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__('You are a benchmark agent.',
+                         api_key='bench',
+                         model=PAID_MODEL,
+                         verbose=logging.CRITICAL,
+                         base_url=base_url,
+                         retry_policy=RetryPolicy(base_delay=0.001, max_delay=0.01, max_attempts=20),
+                         **kwargs)
+
+    @generate_tool(Descriptions(function='Add two numbers.',
+                                properties={'a': 'first number',
+                                            'b': 'second number'}))
+    def add(self, a: float, b: float)->float:
+        return a+b
+
+    @generate_tool(Descriptions(function='Return the value.',
+                                properties={'value': 'value to return'}))
+    def echo(self, value: str)->str:
+        return value
+
+def summarize(samples: List[float])->dict:
+    '''
+    Returns the count, mean, p50, p95 and max of durations in seconds.
+    '''
+    values=sorted(samples)
+    count=len(values)
+    return {'count': count,
+            'mean': sum(values)/count,
+            'p50': values[max(-(-50*count//100), 1)-1],
+            'p95': values[max(-(-95*count//100), 1)-1],
+            'max': values[-1]}
+
+def measure(function: Callable[[], object], iterations: int)->List[float]:
+    samples=[]
+    for _ in range(iterations):
+        start=perf_counter()
+        function()
+        samples.append(perf_counter()-start)
+    return samples
+
+def bench_construction(server: StubOpenRouterServer, iterations: int)->dict:
+    # cold: empty catalog fetched from the server, warm: catalog shared by the agents
+    catalog=ModelCatalog()
+    cold=measure(lambda: BenchAgent(server.base_url, catalog=catalog), 1)
+    warm=measure(lambda: BenchAgent(server.base_url, catalog=catalog), iterations)
+    return {'cold': cold[0], 'warm': summarize(warm)}
+
+def bench_chat(agent: BenchAgent, iterations: int, concurrency: int)->dict:
+    chat=lambda: agent.chat('Hello', format=Formats.STRING, use_cache=False)
+
+    start=perf_counter()
+    sequential=measure(chat, iterations)
+    sequential_time=perf_counter()-start
+
+    # concurrent requests on the shared pooled session
+    per_thread=max(iterations//concurrency, 1)
+    threads=[threading.Thread(target=lambda: measure(chat, per_thread)) for _ in range(concurrency)]
+    start=perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    concurrent_time=perf_counter()-start
+
+    return {'latency': summarize(sequential),
+            'sequential_rps': iterations/sequential_time,
+            'concurrent_rps': per_thread*concurrency/concurrent_time,
+            'concurrency': concurrency}
+
+def bench_execute(agent: BenchAgent, iterations: int)->dict:
+    samples=measure(lambda: agent.execute('Add the numbers.'), iterations)
+    return {'latency': summarize(samples),
+            'actions': len(PLAN)}
+
+def make_plan(length: int, chained: bool)->List[dict]:
+    # chained: each action references the previous one, otherwise the actions are independent
+    plan=[]
+    for index in range(length):
+        argument=f'${index-1}' if chained and index else 'value'
+        plan.append({'id': str(index), 'function': {'name': 'echo', 'arguments': {'value': argument}}})
+    return plan
+
+def bench_call(agent: BenchAgent, plan_lengths: List[int], iterations: int)->dict:
+    results={}
+    for kind in ('independent', 'chained'):
+        results[kind]={}
+        for length in plan_lengths:
+            plan=make_plan(length, kind=='chained')
+            # the arguments are resolved in place, a fresh copy of the plan is run each time
+            samples=measure(lambda: agent.call(json.loads(json.dumps(plan))), max(iterations//10, 1))
+            stats=summarize(samples)
+            stats['per_action']=stats['p50']/length
+            results[kind][str(length)]=stats
+    return results
+
+def run(iterations: int = 100,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        concurrency: int = 8,
+        plan_lengths: List[int] = (1, 10, 100, 1000))->dict:
+    results={'metadata': {'timestamp': datetime.now(timezone.utc).isoformat(),
+                          'python': platform.python_version(),
+                          'platform': platform.platform(),
+                          'cpus': os.cpu_count(),
+                          'iterations': iterations,
+                          'latency': latency,
+                          'error_rate': error_rate}}
+
+    with StubOpenRouterServer(latency=latency, error_rate=error_rate, plans=[PLAN]) as server:
+        results['construction']=bench_construction(server, iterations)
+
+        agent=BenchAgent(server.base_url)
+        results['chat']=bench_chat(agent, iterations, concurrency)
+        results['execute']=bench_execute(agent, iterations)
+        results['call']=bench_call(agent, list(plan_lengths), iterations)
+        results['server']={'requests': server.requests, 'errors': server.errors}
+        results['session']=agent.session.stats()
+        results['metrics']=agent.get_metrics()
+        agent.close()
+
+    return results
+
+def main():
+    parser=argparse.ArgumentParser(description='Offline benchmarks of the agents against a stub OpenRouter server.')
+    parser.add_argument('--iterations', type=int, default=100, help='requests per benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of the stub completions in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the completions failing')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads of the concurrent chat benchmark')
+    parser.add_argument('--plan-lengths', type=int, nargs='+', default=[1, 10, 100, 1000], help='plan lengths of the call benchmark')
+    parser.add_argument('--output', type=str, default=None, help='JSON file of the results, printed if not provided')
+    args=parser.parse_args()
+
+    results=run(args.iterations, args.latency, args.error_rate, args.concurrency, args.plan_lengths)
+    output=json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(output)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,158 @@
+import json
+import random
+import threading
+from time import sleep
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+# models of the stub catalog, the paid one receives the tools in the request body
+PAID_MODEL='bench/paid-model'
+FREE_MODEL='bench/free-model:free'
+MODELS=[{'id': PAID_MODEL, 'name': 'Bench paid model', 'context_length': 128000,
+         'pricing': {'prompt': '0.000001', 'completion': '0.000002'}},
+        {'id': FREE_MODEL, 'name': 'Bench free model', 'context_length': 128000,
+         'pricing': {'prompt': '0', 'completion': '0'}}]
+
+class StubOpenRouterServer:
+    '''
+    Local HTTP server emulating the /api/v1/models and /api/v1/chat/completions endpoints of
+    OpenRouter, used to benchmark the agents without network access.
+
+    The completions return the canned messages in turn, otherwise the canned plans in turn (as a
+    JSON content) or a fixed text if no plan is provided. A fraction of the completions fails with a
+    429 or a 500 response. The bodies of the completion requests are kept in ``bodies``.
+
+    Args:
+        latency (float): Delay added to each completion in seconds.
+        error_rate (float): Fraction of the completions failing, between 0 and 1.
+        plans (List[list]): Canned plans returned by the completions.
+        text (str): Content returned if no plan is provided.
+        seed (int): Seed of the errors.
+        models (List[dict]): Models of the catalog, MODELS by default.
+        messages (List[dict]): Canned assistant messages (e.g. with tool_calls) returned by the completions.
+    '''
+    def __init__(self,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 plans: Optional[List[list]] = None,
+                 text: str = 'Hello from the stub server.',
+                 seed: int = 0,
+                 models: Optional[List[dict]] = None,
+                 messages: Optional[List[dict]] = None):
+        self.latency=latency
+        self.error_rate=error_rate
+        self.plans=plans or []
+        self.text=text
+        self.models=MODELS if models is None else models
+        self.messages=messages or []
+        self.bodies: List[dict]=[]
+        self._random=random.Random(seed)
+        self._lock=threading.Lock()
+        self._next_plan=0
+        self._next_message=0
+        self.requests=0
+        self.errors=0
+        self._server: ThreadingHTTPServer=None
+        self._thread: threading.Thread=None
+
+    @property
+    def base_url(self)->str:
+        host, port=self._server.server_address[:2]
+        return f'http://{host}:{port}/api/v1'
+
+    def start(self)->'StubOpenRouterServer':
+        server=self
+        class Handler(_Handler):
+            stub=server
+        self._server=ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads=True
+        self._thread=threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server=None
+
+    def completion(self, body: dict)->tuple:
+        '''
+        Returns the status code, the headers and the body of the response to a completion request.
+        '''
+        with self._lock:
+            self.requests+=1
+            self.bodies.append(body)
+            failed=self._random.random()<self.error_rate
+            message=None
+            if failed:
+                self.errors+=1
+                status_code=self._random.choice((429, 500))
+            elif self.messages:
+                message=self.messages[self._next_message%len(self.messages)]
+                self._next_message+=1
+            elif self.plans:
+                content=json.dumps(self.plans[self._next_plan%len(self.plans)])
+                self._next_plan+=1
+
+        if self.latency:
+            sleep(self.latency)
+
+        if failed:
+            return status_code, {'Retry-After': '0'}, {'error': {'code': status_code, 'message': 'stub error'}}
+
+        if message is not None:
+            content=message.get('content') or ''
+        elif not self.plans:
+            content=self.text
+        if message is None:
+            message={'role': 'assistant', 'content': content}
+        prompt_tokens=sum(len(str(message.get('content') or ''))//4 for message in body.get('messages', []))
+        completion_tokens=len(content)//4
+        return 200, {}, {'id': f'gen-{self.requests}',
+                         'model': body.get('model'),
+                         'choices': [{'index': 0,
+                                      'finish_reason': 'tool_calls' if message.get('tool_calls') else 'stop',
+                                      'message': message}],
+                         'usage': {'prompt_tokens': prompt_tokens,
+                                   'completion_tokens': completion_tokens,
+                                   'total_tokens': prompt_tokens+completion_tokens}}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive connections, as the OpenRouter API
+    protocol_version='HTTP/1.1'
+    # headers and body are written separately, avoid the delayed ACK stalls of keep-alive connections
+    disable_nagle_algorithm=True
+    stub: StubOpenRouterServer=None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send(200, {}, {'data': self.stub.models})
+        else:
+            self._send(404, {}, {'error': {'code': 404, 'message': 'not found'}})
+
+    def do_POST(self):
+        body=json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(*self.stub.completion(body))
+        else:
+            self._send(404, {}, {'error': {'code': 404, 'message': 'not found'}})
+
+    def _send(self, status_code: int, headers: dict, body: dict):
+        data=json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
@@ -5,7 +5,6 @@ import os
 from pathlib import Path
 from glob import glob
 import sys
-import pandas as pd
 import logging
 import requests
 from typing import List
@@ -1,9 +1,30 @@
+import copy
+import json
 import logging
-from typing import List, Union
+import asyncio
+import contextvars
+import threading
+from functools import partial
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, Union
 from enum import Enum
 
 from .chatbot import BaseChatbot, OpenRouterChatbot, BASE_MODEL, Formats
-from .models import Tool, ToolCall, Message
+from .models import Tool, ToolCall, Message, ToolSet
+from .references import CompiledArguments
+from .conversation import Session
+from .scheduler import ActionScheduler, ToolExecutor
+from .streaming import JSONArrayStreamParser
+from .utils import to_dict, to_plan, parse_tool_calls
+from .journal import Journal, JournalRun
+from .blobs import BlobStore, BlobHandle, IteratorHandle, materialize
+from .logs import get_logger, Payload, truncate
+from .instrumentation import Instrumentation
+
+# lazy creation of the tool executors of the agents
+_tool_executor_lock=threading.Lock()
 
 class StatusCode(Enum): 
     SUCCESS='success'
@@ -11,175 +32,673 @@ class StatusCode(Enum):
     ARGPARSE_ERROR='argparse_error'
     EXECUTION_ERROR='execution_error'
     NOT_IMPLEMENTED_ERROR='not_implemented_error'
+    TIMEOUT='timeout'
+    SKIPPED='skipped'
 
 class BaseAgent(BaseChatbot):
+    # maximum number of independent actions run at the same time by call
+    max_concurrency: int = 8
+    # if True make_tools is called once per agent class and its ToolSet shared by all the instances,
+    # set it to False if the tools depend on the instance
+    cache_tools: bool = True
+    # maximum number of rounds of native tool calls fed back to the model by execute
+    max_tool_rounds: int = 8
+    # default time limit of each tool and of a whole plan run by call in seconds, None for no limit
+    tool_timeout: float = None
+    plan_timeout: float = None
+    # maximum number of threads running the tools with a time limit, shared by the clones of the agent
+    tool_workers: int = 32
+    tool_executor: ToolExecutor = None
+    # optional journal where execute records the plans and the action results, see resume and replay
+    journal: Journal = None
+    # store of the large results and of the iterators returned by the tools, a temporary one by default
+    blob_store: BlobStore = None
+    # maximum length of a tool result sent back to the model as a tool message
+    max_tool_result_length: int = 100000
+
     def __init__(self,
                  purpose: str, 
                  verbose: int = logging.INFO):
         
         # purpose of the agent (who are you?)
         self.purpose=purpose
+
+        # final answer of the model after the native tool calls rounds of execute
+        self.answer=None
+        # id of the last run of execute in the journal
+        self.run_id=None
         
         # state containing responses from functions
         self.reset_state()
         
-        # list of tools available to the agent
-        self.tools: List[Tool]=self.make_tools()
+        # tools available to the agent
+        self.tools: ToolSet=self._get_tools()
 
-        # setup logger
-        self.logger = logging.getLogger(self.__class__.__name__)  # Get a logger unique to the class
-        self.logger.setLevel(verbose)  # Set the logging level
-        
-        # Check if handlers are already added (to prevent duplicate logs)
-        if not self.logger.handlers:
-            formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+        # setup logger, shared background handler (see logs.py)
+        self.logger=get_logger(self.__class__.__name__, verbose)
 
-            # Console handler (logs to terminal)
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-
-            # Optional: File logging (uncomment if needed)
-            # file_handler = logging.FileHandler(f"{self.__class__.__name__}.log")
-            # file_handler.setFormatter(formatter)
-            # self.logger.addHandler(file_handler)
-
-            # Prevent logs from propagating to the root logger
-            self.logger.propagate = False
+        # agents not initializing a chatbot (direct subclasses of BaseAgent) emit no spans
+        if not hasattr(self, 'instrumentation'):
+            self.instrumentation=Instrumentation([])
 
         pass 
     
     def reset_state(self):
         self.state={}
 
+    def reset(self):
+        '''
+        Clears the state, the answer and the run id of the last request.
+        '''
+        self.reset_state()
+        self.answer=None
+        self.run_id=None
+
+    def clone(self)->'BaseAgent':
+        '''
+        Returns a lightweight copy of the agent with a fresh state, for a single request at a time.
+
+        The clone shares the tools, the model metadata, the configuration, the HTTP clients, the caches
+        and the blob store of the agent, without running __init__ again. Subclasses keeping other
+        per-request attributes reset them in reset_state.
+        '''
+        # created here so that the clones share them instead of creating their own on first use
+        self._get_async_client()
+        self._get_blob_store()
+        self._get_tool_executor()
+        agent=copy.copy(self)
+        agent.reset()
+        return agent
+
     def get_prompt(self, content: str)->str:
         # prompt=f"{self.purpose}\n{content}"
         prompt=f"{content}"
         return prompt #TODO 
     
+    def new_session(self, max_tokens: int = None, **kwargs)->Session:
+        '''
+        Returns a new conversation with the purpose of the agent as system message. 
+        kwargs are forwarded to Session (e.g. count_tokens, summarize).
+        '''
+        return Session(self.purpose, max_tokens, **kwargs)
+
+    def _get_chat_messages(self, prompt: str, session: Session = None)->List[Message]:
+        if session is None:
+            return [Message('user', prompt),
+                    Message('system', self.purpose)]
+        session.add('user', prompt)
+        return session.messages()
+
     def chat(self,
              content: str,
              format: Formats=Formats.STRING,
-             stream: bool = False)->Union[str, dict]:
-        
+             stream: bool = False,
+             session: Session = None,
+             **kwargs)->Union[str, dict]:
+        '''
+        Chats with the agent. If a session is provided the content and the response are appended to it
+        and its context window is sent (with stream, the caller appends stream.content once consumed).
+        kwargs are forwarded to the chatbot (e.g. use_cache).
+        '''
         prompt=self.get_prompt(content)
-        
-        messages=[
-            Message('user', prompt),
-            Message('system', self.purpose),
-                  ]
+        messages=self._get_chat_messages(prompt, session)
         
         response=super().chat(messages,
                               tools=None, 
                               format=format, 
-                              stream=stream)
+                              stream=stream,
+                              **kwargs)
+        
+        if session is not None and not stream:
+            session.add('assistant', response if isinstance(response, str) else json.dumps(response))
+        return response
+
+    async def achat(self,
+                    content: str,
+                    format: Formats=Formats.STRING,
+                    stream: bool = False,
+                    session: Session = None,
+                    **kwargs)->Union[str, dict]:
+        '''
+        Async version of chat.
+        '''
+        prompt=self.get_prompt(content)
+        messages=self._get_chat_messages(prompt, session)
+        
+        response=await super().achat(messages,
+                                     tools=None, 
+                                     format=format, 
+                                     stream=stream,
+                                     **kwargs)
+        
+        if session is not None and not stream:
+            session.add('assistant', response if isinstance(response, str) else json.dumps(response))
         return response
 
     def make_tools(self) -> List[Tool]:
-        # Collecting tools from decorated methods
-        return [getattr(self, method).tool for method in dir(self) if hasattr(getattr(self, method), 'tool')]
+        # Collecting tools from decorated methods (looked up on the class to avoid evaluating properties)
+        cls=type(self)
+        tools=[]
+        for name in dir(cls):
+            tool=getattr(getattr(cls, name, None), 'tool', None)
+            if isinstance(tool, Tool):
+                tools.append(tool)
+        return tools
+
+    def _get_tools(self) -> ToolSet:
+        cls=type(self)
+        if not self.cache_tools:
+            return ToolSet(self.make_tools())
+        
+        # the cache is looked up in the class dictionary so that subclasses don't inherit it
+        tools=cls.__dict__.get('_tool_set')
+        if tools is None:
+            tools=ToolSet(self.make_tools())
+            cls._tool_set=tools
+        return tools
 
-    def call(self, actions: List[dict]):
+    def call(self, 
+             actions: Iterable[dict], 
+             max_concurrency: int = None, 
+             state: dict = None, 
+             timeout: float = None, 
+             journal_run: JournalRun = None)->dict:
         '''
-        Executes a sequence of tool calls in the provided order.
+        Executes a sequence of tool calls, running concurrently the actions not depending on each other.
 
         Each action is represented as a dictionary containing the tool's function name and its arguments.
-        If an argument references the result of a previous action (indicated by a string starting with '$'), 
-        the function resolves the dependency by replacing the reference with the corresponding result from the state.
+        If an argument references the result of a previous action ($id, $id[...] or $id.attr, also inside 
+        nested dictionaries and lists), the function resolves the dependency by replacing the reference with 
+        the corresponding result from the state. References embedded in a longer string are formatted as text.
 
         The function performs the following steps:
         1. Initializes an internal state dictionary to store results of executed actions.
-        2. Iterates over the list of actions.
-        3. Resolves dependencies in the function arguments by evaluating references to previous results.
-        4. Executes the function if it is implemented.
-        5. Stores the result of the function execution in the state dictionary if the result is not None.
-        6. Logs execution results or errors.
+        2. Builds the dependency graph of the actions from the references to previous actions.
+        3. Runs each action as soon as the actions it depends on are completed, up to max_concurrency at a time.
+        4. Resolves dependencies in the function arguments with the references compiled once per plan.
+        5. Executes the function if it is implemented.
+        6. Stores the result of the function execution in the state dictionary if the result is not None.
+        7. Logs execution results or errors.
+
+        A tool running longer than its timeout (see generate_tool and tool_timeout) or than the plan timeout
+        gets the TIMEOUT status, its thread is abandoned. The tools are run on a pool of at most tool_workers 
+        threads, and an action reached after the plan deadline gets the TIMEOUT status without being started. 
+        The actions depending on an action which didn't succeed are SKIPPED.
 
         Args:
-            actions (List[dict]): List of action dictionaries where each dictionary contains:
+            actions (Iterable[dict]): Action dictionaries, possibly a lazy iterable (e.g. a plan being streamed), 
+                where each dictionary contains:
                 - "id": Unique action identifier.
                 - "function": Dictionary with:
                     - "name": Function name to be executed.
                     - "arguments": Dictionary of function arguments.
+            max_concurrency (int): Maximum number of actions running at the same time, defaults to 
+                the max_concurrency of the agent. With 1 the actions are run in the provided order, 
+                as they are when an action id is duplicated.
+            state (dict): Optional dictionary where the results are stored instead of the agent state, 
+                allowing concurrent calls on the same agent.
+            timeout (float): Time limit of the plan in seconds, defaults to the plan_timeout of the agent.
+            journal_run (JournalRun): Optional run of a journal where the action results are recorded. The 
+                actions already completed in the run are restored instead of being run again.
+
+        Returns:
+            dict: The state with the action, result and status of each action.
 
         Raises:
             ValueError: If argument resolution fails or referenced results are not available.
         '''
+        if max_concurrency is None:
+            max_concurrency=self.max_concurrency
 
-        self.state={}
-        action_id_list=[f'${action["id"]}' for action in actions]
+        if state is None:
+            self.state={}
+            state=self.state
+
+        if timeout is None:
+            timeout=self.plan_timeout
+        run=self._run_action
+        if timeout is not None or journal_run is not None:
+            run=partial(self._run_action, 
+                        deadline=None if timeout is None else monotonic()+timeout, 
+                        journal_run=journal_run)
+
+        with self.instrumentation.span('agent.call'), \
+             ActionScheduler(run, state, max_concurrency, self._make_state_entry) as scheduler:
+            for action in actions:
+                scheduler.add(action)
         
-        for action in actions:
-            self.state[action['id']]={'action': action,
-                                      'result': None,
-                                      'status': StatusCode.WAITING.value}
-            
-            function_name = action["function"]["name"]
-            arguments = action["function"]["arguments"]
+        return state
+
+    @staticmethod
+    def _make_state_entry(action: dict)->dict:
+        return {'action': action,
+                'result': None,
+                'status': StatusCode.WAITING.value}
+
+    def _run_action(self, 
+                    action: dict, 
+                    compiled_arguments: CompiledArguments, 
+                    state: dict, 
+                    deadline: float = None, 
+                    journal_run: JournalRun = None):
+        if journal_run is not None and journal_run.restore(action, state):
+            self.logger.debug('Restored the result of %s from the journal', action['id'])
+            return
+        self._execute_action(action, compiled_arguments, state, deadline)
+        if journal_run is not None:
+            journal_run.record(action['id'], state[action['id']])
+
+    def _execute_action(self, action: dict, compiled_arguments: CompiledArguments, state: dict, deadline: float = None):
+        function_name = action["function"]["name"]
+        arguments = action["function"]["arguments"]
+
+        # Skip the action if an action it depends on didn't succeed
+        failed=[ref_key for ref_key in compiled_arguments.references if state[ref_key]['status']!=StatusCode.SUCCESS.value]
+        if failed:
+            state[action['id']]['status']=StatusCode.SKIPPED.value
+            self.logger.warning(f'Skipped {function_name} as the actions {failed} did not succeed')
+            return
 
-            # Resolve dependencies
+        # Don't start the action once the plan deadline has passed
+        if deadline is not None and monotonic()>=deadline:
+            state[action['id']]['status']=StatusCode.TIMEOUT.value
+            self.logger.error(f'Function {function_name} not started, the plan timed out')
+            return
+
+        # Resolve dependencies
+        try:
+            with self.instrumentation.span('action.resolve'):
+                # the resolved arguments are passed to the tool only, the state keeps the references so that
+                # the results loaded from a handle aren't copied in the entry of each dependent action
+                arguments = compiled_arguments.resolve(lambda ref_key: materialize(state[ref_key]["result"]))
+        
+        except Exception as e:
+            state[action['id']]['status']=StatusCode.ARGPARSE_ERROR.value
+            self.logger.error('Failed to parse function call arguments\n'
+                              'Function name: %s\n'
+                              'Arguments: %s\n'
+                              '%s', function_name, Payload(arguments), e)
+            return
+
+        # Execute Function
+        method = getattr(self, function_name, None)
+        if method:
+            timeout=self._get_timeout(method, deadline)
             try:
-                for key, value in arguments.items():
-                    if isinstance(value, str):
-                        mask=[s in value for s in action_id_list]
-                        if any(mask): # value.startswith("$")
-                            ref_key = [action_id_list for action_id_list, mask in zip(action_id_list, mask) if mask][0].replace('$', '')
-                            if ref_key in self.state.keys():
-                                arguments[key] = eval(value.replace(f'${ref_key}', 'self.state[ref_key]["result"]'))
-            
+                with self.instrumentation.span('tool', tool=function_name, action_id=action['id']):
+                    if timeout is None:
+                        result = method(**arguments)
+                    else:
+                        result = self._call_with_timeout(method, arguments, timeout)
+                if result is not None:
+                    result = self._store_result(result)
+                    state[action["id"]]['result'] = result
+                state[action['id']]['status']=StatusCode.SUCCESS.value
+                self.logger.debug("Result from %s: %s", function_name, Payload(result))
+            except FutureTimeoutError:
+                state[action['id']]['status']=StatusCode.TIMEOUT.value
+                self.logger.error(f'Function {function_name} timed out after {timeout:.2f}s')
             except Exception as e:
-                self.state[action['id']]['status']=StatusCode.ARGPARSE_ERROR.value
-                self.logger.error('Failed to parse function call arguments\n'
-                f'Function name: {function_name}\n'
-                f'Arguments: {arguments}\n'
-                f'{e}')
-
-            # Execute Function
-            method = getattr(self, function_name, None)
-            if method:
-                try:
-                    result = method(**arguments)
-                    if result:
-                        self.state[action["id"]]['result'] = result
-                        self.state[action['id']]['status']=StatusCode.SUCCESS.value
-                        self.logger.debug(f"Result from {function_name}: {result}")
-                except Exception as e:
-                    self.state[action['id']]['status']=StatusCode.EXECUTION_ERROR.value
-                    self.logger.error(f'Failed to call method\n'
-                                      f'Function name: {function_name}\n'
-                                      f'Arguments: {arguments}\n'
-                                      f'{e}')
-            else:
-                self.state[action['id']]['status']=StatusCode.NOT_IMPLEMENTED_ERROR.value
-                self.logger.error(f"Function {function_name} not implemented")
-                pass
+                state[action['id']]['status']=StatusCode.EXECUTION_ERROR.value
+                self.logger.error('Failed to call method\n'
+                                  'Function name: %s\n'
+                                  'Arguments: %s\n'
+                                  '%s', function_name, Payload(arguments), e)
+        else:
+            state[action['id']]['status']=StatusCode.NOT_IMPLEMENTED_ERROR.value
+            self.logger.error(f"Function {function_name} not implemented")
+            pass
 
-    def execute(self, content: str)->dict:
-        '''
-        Method to ask the agent to eventually perform actions using the available tools  
-        '''
+    def _store_result(self, result):
+        # iterators are consumed lazily by the dependent actions and large results are spilled to disk,
+        # both are stored behind a handle
+        if isinstance(result, (BlobHandle, IteratorHandle)):
+            return result
+        if isinstance(result, Iterator) and not isinstance(result, (str, bytes)):
+            return self._get_blob_store().wrap_iterator(result)
+        blob_store=self._get_blob_store()
+        if blob_store.should_spill(result):
+            return blob_store.put(result)
+        return result
+
+    def _get_blob_store(self)->BlobStore:
+        if self.blob_store is None:
+            self.blob_store=BlobStore()
+        return self.blob_store
+
+    def _get_timeout(self, method, deadline: float = None)->float:
+        # time limit of the tool, bounded by the deadline of the plan
+        timeout=getattr(method, 'timeout', None)
+        if timeout is None:
+            timeout=self.tool_timeout
+        if deadline is not None:
+            remaining=max(deadline-monotonic(), 0.0)
+            timeout=remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _call_with_timeout(self, method, arguments: dict, timeout: float):
+        # the tool runs on a bounded pool of daemon threads, it is abandoned if it doesn't complete 
+        # in time (a thread can't be interrupted) and not started if it is still queued
+        context=contextvars.copy_context()
+        future=self._get_tool_executor().submit(context.run, method, **arguments)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _get_tool_executor(self)->ToolExecutor:
+        with _tool_executor_lock:
+            if self.tool_executor is None:
+                self.tool_executor=ToolExecutor(self.tool_workers)
+            return self.tool_executor
+
+    def _get_plan_messages(self, content: str, session: Session = None)->List[Message]:
         # make prompt 
         prompt=self.get_prompt(content)
         
+        if session is None:
+            return [Message('system', self.purpose), 
+                    Message('user', prompt)]
+        session.add('user', prompt)
+        return session.messages()
+
+    def plan(self, content: str, session: Session = None)->List[dict]:
+        '''
+        Requests to the model the sequence of tool actions answering the content. If a session is 
+        provided the content and the plan are appended to it.
+        '''
         # request sequence of tool actions 
-        messages=[Message('system', self.purpose), 
-                  Message('user', prompt)]
+        messages=self._get_plan_messages(content, session)
         response=super().chat(messages, self.tools, Formats.DICT)
-        self.logger.debug(response)
+        self.logger.debug('Response: %s', Payload(response))
+        actions=to_plan(response)
+
+        if session is not None:
+            session.add('assistant', json.dumps(actions))
+        return actions
+
+    def execute(self, content: str, session: Session = None, stream: bool = False, run_id: str = None)->dict:
+        '''
+        Method to ask the agent to eventually perform actions using the available tools. 
+        With stream, the plan is streamed and each action is started as soon as it is generated.
+        If the model requests the tools natively (paid models), the results of the tool calls are 
+        sent back to the model, up to max_tool_rounds times, and its final answer is stored in answer.
+
+        If a journal is set, the plan and the action results are recorded in the run run_id (a new run by
+        default, its id is stored in run_id). If the run already has a plan it is resumed without 
+        requesting the model.
+        '''
+        with self.instrumentation.span('agent.execute', stream=stream):
+            journal_run=None if self.journal is None else self.journal.open_run(run_id)
+            if journal_run is None:
+                return self._execute(content, session, stream)
+
+            self.run_id=journal_run.run_id
+            if journal_run.actions:
+                return self._resume(journal_run)
+            state=self._execute(content, session, stream, journal_run)
+            journal_run.finish()
+            return state
+
+    def resume(self, run_id: str)->dict:
+        '''
+        Resumes a run of the journal: the actions completed successfully are restored and the others are 
+        run, without requesting the model.
+        '''
+        if self.journal is None:
+            raise ValueError('No journal set')
+        journal_run=self.journal.open_run(run_id)
+        if not journal_run.actions:
+            raise ValueError(f'No plan recorded for the run {run_id}')
+        self.run_id=run_id
+        return self._resume(journal_run)
+
+    def replay(self, run_id: str, journal: Journal = None)->dict:
+        '''
+        Runs again all the actions of the plan recorded for a run, without requesting the model.
+        '''
+        journal=self.journal if journal is None else journal
+        if journal is None:
+            raise ValueError('No journal set')
+        actions=journal.open_run(run_id).actions
+        if not actions:
+            raise ValueError(f'No plan recorded for the run {run_id}')
+        return self.call(actions)
+
+    def _resume(self, journal_run: JournalRun)->dict:
+        self.logger.info(f'Resuming the run {journal_run.run_id} ({len(journal_run.results)}/{len(journal_run.actions)} actions completed)')
+        self.call(journal_run.actions, journal_run=journal_run)
+        if not journal_run.finished:
+            journal_run.finish()
+        return self.state
+
+    def _execute(self, content: str, session: Session, stream: bool, journal_run: JournalRun = None)->dict:
+        if stream:
+            self._execute_stream(content, session, journal_run)
+            return self.state
+
+        # request sequence of tool actions 
+        messages=self._get_plan_messages(content, session)
+        response, tool_calls=super().complete(messages, self.tools, Formats.DICT)
+        self.answer=None
+
+        if not tool_calls:
+            # plan generated in the content (tools described in the prompt)
+            self.logger.debug('Response: %s', Payload(response))
+            actions=to_plan(response)
+            if session is not None:
+                session.add('assistant', json.dumps(actions))
+            if journal_run is not None:
+                journal_run.record_plan(actions, content)
+
+            # run functions 
+            self.call(actions, journal_run=journal_run)
+            return self.state
+
+        return self._execute_tool_calls(messages, tool_calls, session, content, journal_run)
+
+    def _execute_tool_calls(self, 
+                            messages: List[Message], 
+                            tool_calls: List[ToolCall], 
+                            session: Session = None, 
+                            content: str = None, 
+                            journal_run: JournalRun = None)->dict:
+        # run the native tool calls and feed their results back till the model answers without tool calls
+        self.state={}
+        for _ in range(self.max_tool_rounds):
+            new_messages=[Message('assistant', '', tool_calls=[self._to_tool_call_message(tool_call) for tool_call in tool_calls])]
+            actions=[tool_call.to_dict() for tool_call in tool_calls]
+            if journal_run is not None:
+                journal_run.record_plan(actions, content)
+                content=None
+            self.call(actions, state=self.state, journal_run=journal_run)
+            for action in actions:
+                new_messages.append(Message('tool', self._get_tool_result(self.state[action['id']]), tool_call_id=action['id']))
+
+            if session is None:
+                messages.extend(new_messages)
+            else:
+                for message in new_messages:
+                    session.append(message)
+                messages=session.messages()
+
+            content, tool_calls=super().complete(messages, self.tools, Formats.STRING)
+            if not tool_calls:
+                self.answer=content
+                if session is not None:
+                    session.add('assistant', content)
+                break
+        else:
+            self.logger.warning(f'Stopped after {self.max_tool_rounds} rounds of tool calls')
+
+        return self.state
 
-        # run functions 
-        self.call(response)
+    @staticmethod
+    def _to_tool_call_message(tool_call: ToolCall)->dict:
+        # the arguments of a tool call are sent back as a json string
+        return {'id': tool_call.id,
+                'type': tool_call.type or 'function',
+                'function': {'name': tool_call.function.name,
+                             'arguments': json.dumps(tool_call.function.arguments)}}
+
+    def _get_tool_result(self, entry: dict)->str:
+        if entry['status']!=StatusCode.SUCCESS.value:
+            return json.dumps({'status': entry['status']})
+
+        # the results stored behind a handle are read back, up to the length sent to the model
+        result=entry['result']
+        limit=self.max_tool_result_length
+        if isinstance(result, IteratorHandle):
+            items=[]
+            length=0
+            for item in result:
+                items.append(item)
+                length+=len(json.dumps(item, default=str))+2
+                if length>limit:
+                    break
+            result=items
+        elif isinstance(result, BlobHandle):
+            if result.kind=='pickle':
+                result=result.load()
+            else:
+                with result.view() as view:
+                    # at most 4 bytes per character in utf-8
+                    head=view[:4*limit].tobytes()
+                result=head.decode('utf-8', 'ignore') if result.kind=='str' else head.decode('latin-1')
+        return truncate(json.dumps(result, default=str), limit)
+
+    def _execute_stream(self, content: str, session: Session = None, journal_run: JournalRun = None):
+        messages=self._get_plan_messages(content, session)
+        chat_stream=super().chat(messages, self.tools, Formats.DICT, stream=True)
         
-        response=self.state
-        return response
+        parser=JSONArrayStreamParser()
+        actions=[]
+        # the actions are serialized as received, call replaces their arguments with the resolved values
+        serialized=[]
+        def iter_actions():
+            for delta in chat_stream:
+                for action in parser.feed(delta):
+                    action=to_plan(action)[0]
+                    serialized.append(json.dumps(action))
+                    self.logger.debug('Streamed action %s', Payload(action))
+                    if journal_run is not None:
+                        # each action is recorded as it is received
+                        journal_run.record_plan([action], None if actions else content)
+                    actions.append(action)
+                    yield action
+
+        # run the actions while the plan is generated
+        self.call(iter_actions(), journal_run=journal_run)
+        self.answer=None
+
+        if not actions and chat_stream.tool_calls:
+            # the tools are requested natively (paid models), the plan comes as tool calls
+            tool_calls=parse_tool_calls(chat_stream.tool_calls)
+            if tool_calls:
+                self._execute_tool_calls(messages, tool_calls, session, content, journal_run)
+                return
+
+        if not actions:
+            # the response is not an array of actions, parse it as a whole or request it again
+            try:
+                actions=to_plan(to_dict(chat_stream.content))
+            except ValueError:
+                self.logger.warning('Failed to parse the streamed plan, requesting it again')
+                actions=to_plan(super().chat(messages, self.tools, Formats.DICT))
+            serialized=[json.dumps(action) for action in actions]
+            if journal_run is not None:
+                journal_run.record_plan(actions, content)
+            self.call(actions, journal_run=journal_run)
+
+        if session is not None:
+            session.add('assistant', '['+', '.join(serialized)+']')
+
+    def execute_as_completed(self, 
+                             contents: Iterable[str], 
+                             max_concurrency: int = 8,
+                             return_exceptions: bool = False)->Iterator[Tuple[int, dict]]:
+        '''
+        Executes many contents concurrently, yielding (index, state) pairs as the executions complete.
+
+        Each execution gets its own state, the agent state is left untouched. At most max_concurrency 
+        executions are in flight at the same time, so the contents can be a lazy iterable.
+
+        Args:
+            contents (Iterable[str]): Contents to execute.
+            max_concurrency (int): Maximum number of executions running at the same time.
+            return_exceptions (bool): If True the exception of a failed execution is yielded in place of 
+                its state, otherwise it is raised.
+        '''
+        contents=enumerate(contents)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures={}
+            
+            def submit(count: int):
+                for index, content in islice(contents, count):
+                    futures[executor.submit(self._execute_isolated, content)]=index
+            
+            submit(max_concurrency)
+            while futures:
+                done, _=wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index=futures.pop(future)
+                    try:
+                        yield index, future.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        yield index, e
+                submit(max_concurrency-len(futures))
+
+    def execute_many(self, 
+                     contents: Iterable[str], 
+                     max_concurrency: int = 8,
+                     return_exceptions: bool = False)->List[dict]:
+        '''
+        Executes many contents concurrently and returns their states in the order of the contents.
+        See execute_as_completed.
+        '''
+        results={}
+        for index, state in self.execute_as_completed(contents, max_concurrency, return_exceptions):
+            results[index]=state
+        return [results[index] for index in range(len(results))]
+
+    def _execute_isolated(self, content: str)->dict:
+        return self.call(self.plan(content), state={})
+
+    async def aexecute(self, content: str)->dict:
+        '''
+        Async version of execute. The plan is requested without blocking the event loop and 
+        the tools are run in the default executor. Each execution has its own state, so that
+        several executions can run concurrently on the same agent.
+        '''
+        with self.instrumentation.span('agent.aexecute'):
+            # make prompt 
+            prompt=self.get_prompt(content)
+            
+            # request sequence of tool actions 
+            messages=[Message('system', self.purpose), 
+                      Message('user', prompt)]
+            response=await super().achat(messages, self.tools, Formats.DICT)
+            self.logger.debug('Response: %s', Payload(response))
+            response=to_plan(response)
+
+            # run functions, in a copy of the context so that their spans belong to the execution
+            loop=asyncio.get_running_loop()
+            state=await loop.run_in_executor(None, contextvars.copy_context().run, 
+                                             partial(self.call, response, state={}))
+        return state
 
 class OpenRouterAgent(BaseAgent, OpenRouterChatbot):
     def __init__(self,
                  purpose: str,
                  api_key: str=None,
                  model: str = BASE_MODEL,
-                 verbose: int = logging.INFO):  
-        OpenRouterChatbot.__init__(self, model, api_key, verbose)
+                 verbose: int = logging.INFO,
+                 **kwargs):  
+        # kwargs are forwarded to OpenRouterChatbot (e.g. session, async_client, catalog)
+        OpenRouterChatbot.__init__(self, model, api_key, verbose, **kwargs)
         BaseAgent.__init__(self, purpose, verbose)
 
 
@@ -0,0 +1,221 @@
+import os
+import sys
+import mmap
+import pickle
+import shutil
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager
+from itertools import count, islice
+from typing import Any, Iterable, Iterator, Union
+
+# number of items of a container sampled to estimate its size
+_SAMPLE=16
+
+class BlobHandle:
+    '''
+    Lightweight handle of a result spilled to disk by a BlobStore.
+
+    The value is read back through a memory map: view gives a zero-copy memoryview of the bytes and
+    load rebuilds the value. The file is deleted when the handle is garbage collected.
+    '''
+    __slots__=('path', 'size', 'kind', 'type_name', '_finalizer', '__weakref__')
+
+    def __init__(self, path: str, size: int, kind: str, type_name: str):
+        self.path=path
+        self.size=size
+        # 'bytes', 'str' or 'pickle'
+        self.kind=kind
+        self.type_name=type_name
+        self._finalizer=weakref.finalize(self, _remove, path)
+
+    @contextmanager
+    def view(self)->Iterator[memoryview]:
+        '''
+        Context manager yielding a read-only memoryview of the stored bytes (pickled for objects).
+        '''
+        if self.size==0:
+            yield memoryview(b'')
+            return
+        with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view=memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+    def load(self)->Any:
+        '''
+        Returns the value stored.
+        '''
+        with self.view() as view:
+            if self.kind=='bytes':
+                return view.tobytes()
+            if self.kind=='str':
+                return str(view, 'utf-8')
+            return pickle.loads(view)
+
+    def delete(self):
+        self._finalizer()
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'BlobHandle(type={self.type_name}, size={self.size}, path={self.path!r})'
+
+class IteratorHandle:
+    '''
+    Handle of the iterator returned by a tool, consumed lazily by the actions depending on it.
+
+    The items are pulled from the iterator only when a consumer asks for them and are spilled to
+    disk, so that several consumers can iterate over them independently while only the items being
+    processed are held in memory.
+    '''
+    def __init__(self, iterator: Iterable, path: str):
+        self.path=path
+        self._source=iter(iterator)
+        self._lock=threading.Lock()
+        self._file=open(path, 'wb')
+        self._count=0
+        self._done=False
+        self._finalizer=weakref.finalize(self, _close_remove, self._file, path)
+
+    @property
+    def count(self)->int:
+        '''
+        Number of items pulled from the iterator so far.
+        '''
+        return self._count
+
+    def __iter__(self)->Iterator[Any]:
+        index=0
+        with open(self.path, 'rb') as reader:
+            while True:
+                with self._lock:
+                    if index>=self._count:
+                        if self._done:
+                            return
+                        try:
+                            item=next(self._source)
+                        except StopIteration:
+                            self._done=True
+                            return
+                        pickle.dump(item, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+                        self._file.flush()
+                        self._count+=1
+                        del item
+                # every consumer reads the items from the spill file at its own position
+                yield pickle.load(reader)
+                index+=1
+
+    def head(self, n: int = 5)->list:
+        return list(islice(iter(self), n))
+
+    def __repr__(self):
+        return f'IteratorHandle(items={self._count}, done={self._done})'
+
+class BlobStore:
+    '''
+    Spill-to-disk store of the large results of the tools.
+
+    Args:
+        directory (str): Directory of the blobs, a temporary directory removed with the store by default.
+        threshold (int): Estimated size in bytes above which a result is spilled to disk.
+    '''
+    def __init__(self,
+                 directory: str = None,
+                 threshold: int = 8*1024*1024):
+        self.threshold=threshold
+        self.directory=directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._ids=count()
+        self._lock=threading.Lock()
+        self._finalizer=None
+
+    def should_spill(self, value: Any)->bool:
+        return estimate_size(value)>self.threshold
+
+    def put(self, value: Any)->BlobHandle:
+        '''
+        Writes the value to disk and returns its handle. Bytes and strings are written as they are,
+        the other objects are pickled.
+        '''
+        path=self._new_path('blob')
+        with open(path, 'wb') as file:
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                kind='bytes'
+                file.write(value)
+            elif isinstance(value, str):
+                kind='str'
+                file.write(value.encode('utf-8'))
+            else:
+                kind='pickle'
+                # pickled directly to the file, without an intermediate copy in memory
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            size=file.tell()
+        return BlobHandle(path, size, kind, type(value).__name__)
+
+    def wrap_iterator(self, iterator: Iterable)->IteratorHandle:
+        return IteratorHandle(iterator, self._new_path('iter'))
+
+    def close(self):
+        '''
+        Removes the temporary directory of the store.
+        '''
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def _new_path(self, prefix: str)->str:
+        with self._lock:
+            if self.directory is None:
+                self.directory=tempfile.mkdtemp(prefix='agent-blobs-')
+                self._finalizer=weakref.finalize(self, shutil.rmtree, self.directory, True)
+            return os.path.join(self.directory, f'{prefix}-{os.getpid()}-{id(self):x}-{next(self._ids)}')
+
+def estimate_size(value: Any, depth: int = 3)->int:
+    '''
+    Rough size in bytes of a value, the items of the containers are sampled.
+    '''
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    nbytes=getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    memory_usage=getattr(value, 'memory_usage', None)
+    if callable(memory_usage):
+        # pandas DataFrame
+        try:
+            return int(memory_usage(deep=False).sum())
+        except Exception:
+            pass
+    size=sys.getsizeof(value, 0)
+    if depth==0 or not isinstance(value, (list, tuple, set, dict)) or not value:
+        return size
+    items=value.items() if isinstance(value, dict) else value
+    sample=list(islice(items, _SAMPLE))
+    sampled=sum(estimate_size(item, depth-1) for item in sample)
+    return size+sampled*len(value)//len(sample)
+
+def materialize(value: Union[BlobHandle, IteratorHandle, Any])->Any:
+    '''
+    Returns the value of a handle as seen by the actions referencing it: the loaded value of a blob,
+    a new lazy iterator of an iterator handle, the value itself otherwise.
+    '''
+    if isinstance(value, BlobHandle):
+        return value.load()
+    if isinstance(value, IteratorHandle):
+        return iter(value)
+    return value
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _close_remove(file, path: str):
+    file.close()
+    _remove(path)
@@ -0,0 +1,170 @@
+import json
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import time
+from typing import Any, Callable, Hashable
+
+# returned by the caches on a miss, as None can be a cached value
+MISS=object()
+
+class BaseCache(ABC):
+    '''
+    Base class of the cache backends, keeping the hit and miss counters.
+
+    Args:
+        max_entries (int): Maximum number of entries, the least recently used ones are evicted first.
+        ttl (float): Time to live of an entry in seconds, None for no expiration.
+    '''
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl: float = None):
+        self.max_entries=max_entries
+        self.ttl=ttl
+        self.hits=0
+        self.misses=0
+        self._lock=threading.Lock()
+
+    def get(self, key: Hashable)->Any:
+        '''
+        Returns the cached value or MISS.
+        '''
+        value=self._get(key)
+        with self._lock:
+            if value is MISS:
+                self.misses+=1
+            else:
+                self.hits+=1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._set(key, value)
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def stats(self)->dict:
+        total=self.hits+self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits/total if total else 0.0}
+
+    def _expires(self)->float:
+        return None if self.ttl is None else time()+self.ttl
+
+    @abstractmethod
+    def _get(self, key: Hashable)->Any:
+        pass
+
+    @abstractmethod
+    def _set(self, key: Hashable, value: Any):
+        pass
+
+class MemoryCache(BaseCache):
+    '''
+    In-memory LRU cache with optional TTL.
+    '''
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl: float = None):
+        super().__init__(max_entries, ttl)
+        self._entries: OrderedDict=OrderedDict()
+
+    def _get(self, key: Hashable)->Any:
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                return MISS
+            value, expires=entry
+            if expires is not None and expires<=time():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key]=(value, self._expires())
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache(BaseCache):
+    '''
+    On-disk LRU cache with optional TTL stored in a SQLite database, values are pickled.
+    The same file can be shared by several processes.
+
+    Args:
+        path (str): Path of the SQLite database.
+    '''
+    def __init__(self,
+                 path: str,
+                 max_entries: int = 1024,
+                 ttl: float = None):
+        super().__init__(max_entries, ttl)
+        self.path=path
+        self._connection=sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS cache ('
+                                     'key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)')
+
+    def _get(self, key: Hashable)->Any:
+        key=str(key)
+        with self._lock, self._connection:
+            row=self._connection.execute('SELECT value, expires FROM cache WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return MISS
+            value, expires=row
+            if expires is not None and expires<=time():
+                self._connection.execute('DELETE FROM cache WHERE key=?', (key,))
+                return MISS
+            self._connection.execute('UPDATE cache SET accessed=? WHERE key=?', (time(), key))
+        return pickle.loads(value)
+
+    def _set(self, key: Hashable, value: Any):
+        value=pickle.dumps(value)
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                                     (str(key), value, self._expires(), time()))
+            self._connection.execute('DELETE FROM cache WHERE key IN ('
+                                     'SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                                     (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+def make_key(*parts: Any)->str:
+    '''
+    Returns a canonical key of json serializable parts (dictionaries keys are sorted).
+    '''
+    return json.dumps(parts, sort_keys=True, separators=(',', ':'), default=repr)
+
+def round_floats(ndigits: int)->Callable[[Any], Any]:
+    '''
+    Returns a key normalizer rounding the floats of the arguments (e.g. coordinates) to ndigits.
+    '''
+    def normalize(value: Any)->Any:
+        if isinstance(value, float):
+            return round(value, ndigits)
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        return value
+    return normalize
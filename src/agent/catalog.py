@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+from time import time
+from typing import Callable, Dict, List
+
+CATALOG_TTL=float(os.getenv('OPENROUTER_CATALOG_TTL', 3600))
+
+class ModelCatalog:
+    '''
+    Process-wide cache of a provider model catalog.
+
+    The catalog is fetched at most once per ``ttl`` seconds and shared between all the chatbots
+    using it. An id -> metadata index is kept alongside the raw list so that model lookups are
+    constant time. If ``cache_path`` is provided the catalog is also persisted on disk, so that
+    new processes start warm.
+
+    Args:
+        ttl (float): Time to live of the cached catalog in seconds.
+        cache_path (str): Optional path of a JSON file used to persist the catalog.
+    '''
+    def __init__(self,
+                 ttl: float = CATALOG_TTL,
+                 cache_path: str = None):
+        self.ttl=ttl
+        self.cache_path=cache_path
+        self._lock=threading.Lock()
+        self._models: List[dict]=None
+        self._index: Dict[str, dict]=None
+        self._timestamp: float=0.0
+
+    @property
+    def is_fresh(self)->bool:
+        return self._models is not None and (time()-self._timestamp)<self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._models=None
+            self._index=None
+            self._timestamp=0.0
+
+    def get_models(self, fetch: Callable[[], List[dict]])->List[dict]:
+        '''
+        Returns the list of models of the catalog, calling ``fetch`` only if the cache is stale.
+        '''
+        if self.is_fresh:
+            return self._models
+
+        with self._lock:
+            # another thread may have refreshed the catalog while waiting for the lock
+            if self.is_fresh:
+                return self._models
+
+            if not self._load():
+                self._set(fetch(), time())
+                self._save()
+        return self._models
+
+    def get_index(self, fetch: Callable[[], List[dict]])->Dict[str, dict]:
+        '''
+        Returns a dictionary mapping each model id to its metadata.
+        '''
+        self.get_models(fetch)
+        return self._index
+
+    def _set(self, models: List[dict], timestamp: float):
+        self._index={model['id']: model for model in models}
+        self._models=models
+        self._timestamp=timestamp
+
+    def _load(self)->bool:
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r') as file:
+                cache=json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        if (time()-cache['timestamp'])>=self.ttl:
+            return False
+        self._set(cache['data'], cache['timestamp'])
+        return True
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        # write to a temporary file first so that concurrent readers never see a partial catalog
+        tmp_path=f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'timestamp': self._timestamp, 'data': self._models}, file)
+        os.replace(tmp_path, self.cache_path)
+
+# catalog shared by all the chatbots of the process using the OpenRouter endpoint
+CATALOG=ModelCatalog(cache_path=os.getenv('OPENROUTER_CATALOG_CACHE'))
+
+# catalogs of the other endpoints (e.g. self-hosted OpenAI-compatible servers), one per base url
+_catalogs: Dict[str, ModelCatalog]={}
+_catalogs_lock=threading.Lock()
+
+def get_catalog(base_url: str)->ModelCatalog:
+    '''
+    Returns the catalog shared by all the chatbots of the process using the endpoint base_url.
+    '''
+    base_url=base_url.rstrip('/')
+    with _catalogs_lock:
+        if base_url not in _catalogs:
+            _catalogs[base_url]=ModelCatalog()
+        return _catalogs[base_url]
@@ -1,17 +1,28 @@
 import os 
+import asyncio
 import requests
-from typing import Tuple, List, Union
+from typing import Tuple, List, Optional, Union
 from time import sleep
 import logging
 from abc import ABC, abstractmethod
-import pandas as pd
 import json
+import hashlib
 from enum import Enum
 
-from .models import Message, Tool
-from .utils import to_json, to_dict
+from .models import Message, Tool, ToolSet, ToolCall
+from .utils import to_json, to_dict, flatten_dict, to_dataframe, parse_tool_calls
+from .catalog import ModelCatalog, CATALOG, get_catalog
+from .transport import AsyncHTTPClient, HTTPSession
+from .streaming import ChatStream, AsyncChatStream
+from .cache import BaseCache, MISS, make_key
+from .retry import FAIL_FAST, RetryError, RetryPolicy, RetryState, parse_retry_after
+from .ratelimit import RateLimiter
+from .conversation import estimate_tokens
+from .instrumentation import Instrumentation
+from .logs import get_logger, Payload
 
 BASE_MODEL="deepseek/deepseek-chat:free"
+BASE_URL=os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
 
 class Formats(Enum):
     STRING='string'
@@ -19,28 +30,24 @@ class Formats(Enum):
     DICT='dict'
 
 class BaseChatbot(ABC):
+    # async client of the subclasses not calling __init__, created on first use
+    async_client: AsyncHTTPClient=None
+
     def __init__(self, 
-                 verbose=logging.INFO):
-        # setup logger
-        self.logger = logging.getLogger(self.__class__.__name__)  # Get a logger unique to the class
-        self.logger.setLevel(verbose)  # Set the logging level
-        
-        # Check if handlers are already added (to prevent duplicate logs)
-        if not self.logger.handlers:
-            formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-
-            # Console handler (logs to terminal)
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-
-            # Optional: File logging (uncomment if needed)
-            # file_handler = logging.FileHandler(f"{self.__class__.__name__}.log")
-            # file_handler.setFormatter(formatter)
-            # self.logger.addHandler(file_handler)
-
-            # Prevent logs from propagating to the root logger
-            self.logger.propagate = False
+                 verbose=logging.INFO,
+                 session: HTTPSession=None,
+                 async_client: AsyncHTTPClient=None,
+                 instrumentation: Instrumentation=None):
+        # setup logger, shared background handler (see logs.py)
+        self.logger=get_logger(self.__class__.__name__, verbose)
+
+        # pooled clients, pass the same instances to share the connections between chatbots
+        self.session=HTTPSession() if session is None else session
+        # the async client is created on first use
+        self.async_client=async_client
+
+        # spans and token usage, collected in memory by default
+        self.instrumentation=Instrumentation() if instrumentation is None else instrumentation
     
     @abstractmethod
     def chat(self, 
@@ -50,30 +57,126 @@ class BaseChatbot(ABC):
              stream: bool = False):
         pass 
 
-    def _make_get_request(self, url: Union[str, bytes], *args, **kwargs)->Tuple[str, int]:
-        response=requests.get(url, *args, **kwargs)
+    async def achat(self, 
+                    messages: List[Message],
+                    tools: List[Tool]=None,
+                    format: Formats=Formats.STRING,
+                    stream: bool = False,
+                    **kwargs):
+        '''
+        Async version of chat. By default the blocking chat is run in the default executor, 
+        chatbots with a native async implementation override it.
+        '''
+        loop=asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.chat(messages, tools, format, stream, **kwargs))
+
+    def complete(self,
+                 messages: List[Message],
+                 tools: List[Tool]=None,
+                 format: Formats=Formats.STRING,
+                 **kwargs)->Tuple[Union[str, dict], List[ToolCall]]:
+        '''
+        Returns the content and the tool calls of the response. By default chat is used and no tool
+        calls are returned, chatbots supporting native tool calls override it.
+        '''
+        return self.chat(messages, tools, format, **kwargs), []
+
+    def _make_get_request(self, url: Union[str, bytes], *args, **kwargs)->Tuple[requests.Response, int]:
+        response=self.session.get(url, *args, **kwargs)
         
         if response.status_code == 200:
-            self.logger.debug(f"Success calling {url} with {kwargs}")
+            self.logger.debug("Success calling %s with %s", url, Payload(kwargs))
         else:
-            self.logger.error("Error:", response.status_code, response.text)
+            self.logger.error("Error: %s %s", response.status_code, Payload(response.text))
 
         return response, response.status_code
     
-    def _make_post_request(self, url: Union[str, bytes], *args, **kwargs)->Tuple[str, int]:
-        response=requests.post(url, *args, **kwargs)
+    def _make_post_request(self, url: Union[str, bytes], *args, **kwargs)->Tuple[requests.Response, int]:
+        with self.instrumentation.span('http.request', url=url) as span:
+            response=self.session.post(url, *args, **kwargs)
+            span.set_attribute('status_code', response.status_code)
         if response.status_code == 200:
-            self.logger.debug(f"Success calling {url} with {kwargs}")
+            self.logger.debug("Success calling %s with %s", url, Payload(kwargs))
         else:
-            self.logger.error("Error:", response.status_code, response.text)
+            self.logger.error("Error: %s %s", response.status_code, Payload(response.text))
         return response, response.status_code
 
+    async def _amake_post_request(self, url: Union[str, bytes], *args, **kwargs)->Tuple[dict, int, dict]:
+        with self.instrumentation.span('http.request', url=url) as span:
+            json_response, status_code, headers=await self._get_async_client().request('POST', url, *args, **kwargs)
+            span.set_attribute('status_code', status_code)
+        if status_code == 200:
+            self.logger.debug("Success calling %s with %s", url, Payload(kwargs))
+        else:
+            self.logger.error("Error: %s %s", status_code, Payload(json_response))
+        return json_response, status_code, headers
+
+    def get_metrics(self)->dict:
+        '''
+        Returns the p50/p95 durations per phase and per tool and the token usage collected by the
+        MetricsCollector of the instrumentation.
+        '''
+        collector=self.instrumentation.collector
+        return {} if collector is None else collector.summary()
+
+    def _sleep(self, delay: float):
+        with self.instrumentation.span('retry.sleep', delay=delay):
+            sleep(delay)
+
+    async def _asleep(self, delay: float):
+        with self.instrumentation.span('retry.sleep', delay=delay):
+            await asyncio.sleep(delay)
+
+    def close(self):
+        '''
+        Closes the connections of the sync session.
+        '''
+        self.session.close()
+
+    def _get_async_client(self)->AsyncHTTPClient:
+        if self.async_client is None:
+            self.async_client=AsyncHTTPClient()
+        return self.async_client
+
+    async def aclose(self):
+        '''
+        Closes the connections of the async client.
+        '''
+        if self.async_client is not None:
+            await self.async_client.close()
+
 class OpenRouterChatbot(BaseChatbot):
     def __init__(self, 
                  model:str = BASE_MODEL, 
                  api_key: str = None,
-                 verbose: int = logging.INFO):
-        super().__init__(verbose)
+                 verbose: int = logging.INFO,
+                 catalog: ModelCatalog = None,
+                 base_url: str = BASE_URL,
+                 session: HTTPSession = None,
+                 async_client: AsyncHTTPClient = None,
+                 response_cache: BaseCache = None,
+                 retry_policy: RetryPolicy = None,
+                 instrumentation: Instrumentation = None,
+                 rate_limiter: RateLimiter = None,
+                 priority: int = 0):
+        super().__init__(verbose, session, async_client, instrumentation)
+
+        # optional client-side rate limiter shared by the chatbots using the same quotas, the
+        # requests of a lower priority value are sent first
+        self.rate_limiter=rate_limiter
+        self.priority=priority
+
+        # bounded retries of rate limits, server errors and responses not satisfying the format
+        self.retry_policy=RetryPolicy() if retry_policy is None else retry_policy
+
+        self.base_url=base_url
+        # optional cache of the responses (e.g. MemoryCache or SQLiteCache) keyed on the request payload
+        self.response_cache=response_cache
+
+        # model catalog shared by all the chatbots of the process using the same endpoint unless provided
+        if catalog is None:
+            catalog=CATALOG if base_url.rstrip('/')==BASE_URL.rstrip('/') else get_catalog(base_url)
+        self.catalog=catalog
 
         if api_key is None:
             self.api_key=os.getenv('OPENROUTER_API_KEY')
@@ -82,9 +185,10 @@ class OpenRouterChatbot(BaseChatbot):
         
         if self.api_key is None:
             raise ValueError('Provide OPENROUTER_API_KEY')
+        # the budgets of the rate limiter are identified by a digest of the key
+        self._rate_limit_key=hashlib.sha256(self.api_key.encode()).hexdigest()[:16]
         
         self.model=model
-        self.is_model_free=self.model in self.get_free_model_list()
 
     @property
     def model(self):
@@ -92,37 +196,49 @@ class OpenRouterChatbot(BaseChatbot):
 
     @model.setter
     def model(self, value):
-        model_id_list=self.get_model_list()
-        if value not in model_id_list:
-            model_list_str=[f"{model_id}\n" for model_id in model_id_list]
+        model_index=self._get_model_index()
+        if value not in model_index:
+            model_list_str=[f"{model_id}\n" for model_id in sorted(model_index)]
             raise ValueError(f'The selected model should be in\n{model_list_str}')
         else:
             self._model=value
+            self.is_model_free=self._is_free(model_index[value])
             self.logger.info(f'Using the model {self._model}') 
 
-    def get_model_info(self)->pd.DataFrame:
-        url = "https://openrouter.ai/api/v1/models"
-        response, status_code =self._make_get_request(url=url)
-        return pd.json_normalize(response.json()['data'], sep='_')
+    def _fetch_model_catalog(self)->List[dict]:
+        response, status_code =self._make_get_request(url=f'{self.base_url}/models')
+        return response.json()['data']
+
+    def _get_model_index(self)->dict:
+        return self.catalog.get_index(self._fetch_model_catalog)
+
+    @staticmethod
+    def _is_free(model: dict)->bool:
+        return float(model.get('pricing', {}).get('prompt', 1))==0
+
+    def get_model_info(self, as_dataframe: bool = False)->Union[List[dict], 'pd.DataFrame']:
+        '''
+        Returns the catalog of models with the nested fields flattened (e.g. pricing_prompt), 
+        as a pandas DataFrame if as_dataframe is True (requires pandas).
+        '''
+        model_info=[flatten_dict(model) for model in self.catalog.get_models(self._fetch_model_catalog)]
+        return to_dataframe(model_info) if as_dataframe else model_info
     
     def get_model_list(self)->List[str]:
-        model_info=self.get_model_info()
-        model_id_list=model_info['id'].unique().tolist()
-        model_id_list.sort()
-        return model_id_list
+        return sorted(self._get_model_index())
     
-    def get_free_model_info(self)->pd.DataFrame:
-        model_info=self.get_model_info()
-        return model_info[model_info['pricing_prompt'].astype('float')==0]
+    def get_free_model_info(self, as_dataframe: bool = False)->Union[List[dict], 'pd.DataFrame']:
+        '''
+        Returns the catalog of free models, see get_model_info.
+        '''
+        model_info=[flatten_dict(model) for model in self.catalog.get_models(self._fetch_model_catalog) if self._is_free(model)]
+        return to_dataframe(model_info) if as_dataframe else model_info
     
     def get_free_model_list(self)->List[str]:
-        model_info=self.get_free_model_info()
-        model_id_list=model_info['id'].unique().tolist()
-        model_id_list.sort()
-        return model_id_list
+        return sorted(model_id for model_id, model in self._get_model_index().items() if self._is_free(model))
 
     @staticmethod
-    def add_tools(tools: list[Tool]=None):
+    def add_tools(tools: Union[list[Tool], ToolSet]=None):
         prompt='''Based on the tools provided in the **Tools Description**, provide as a response *only** containing
         a sequence of function calls structured as an array of objects with the following **json** format: 
         [{
@@ -135,14 +251,14 @@ class OpenRouterChatbot(BaseChatbot):
         }]\n If a function produces results that are required by the next function reference the result using the "$id" syntax where id is the unique identifier of the previous function call.'''
         
         prompt+="### Tools Description\n"
-        prompt+=json.dumps([tool.to_dict() for tool in tools], indent=2)
+        # the schemas of a ToolSet are serialized once
+        prompt+=tools.json if isinstance(tools, ToolSet) else json.dumps([tool.to_dict() for tool in tools], indent=2)
         return prompt
     
-    def chat(self, 
-             messages: List[Message],
-             tools: list[Tool]=None,
-             format: Formats=Formats.STRING,
-             stream: bool = False)->Union[str, dict]:       
+    def _build_request(self,
+                       messages: List[Message],
+                       tools: list[Tool]=None,
+                       stream: bool = False)->Tuple[str, dict, dict]:
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
@@ -151,17 +267,18 @@ class OpenRouterChatbot(BaseChatbot):
         # free models often don't support tools calling
         # Ref: https://openrouter.ai/docs/api-reference/overview
         if self.is_model_free:
-            # add tools to the prompt
-            if tools:
-                for message in messages:
-                    if message.role == 'user':
-                        message.content+=self.add_tools(tools)
-
             data = {
                 "model": self.model,
                 "messages": [message.to_dict() for message in messages],
                 "stream": stream
             }
+            
+            # add tools to the prompt (the messages are left untouched so that they can be reused)
+            if tools:
+                tools_prompt=self.add_tools(tools)
+                for message in data["messages"]:
+                    if message["role"] == 'user':
+                        message["content"]+=tools_prompt
         else:
             data = {
                 "model": self.model,
@@ -169,53 +286,270 @@ class OpenRouterChatbot(BaseChatbot):
                 "stream": stream
             }
             if tools: 
-                data["tools"]=[tool.to_dict() for tool in tools]
+                data["tools"]=list(tools.schemas) if isinstance(tools, ToolSet) else [tool.to_dict() for tool in tools]
 
-        self.logger.debug(json.dumps(data['messages']))
+        self.logger.debug("Messages: %s", Payload(data['messages'], as_json=True))
 
-        # if tools:
-        #     data['tools'] =[tool.to_dict() for tool in tools]
+        url=f'{self.base_url}/chat/completions'
+        return url, data, headers
 
-        url='https://openrouter.ai/api/v1/chat/completions'
-        
-        # loop till a response is generated or till the response doesn't satisfy the format
+    def _parse_response(self, json_response: dict, format: Formats)->Tuple[Union[str, dict], Union[str, list]]:
         content=''
         tool_calls=''
+
+        if 'error' in json_response:
+            raise ValueError(f'Error in querying LLM: {json_response["error"]["message"]}')
+        
+        if 'content' in json_response['choices'][0]['message'].keys():
+            content=json_response['choices'][0]['message']['content'] or ''
+        
+        if json_response['choices'][0]['message'].get('tool_calls'):
+            tool_calls=json_response['choices'][0]['message']['tool_calls']
+            # the content of a tool calls response is usually empty and doesn't follow the format
+            if content=='':
+                return content, tool_calls
+
+        # if format==format.STRING
+
+        if format==format.JSON:
+            try: 
+                content=to_json(content)
+            except Exception as e:
+                self.logger.warning(f'Failed to convert content to json format\n{e}')
+                content=''
+        
+        if format==format.DICT:
+            try: 
+                content=to_dict(content)
+            except Exception as e:
+                self.logger.warning(f'Failed to convert content to dict format\n{e}')
+                content=''
+        
+        return content, tool_calls
+
+    def _get_retry_delay(self, retry: RetryState, error, status_code: int = None, retry_after: str = None)->float:
+        delay=retry.next_delay(error, status_code, retry_after)
+        self.logger.warning(f'Attempt {retry.attempts} failed ({error}), retrying in {delay:.2f}s')
+        return delay
+
+    def _get_failure_delay(self, retry: RetryState, error, status_code: int = None, retry_after: str = None)->float:
+        # transport and HTTP failures, raised at once when a pool fails over to another backend
+        if FAIL_FAST.get():
+            raise RetryError(f'Request failed: {error}', retry.attempts+1, error, status_code)
+        return self._get_retry_delay(retry, error, status_code, retry_after)
+
+    def _process_response(self, 
+                          retry: RetryState, 
+                          status_code: int, 
+                          json_response: Optional[dict], 
+                          retry_after: Optional[str],
+                          format: Formats,
+                          cache_key: str)->Tuple[Union[str, dict], Union[str, list], Optional[float]]:
+        '''
+        Returns the content and the tool calls of a response, with the delay before the next attempt 
+        if the response has to be retried (None otherwise).
+
+        Raises:
+            ValueError: If the provider returns a non retryable error.
+            RetryError: If the retry policy is exhausted.
+        '''
+        if self.retry_policy.is_retryable(status_code, json_response):
+            error=f'HTTP {status_code}'
+            if isinstance(json_response, dict) and isinstance(json_response.get('error'), dict):
+                error=json_response['error'].get('message', error)
+                if status_code not in self.retry_policy.retry_statuses:
+                    # error reported in the body of a 200 response
+                    status_code=json_response['error'].get('code')
+            return '', '', self._get_failure_delay(retry, error, status_code, retry_after)
+        
+        if json_response is None:
+            raise ValueError(f'Error in querying LLM: invalid response with status {status_code}')
+
+        self.instrumentation.usage(json_response.get('usage'), model=self.model)
+        with self.instrumentation.span('parse', format=format.value):
+            content, tool_calls=self._parse_response(json_response, format)
+        if (content=='')&(tool_calls==''):
+            return content, tool_calls, self._get_retry_delay(retry, f'response not in {format.value} format')
+
+        self._set_cached_response(cache_key, json_response, content, tool_calls)
+        return content, tool_calls, None
+
+    def _acquire_rate_limit(self, data: dict)->int:
+        # waits for the budgets of the key and model, returns the estimated tokens of the request
+        if self.rate_limiter is None:
+            return 0
+        tokens=sum(estimate_tokens(str(message.get('content') or '')) for message in data['messages'])
+        with self.instrumentation.span('rate_limit.wait', model=self.model):
+            self.rate_limiter.acquire(self._rate_limit_key, self.model, tokens, client=id(self), priority=self.priority)
+        return tokens
+
+    async def _aacquire_rate_limit(self, data: dict)->int:
+        if self.rate_limiter is None:
+            return 0
+        tokens=sum(estimate_tokens(str(message.get('content') or '')) for message in data['messages'])
+        with self.instrumentation.span('rate_limit.wait', model=self.model):
+            await self.rate_limiter.aacquire(self._rate_limit_key, self.model, tokens, client=id(self), priority=self.priority)
+        return tokens
+
+    def _record_rate_limit(self, tokens: int, status_code: int, json_response: Optional[dict], retry_after: Optional[str]):
+        # rate limits hold the requests of all the clients of the budget, usages correct the tokens budget
+        if self.rate_limiter is None:
+            return
+        if status_code==429:
+            delay=parse_retry_after(retry_after)
+            self.rate_limiter.penalize(self._rate_limit_key, self.model, self.retry_policy.base_delay if delay is None else delay)
+        elif isinstance(json_response, dict) and isinstance(json_response.get('usage'), dict):
+            self.rate_limiter.record(self._rate_limit_key, self.model, tokens, json_response['usage'].get('total_tokens'))
+
+    def _get_cache_key(self, data: dict, format: Formats)->str:
+        if self.response_cache is None:
+            return None
+        return hashlib.sha256(make_key(data, format.value).encode()).hexdigest()
+
+    def _get_cached_response(self, cache_key: str, format: Formats)->Tuple[Union[str, dict], Union[str, list]]:
+        if cache_key is None:
+            return '', ''
+        json_response=self.response_cache.get(cache_key)
+        if json_response is MISS:
+            return '', ''
+        self.logger.debug('Response %s served from cache', cache_key)
+        # the response is parsed again so that the caller never gets a reference to the cached objects
+        return self._parse_response(json_response, format)
+
+    def _set_cached_response(self, cache_key: str, json_response: dict, content, tool_calls):
+        # only the responses satisfying the format are cached
+        if cache_key is not None and ((content!='') or (tool_calls!='')):
+            self.response_cache.set(cache_key, json_response)
+
+    def complete(self, 
+                 messages: List[Message],
+                 tools: list[Tool]=None,
+                 format: Formats=Formats.STRING,
+                 use_cache: bool = True)->Tuple[Union[str, dict], List[ToolCall]]:
+        '''
+        Queries the model and returns the content and the tool calls of the response. Paid models
+        request the tools natively through the tool calls, content is empty in that case.
+        '''
+        with self.instrumentation.span('llm.complete', model=self.model):
+            return self._complete(messages, tools, format, use_cache)
+
+    def _complete(self, 
+                  messages: List[Message],
+                  tools: list[Tool],
+                  format: Formats,
+                  use_cache: bool)->Tuple[Union[str, dict], List[ToolCall]]:
+        url, data, headers=self._build_request(messages, tools, False)
+        cache_key=self._get_cache_key(data, format) if use_cache else None
+        content, tool_calls=self._get_cached_response(cache_key, format)
+
+        # retry till a response satisfying the format is generated or the retry policy is exhausted
+        retry=self.retry_policy.start()
         while (content=='')&(tool_calls==''):
-            response, status_code= self._make_post_request(url=url, 
-                                                           json=data, 
-                                                           headers=headers)
-            json_response=response.json()
-            
-            if 'error' in json_response:
-                content=None
-                raise ValueError(f'Error in querying LLM: {json_response["error"]["message"]}')
-            
-            if 'content' in json_response['choices'][0]['message'].keys():
-                content=json_response['choices'][0]['message']['content']
-            
-            if 'tool_calls' in json_response['choices'][0]['message'].keys():
-                tool_calls=json_response['choices'][0]['message']['tool_calls']
+            tokens=self._acquire_rate_limit(data)
+            try:
+                response, status_code= self._make_post_request(url=url, 
+                                                               json=data, 
+                                                               headers=headers)
+            except self.retry_policy.retry_exceptions as e:
+                self._sleep(self._get_failure_delay(retry, e))
+                continue
 
-            # if format==format.STRING
+            try:
+                with self.instrumentation.span('decode'):
+                    json_response=response.json()
+            except ValueError:
+                json_response=None
+            self._record_rate_limit(tokens, status_code, json_response, response.headers.get('Retry-After'))
+            content, tool_calls, delay=self._process_response(retry, 
+                                                              status_code, 
+                                                              json_response, 
+                                                              response.headers.get('Retry-After'), 
+                                                              format, 
+                                                              cache_key)
+            if delay is not None:
+                self._sleep(delay)
 
-            if format==format.JSON:
-                try: 
-                    content=to_json(content)
-                except Exception as e:
-                    self.logger.warning(f'Failed to convert content to json format\n{e}')
-                    content=''
-            
-            if format==format.DICT:
-                try: 
-                    content=to_dict(content)
-                except Exception as e:
-                    self.logger.warning(f'Failed to convert content to dict format\n{e}')
-                    content=''
+        return content, parse_tool_calls(tool_calls) if tool_calls else []
 
-            if content=='':
-                sleep_time=5
-                self.logger.debug(f'Retrying in {sleep_time}s')
-                sleep(sleep_time)
+    def chat(self, 
+             messages: List[Message],
+             tools: list[Tool]=None,
+             format: Formats=Formats.STRING,
+             stream: bool = False,
+             use_cache: bool = True)->Union[str, dict, list, ChatStream]:       
+        '''
+        Queries the model. If stream is True a ChatStream yielding the content deltas is returned
+        instead of the content, format is ignored in that case. If a response cache is set, 
+        use_cache=False bypasses it. With the DICT format, the tool calls of a response without
+        content are returned as a list of actions.
+        '''
+        if stream:
+            url, data, headers=self._build_request(messages, tools, stream)
+            self._acquire_rate_limit(data)
+            response, status_code=self._make_post_request(url=url, 
+                                                          json=data, 
+                                                          headers=headers,
+                                                          stream=True)
+            if status_code != 200:
+                response.close()
+                raise ValueError(f'Error in querying LLM: {response.text}')
+            # chunk_size=None reads the data as it arrives instead of waiting for full chunks
+            return ChatStream(response.iter_lines(chunk_size=None), close=response.close)
+        
+        content, tool_calls=self.complete(messages, tools, format, use_cache)
+        return self._get_chat_result(content, tool_calls, format)
+
+    def _get_chat_result(self, content, tool_calls: List[ToolCall], format: Formats):
+        if format==Formats.DICT and content=='' and tool_calls:
+            return [tool_call.to_dict() for tool_call in tool_calls]
+        return content
+
+    async def achat(self, 
+                    messages: List[Message],
+                    tools: list[Tool]=None,
+                    format: Formats=Formats.STRING,
+                    stream: bool = False,
+                    use_cache: bool = True)->Union[str, dict, AsyncChatStream]:
+        '''
+        Async version of chat. If stream is True an AsyncChatStream yielding the content deltas is
+        returned instead of the content, format is ignored in that case. If a response cache is set, 
+        use_cache=False bypasses it.
+        '''
+        url, data, headers=self._build_request(messages, tools, stream)
+
+        if stream:
+            await self._aacquire_rate_limit(data)
+            lines=self._get_async_client().stream_lines('POST', url, json=data, headers=headers)
+            return AsyncChatStream(lines)
+
+        with self.instrumentation.span('llm.complete', model=self.model):
+            content, tool_calls=await self._acomplete(url, data, headers, format, use_cache)
+        return self._get_chat_result(content, tool_calls, format)
+
+    async def _acomplete(self, url: str, data: dict, headers: dict, format: Formats, use_cache: bool)->Tuple[Union[str, dict], List[ToolCall]]:
+        cache_key=self._get_cache_key(data, format) if use_cache else None
+        content, tool_calls=self._get_cached_response(cache_key, format)
+
+        # retry till a response satisfying the format is generated or the retry policy is exhausted
+        retry=self.retry_policy.start()
+        while (content=='')&(tool_calls==''):
+            tokens=await self._aacquire_rate_limit(data)
+            try:
+                json_response, status_code, response_headers=await self._amake_post_request(url=url, 
+                                                                                            json=data, 
+                                                                                            headers=headers)
+            except self.retry_policy.retry_exceptions as e:
+                await self._asleep(self._get_failure_delay(retry, e))
+                continue
+
+            self._record_rate_limit(tokens, status_code, json_response, response_headers.get('Retry-After'))
+            content, tool_calls, delay=self._process_response(retry, 
+                                                              status_code, 
+                                                              json_response, 
+                                                              response_headers.get('Retry-After'), 
+                                                              format, 
+                                                              cache_key)
+            if delay is not None:
+                await self._asleep(delay)
 
-        return content #TODO add tool_calls
+        return content, parse_tool_calls(tool_calls) if tool_calls else []
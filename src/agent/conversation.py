@@ -0,0 +1,113 @@
+from typing import Callable, List
+
+from .models import Message
+
+def estimate_tokens(content: str)->int:
+    '''
+    Rough estimate of the number of tokens of a message (about 4 characters per token plus the
+    overhead of the message), used when no tokenizer is provided.
+    '''
+    return len(content)//4+4
+
+class Session:
+    '''
+    Multi-turn conversation with an append-only history and a token-budgeted context window.
+
+    The number of tokens of each message is computed once when it is appended, and the window of
+    messages sent to the model is maintained incrementally: when the budget is exceeded the oldest
+    messages leave the window (the system message is always kept), an assistant message requesting
+    tool calls together with the results of the calls. If a summarizer is provided the messages
+    leaving the window are folded into a summary sent after the system message.
+
+    Args:
+        system (str): Optional system message.
+        max_tokens (int): Token budget of the context window, None for no limit.
+        count_tokens (Callable): Function returning the number of tokens of a content.
+        summarize (Callable): Optional function (summary, messages) -> summary folding the messages
+            leaving the window into the previous summary.
+    '''
+    def __init__(self,
+                 system: str = None,
+                 max_tokens: int = None,
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 summarize: Callable[[str, List[Message]], str] = None):
+        self.system=None if system is None else Message('system', system)
+        self.max_tokens=max_tokens
+        self.count_tokens=count_tokens
+        self.summarize=summarize
+
+        self.history: List[Message]=[]
+        self._tokens: List[int]=[]
+        # first message of the history in the window and tokens of the window
+        self._start=0
+        self._window_tokens=0
+        # messages which left the window and are not summarized yet
+        self._evicted=0
+        self.summary: str=None
+        self._summary_tokens=0
+        self._system_tokens=0 if system is None else count_tokens(system)
+
+    @property
+    def tokens(self)->int:
+        '''
+        Number of tokens of the messages sent to the model.
+        '''
+        return self._system_tokens+self._summary_tokens+self._window_tokens
+
+    def add(self, role: str, content: str)->Message:
+        message=Message(role, content)
+        self.append(message)
+        return message
+
+    def append(self, message: Message):
+        tokens=self.count_tokens(message.content)
+        self.history.append(message)
+        self._tokens.append(tokens)
+        self._window_tokens+=tokens
+        self._trim()
+
+    def messages(self)->List[Message]:
+        '''
+        Returns the messages to send to the model: the system message, the summary of the messages
+        which left the window (if any) and the messages of the window.
+        '''
+        # the summary can take more room in the window, the messages it evicts are summarized too
+        while self._evicted and self.summarize is not None:
+            evicted=self.history[self._start-self._evicted:self._start]
+            self.summary=self.summarize(self.summary, evicted)
+            self._summary_tokens=self.count_tokens(self.summary)
+            self._evicted=0
+            self._trim()
+
+        messages=[] if self.system is None else [self.system]
+        if self.summary:
+            messages.append(Message('system', f'Summary of the previous conversation:\n{self.summary}'))
+        messages.extend(self.history[self._start:])
+        return messages
+
+    def _trim(self):
+        if self.max_tokens is None:
+            return
+        while self.tokens>self.max_tokens:
+            end=self._get_unit_end(self._start)
+            # the last message is always kept
+            if end>=len(self.history):
+                break
+            self._window_tokens-=sum(self._tokens[self._start:end])
+            self._evicted+=end-self._start
+            self._start=end
+
+    def _get_unit_end(self, start: int)->int:
+        # an assistant message requesting tool calls leaves the window with the results of the calls,
+        # the model rejects tool messages without the assistant message requesting them
+        end=start+1
+        if self.history[start].tool_calls:
+            while end<len(self.history) and self.history[end].role=='tool':
+                end+=1
+        return end
+
+    def __len__(self):
+        return len(self.history)
+
+    def __repr__(self):
+        return f'Session(messages={len(self.history)}, window={len(self.history)-self._start}, tokens={self.tokens})'
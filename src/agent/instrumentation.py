@@ -0,0 +1,251 @@
+import json
+import random
+import threading
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from time import perf_counter, time_ns
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Union
+
+# span currently open in the context, parent of the spans opened in it
+_CURRENT_SPAN: ContextVar[Optional['Span']]=ContextVar('current_span', default=None)
+
+class Span:
+    '''
+    Timed phase of a request or of an execution (HTTP request, parsing, retry sleep, tool run...).
+
+    Spans are used as context managers and nest: a span opened inside another one is its child
+    and belongs to the same trace.
+    '''
+    __slots__=('name', 'attributes', 'trace_id', 'span_id', 'parent_id', 'start_time', 'end_time',
+               'duration', 'error', '_hooks', '_start', '_token')
+
+    def __init__(self, name: str, attributes: dict, hooks: List['InstrumentationHook']):
+        self.name=name
+        self.attributes=attributes
+        self.trace_id: str=None
+        self.span_id: str=None
+        self.parent_id: str=None
+        self.start_time: int=None
+        self.end_time: int=None
+        # duration in seconds
+        self.duration: float=None
+        self.error: str=None
+        self._hooks=hooks
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key]=value
+
+    def __enter__(self)->'Span':
+        parent=_CURRENT_SPAN.get()
+        if parent is None:
+            self.trace_id=f'{random.getrandbits(128):032x}'
+        else:
+            self.trace_id=parent.trace_id
+            self.parent_id=parent.span_id
+        self.span_id=f'{random.getrandbits(64):016x}'
+        self._token=_CURRENT_SPAN.set(self)
+        for hook in self._hooks:
+            hook.on_start(self)
+        self.start_time=time_ns()
+        self._start=perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration=perf_counter()-self._start
+        self.end_time=self.start_time+int(self.duration*1e9)
+        if exc_type is not None:
+            self.error=f'{exc_type.__name__}: {exc_value}'
+        _CURRENT_SPAN.reset(self._token)
+        for hook in self._hooks:
+            hook.on_end(self)
+        return False
+
+    def __repr__(self):
+        return f'Span(name={self.name!r}, duration={self.duration}, attributes={self.attributes!r})'
+
+class InstrumentationHook:
+    '''
+    Receives the spans and the token usage emitted by the chatbots and the agents.
+    '''
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+    def on_usage(self, usage: dict, attributes: dict):
+        pass
+
+class Instrumentation:
+    '''
+    Dispatches the spans and the token usage to a list of hooks.
+
+    Args:
+        hooks (Iterable[InstrumentationHook]): Hooks receiving the events, by default a MetricsCollector.
+            With no hooks the spans are not timed.
+    '''
+    def __init__(self, hooks: Iterable[InstrumentationHook] = None):
+        self.hooks: List[InstrumentationHook]=[MetricsCollector()] if hooks is None else list(hooks)
+
+    def add_hook(self, hook: InstrumentationHook):
+        self.hooks.append(hook)
+
+    @property
+    def collector(self)->Optional['MetricsCollector']:
+        '''
+        First MetricsCollector among the hooks, if any.
+        '''
+        return next((hook for hook in self.hooks if isinstance(hook, MetricsCollector)), None)
+
+    def span(self, name: str, **attributes)->Union[Span, '_NullSpan']:
+        if not self.hooks:
+            return _NULL_SPAN
+        return Span(name, attributes, self.hooks)
+
+    def usage(self, usage: dict, **attributes):
+        '''
+        Records the usage block of a response, also as attributes of the current span.
+        '''
+        if not self.hooks or not isinstance(usage, dict):
+            return
+        span=_CURRENT_SPAN.get()
+        if span is not None:
+            for key, value in usage.items():
+                if isinstance(value, (int, float)):
+                    span.set_attribute(f'llm.usage.{key}', value)
+        for hook in self.hooks:
+            hook.on_usage(usage, attributes)
+
+class _NullSpan:
+    # span of an instrumentation without hooks
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN=_NullSpan()
+
+class MetricsCollector(InstrumentationHook):
+    '''
+    In-memory collector of the durations per phase and per tool and of the token usage per model.
+
+    Args:
+        max_samples (int): Number of most recent durations kept per phase and per tool.
+    '''
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples=max_samples
+        self._lock=threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._phases: Dict[str, deque]=defaultdict(lambda: deque(maxlen=self.max_samples))
+            self._tools: Dict[str, deque]=defaultdict(lambda: deque(maxlen=self.max_samples))
+            self._errors: Dict[str, int]=defaultdict(int)
+            self._usage: Dict[str, Dict[str, int]]=defaultdict(lambda: defaultdict(int))
+
+    def on_end(self, span: Span):
+        with self._lock:
+            self._phases[span.name].append(span.duration)
+            tool=span.attributes.get('tool')
+            if tool is not None:
+                self._tools[tool].append(span.duration)
+            if span.error is not None:
+                self._errors[span.name]+=1
+
+    def on_usage(self, usage: dict, attributes: dict):
+        model=attributes.get('model', 'unknown')
+        with self._lock:
+            totals=self._usage[model]
+            totals['requests']+=1
+            for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+                value=usage.get(key)
+                if isinstance(value, (int, float)):
+                    totals[key]+=value
+
+    def summary(self)->dict:
+        '''
+        Returns the count, mean, p50, p95 and max duration (in seconds) of each phase and tool, the
+        number of errors per phase and the token usage per model.
+        '''
+        with self._lock:
+            return {'phases': {name: _stats(durations) for name, durations in self._phases.items()},
+                    'tools': {name: _stats(durations) for name, durations in self._tools.items()},
+                    'errors': dict(self._errors),
+                    'usage': {model: dict(totals) for model, totals in self._usage.items()}}
+
+def _stats(durations: Iterable[float])->dict:
+    values=sorted(durations)
+    count=len(values)
+    return {'count': count,
+            'mean': sum(values)/count,
+            'p50': _percentile(values, 50),
+            'p95': _percentile(values, 95),
+            'max': values[-1]}
+
+def _percentile(values: List[float], percent: float)->float:
+    # nearest rank percentile of sorted values
+    rank=max(int(-(-percent*len(values)//100)), 1)
+    return values[rank-1]
+
+class SpanExporter(InstrumentationHook):
+    '''
+    OpenTelemetry-style exporter writing the finished spans as JSON lines, in batches.
+
+    Each line follows the OTLP span layout (trace_id, span_id, parent_span_id, name, start and end
+    time in unix nanoseconds, attributes and status), so that it can be inspected locally or
+    forwarded to a collector.
+
+    Args:
+        output: Path of the file where the spans are appended, a text stream, or a function
+            receiving the list of span records of each batch.
+        batch_size (int): Number of spans buffered before being exported.
+    '''
+    def __init__(self,
+                 output: Union[str, TextIO, Callable[[List[dict]], None]],
+                 batch_size: int = 64):
+        self.output=output
+        self.batch_size=batch_size
+        self._buffer: List[dict]=[]
+        self._lock=threading.Lock()
+
+    def on_end(self, span: Span):
+        record={'trace_id': span.trace_id,
+                'span_id': span.span_id,
+                'parent_span_id': span.parent_id,
+                'name': span.name,
+                'start_time_unix_nano': span.start_time,
+                'end_time_unix_nano': span.end_time,
+                'attributes': dict(span.attributes),
+                'status': {'code': 'ERROR', 'message': span.error} if span.error is not None else {'code': 'OK'}}
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer)<self.batch_size:
+                return
+            batch, self._buffer=self._buffer, []
+        self._export(batch)
+
+    def flush(self):
+        '''
+        Exports the buffered spans.
+        '''
+        with self._lock:
+            batch, self._buffer=self._buffer, []
+        if batch:
+            self._export(batch)
+
+    def _export(self, batch: List[dict]):
+        if callable(self.output):
+            self.output(batch)
+            return
+        lines=''.join(json.dumps(record, default=str)+'\n' for record in batch)
+        if isinstance(self.output, str):
+            with open(self.output, 'a') as file:
+                file.write(lines)
+        else:
+            self.output.write(lines)
+            self.output.flush()
@@ -0,0 +1,159 @@
+import os
+import json
+import uuid
+import threading
+from time import time
+from typing import Dict, Iterator, List, Optional
+
+# statuses of the actions restored when a run is resumed, the other actions are run again
+RESTORED_STATUSES=('success',)
+
+class Journal:
+    '''
+    Append-only journal of the plans and of the action results of the agent runs, stored as JSON lines.
+
+    Each record is written and flushed as soon as a plan is received or an action completes, so that
+    a run interrupted by a crash can be resumed from its completed actions. A line truncated by a
+    crash is ignored when the journal is read.
+
+    Args:
+        path (str): Path of the journal file.
+        fsync (bool): If True each record is synced to disk, surviving a system crash.
+    '''
+    def __init__(self, path: str, fsync: bool = False):
+        self.path=path
+        self.fsync=fsync
+        self._lock=threading.Lock()
+        self._file=open(path, 'a', encoding='utf-8')
+        if not _ends_with_newline(path):
+            # terminate a record truncated by a crash, so that it doesn't corrupt the next one
+            self._file.write('\n')
+            self._file.flush()
+
+    def append(self, record: dict):
+        line=_dumps(record)+'\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def records(self, run_id: str = None)->Iterator[dict]:
+        '''
+        Yields the records of the journal, only those of run_id if provided.
+        '''
+        with self._lock:
+            self._file.flush()
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record=json.loads(line)
+                except ValueError:
+                    # incomplete record of an interrupted write
+                    continue
+                if run_id is None or record.get('run')==run_id:
+                    yield record
+
+    def runs(self)->List[str]:
+        '''
+        Returns the ids of the runs of the journal in order of creation.
+        '''
+        return list(dict.fromkeys(record['run'] for record in self.records() if 'run' in record))
+
+    def open_run(self, run_id: str = None)->'JournalRun':
+        '''
+        Returns the run with its recorded plans and results, a new run if run_id is None or unknown.
+        '''
+        run=JournalRun(self, run_id or uuid.uuid4().hex)
+        if run_id is not None:
+            for record in self.records(run_id):
+                run._load(record)
+        return run
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class JournalRun:
+    '''
+    Plans and action results of a run of the agent, recorded in a Journal.
+
+    Attributes:
+        run_id (str): Id of the run.
+        content (str): Content executed by the run.
+        actions (List[dict]): Actions of the recorded plans, in order.
+        results (Dict[str, dict]): Status and result of the completed actions.
+        finished (bool): True if the run completed.
+    '''
+    def __init__(self, journal: Journal, run_id: str):
+        self.journal=journal
+        self.run_id=run_id
+        self.content: Optional[str]=None
+        self.actions: List[dict]=[]
+        self.results: Dict[str, dict]={}
+        self.finished=False
+
+    def record_plan(self, actions: List[dict], content: str = None):
+        if content is not None:
+            self.content=content
+        self.actions.extend(json.loads(_dumps(actions)))
+        self.journal.append({'run': self.run_id, 'type': 'plan', 'time': time(), 'content': content, 'actions': actions})
+
+    def record(self, action_id: str, entry: dict):
+        record={'run': self.run_id, 'type': 'action', 'time': time(), 'id': action_id,
+                'status': entry['status'], 'result': entry['result']}
+        try:
+            json.dumps(entry['result'])
+        except (TypeError, ValueError):
+            # a result which can't be restored is recorded for inspection and run again on resume
+            record['result']=repr(entry['result'])
+            record['restorable']=False
+        self.results[action_id]={'status': record['status'], 'result': record['result'], 'restorable': record.get('restorable', True)}
+        self.journal.append(record)
+
+    def restore(self, action: dict, state: dict)->bool:
+        '''
+        Restores the result of a completed action in the state. Returns False if the action has to be run.
+        '''
+        result=self.results.get(action['id'])
+        if result is None or not result['restorable'] or result['status'] not in RESTORED_STATUSES:
+            return False
+        state[action['id']]['result']=result['result']
+        state[action['id']]['status']=result['status']
+        return True
+
+    def finish(self):
+        self.finished=True
+        self.journal.append({'run': self.run_id, 'type': 'end', 'time': time()})
+
+    def _load(self, record: dict):
+        if record.get('type')=='plan':
+            if record.get('content') is not None:
+                self.content=record['content']
+            self.actions.extend(record.get('actions') or [])
+        elif record.get('type')=='action':
+            self.results[record['id']]={'status': record['status'],
+                                        'result': record.get('result'),
+                                        'restorable': record.get('restorable', True)}
+        elif record.get('type')=='end':
+            self.finished=True
+
+    def __repr__(self):
+        return f'JournalRun(run_id={self.run_id!r}, actions={len(self.actions)}, completed={len(self.results)}, finished={self.finished})'
+
+def _ends_with_newline(path: str)->bool:
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell()==0:
+            return True
+        file.seek(-1, os.SEEK_END)
+        return file.read(1)==b'\n'
+
+def _dumps(value)->str:
+    return json.dumps(value, default=repr, separators=(',', ':'))
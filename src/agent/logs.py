@@ -0,0 +1,186 @@
+'''
+Logging layer shared by the chatbots and the agents.
+
+The loggers write to a bounded queue drained by a single background thread (QueueListener), so that a
+request thread never blocks on the console or on a file: when the queue is full the record is dropped
+and counted. The records are formatted by the background thread, and the expensive payloads
+(messages, request bodies, results) are passed as Payload arguments, serialized and truncated only if
+the record is emitted.
+'''
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, List, Optional
+
+FORMAT="%(asctime)s [%(levelname)s] %(message)s"
+
+# maximum length of a formatted payload
+MAX_LENGTH: int = 2000
+
+class Payload:
+    '''
+    Argument of a log record serialized lazily: as JSON (as_json=True) or with repr, truncated to
+    max_length characters. Nothing is computed if the record isn't emitted, the value is serialized
+    by the background thread and shouldn't be modified once logged.
+    '''
+    __slots__=('value', 'as_json', 'max_length')
+
+    def __init__(self, value: Any, as_json: bool = False, max_length: int = None):
+        self.value=value
+        self.as_json=as_json
+        self.max_length=max_length
+
+    def __str__(self)->str:
+        if self.as_json:
+            text=json.dumps(self.value, default=repr)
+        else:
+            text=self.value if isinstance(self.value, str) else repr(self.value)
+        return truncate(text, MAX_LENGTH if self.max_length is None else self.max_length)
+
+    __repr__=__str__
+
+def truncate(text: str, max_length: int = None)->str:
+    max_length=MAX_LENGTH if max_length is None else max_length
+    if max_length is None or len(text)<=max_length:
+        return text
+    return f'{text[:max_length]}... ({len(text)-max_length} more characters)'
+
+class SampleFilter(logging.Filter):
+    '''
+    Keeps one of every `every` records at or below level (DEBUG by default), the others pass.
+    '''
+    def __init__(self, every: int, level: int = logging.DEBUG):
+        super().__init__()
+        self.every=every
+        self.level=level
+        self._counter=count()
+
+    def filter(self, record: logging.LogRecord)->bool:
+        if record.levelno>self.level or self.every<=1:
+            return True
+        return next(self._counter)%self.every==0
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped=0
+
+    def prepare(self, record: logging.LogRecord)->logging.LogRecord:
+        # the message is formatted by the listener thread, only the traceback is rendered here
+        # since it refers to the frames of the request thread
+        if record.exc_info:
+            record.exc_text=logging.Formatter().formatException(record.exc_info)
+            record.exc_info=None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped+=1
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # waits for room in a full queue, the listener thread is draining it
+        self.queue.put(self._sentinel)
+
+class _LoggingLayer:
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.handler: Optional[_NonBlockingQueueHandler]=None
+        self.listener: Optional[_Listener]=None
+        self.sample_filter: Optional[SampleFilter]=None
+        self.handlers: List[logging.Handler]=[]
+
+_layer=_LoggingLayer()
+
+def configure_logging(handlers: List[logging.Handler] = None,
+                      queue_size: int = 10000,
+                      max_length: int = 2000,
+                      debug_sample: int = 1):
+    '''
+    (Re)configures the shared logging layer of the chatbots and the agents.
+
+    Args:
+        handlers (List[logging.Handler]): Handlers writing the records from the background thread,
+            a console handler by default.
+        queue_size (int): Maximum number of records waiting to be written, the next ones are dropped.
+        max_length (int): Maximum length of a formatted payload, None for no limit.
+        debug_sample (int): Keeps one of every debug_sample DEBUG records.
+    '''
+    global MAX_LENGTH
+    MAX_LENGTH=max_length
+    if handlers is None:
+        console_handler=logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(FORMAT))
+        handlers=[console_handler]
+
+    with _layer.lock:
+        if _layer.listener is not None:
+            _layer.listener.stop()
+        if _layer.handler is None:
+            _layer.handler=_NonBlockingQueueHandler(queue.Queue(queue_size))
+        else:
+            # the loggers keep their handler, only its queue is replaced
+            _layer.handler.queue=queue.Queue(queue_size)
+        if _layer.sample_filter is not None:
+            _layer.handler.removeFilter(_layer.sample_filter)
+        _layer.sample_filter=SampleFilter(debug_sample)
+        _layer.handler.addFilter(_layer.sample_filter)
+
+        _layer.handlers=handlers
+        _layer.listener=_Listener(_layer.handler.queue, *handlers, respect_handler_level=True)
+        _layer.listener.start()
+
+def get_logger(name: str, verbose: int = logging.INFO)->logging.Logger:
+    '''
+    Returns the logger of a class, writing through the shared background handler.
+    '''
+    if _layer.handler is None:
+        configure_logging()
+    logger=logging.getLogger(name)
+    logger.setLevel(verbose)
+    # Check if handlers are already added (to prevent duplicate logs)
+    if _layer.handler not in logger.handlers:
+        logger.addHandler(_layer.handler)
+        # Prevent logs from propagating to the root logger
+        logger.propagate=False
+    return logger
+
+def flush_logging():
+    '''
+    Writes the records waiting in the queue, e.g. before exiting.
+    '''
+    with _layer.lock:
+        if _layer.listener is not None:
+            _layer.listener.stop()
+            _layer.listener.start()
+
+def dropped_records()->int:
+    '''
+    Number of records dropped because the queue was full.
+    '''
+    return 0 if _layer.handler is None else _layer.handler.dropped
+
+def _stop():
+    with _layer.lock:
+        if _layer.listener is not None:
+            _layer.listener.stop()
+            _layer.listener=None
+
+def _after_fork():
+    # the listener thread doesn't survive a fork (e.g. the workers of agent.serve), start a new one
+    _layer.lock=threading.Lock()
+    if _layer.listener is not None:
+        _layer.handler.queue=queue.Queue(_layer.handler.queue.maxsize)
+        _layer.listener=_Listener(_layer.handler.queue, *_layer.handlers, respect_handler_level=True)
+        _layer.listener.start()
+
+atexit.register(_stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,15 +1,24 @@
-from typing import List, Dict, Union, Literal, Optional, Any
-from dataclasses import dataclass, asdict
+import json
+from typing import List, Dict, Union, Literal, Optional, Any, Iterable, Iterator
+from dataclasses import dataclass
 
 @dataclass
 class Message:
     role: str
     content: str
+    tool_calls: Optional[List[Dict]] = None
+    tool_call_id: Optional[str] = None
 
     def to_dict(self):
         """Convert the object to a dictionary."""
-        return {"role": self.role, 
-                "content": self.content}
+        result = {"role": self.role, 
+                  "content": self.content}
+        # tool calls requested by the assistant and results of the tool calls
+        if self.tool_calls is not None:
+            result["tool_calls"] = self.tool_calls
+        if self.tool_call_id is not None:
+            result["tool_call_id"] = self.tool_call_id
+        return result
 
     def __repr__(self):
         """String representation for debugging."""
@@ -23,7 +32,10 @@ class Property:
     nullable: bool = False
 
     def to_dict(self) -> Dict:
-        result = asdict(self)
+        result = {"type": self.type,
+                  "description": self.description,
+                  "enum": None if self.enum is None else list(self.enum),
+                  "nullable": self.nullable}
         return {k: v for k, v in result.items() if v is not None}
 
 @dataclass
@@ -65,6 +77,35 @@ class Tool:
             "function": self.function.to_dict()
         }
 
+class ToolSet:
+    '''
+    Immutable collection of tools with their schemas serialized once.
+
+    It behaves as a read-only sequence of tools and exposes the ``schemas`` sent in the request
+    body and their indented ``json`` used to describe the tools in the prompt.
+    '''
+    __slots__=('tools', 'schemas', 'json')
+
+    def __init__(self, tools: Iterable[Tool]):
+        self.tools=tuple(tools)
+        self.schemas=tuple(tool.to_dict() for tool in self.tools)
+        self.json=json.dumps(list(self.schemas), indent=2)
+
+    def __iter__(self) -> Iterator[Tool]:
+        return iter(self.tools)
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def __getitem__(self, index):
+        return self.tools[index]
+
+    def __bool__(self) -> bool:
+        return bool(self.tools)
+
+    def __repr__(self):
+        return f"ToolSet({[tool.function.name for tool in self.tools]})"
+
 @dataclass
 class FunctionCall:
     name: str
@@ -80,7 +121,7 @@ class FunctionCall:
 class ToolCall:
     id: str
     type: str
-    function: Function
+    function: FunctionCall
 
     def to_dict(self) -> Dict:
         return {
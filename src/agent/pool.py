@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, List, Union
+
+from .agent import BaseAgent
+
+class AgentPool:
+    '''
+    Pool of agents handing out clones of a prototype, one per request at a time.
+
+    The prototype is built once (model checks, tools, logger, HTTP clients) and the pool hands out
+    clones sharing it, each with its own state (see BaseAgent.clone). A returned agent is reset and
+    handed out again. At most max_size agents are checked out at the same time, checkout waits for a
+    returned agent above it.
+
+    Args:
+        prototype (Union[BaseAgent, Callable]): Agent to clone, or function building it.
+        max_size (int): Maximum number of agents checked out at the same time.
+        timeout (float): Default seconds checkout waits for an agent, None to wait without limit.
+    '''
+    def __init__(self,
+                 prototype: Union[BaseAgent, Callable[[], BaseAgent]],
+                 max_size: int = 16,
+                 timeout: float = None):
+        if max_size<1:
+            raise ValueError('max_size must be at least 1')
+        self.prototype: BaseAgent=prototype if isinstance(prototype, BaseAgent) else prototype()
+        self.max_size=max_size
+        self.timeout=timeout
+        self.created=0
+        self._idle: List[BaseAgent]=[]
+        self._lock=threading.Lock()
+        self._slots=threading.BoundedSemaphore(max_size)
+        # wake up the coroutines waiting for an agent, the threads wait on the semaphore
+        self._waiters: List[Callable[[], None]]=[]
+
+    def checkout(self, timeout: float = None)->BaseAgent:
+        '''
+        Returns an agent with a fresh state, to be returned with checkin.
+        Raises TimeoutError if no agent is available within the timeout.
+        '''
+        timeout=self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f'No agent available within {timeout}s ({self.max_size} checked out)')
+        return self._take()
+
+    async def acheckout(self, timeout: float = None)->BaseAgent:
+        '''
+        Async version of checkout, the coroutine waits on the event loop without holding a thread.
+        '''
+        timeout=self.timeout if timeout is None else timeout
+        loop=asyncio.get_running_loop()
+        deadline=None if timeout is None else loop.time()+timeout
+        while True:
+            wakeup=asyncio.Event()
+            wake=lambda: loop.call_soon_threadsafe(wakeup.set)
+            # registered before trying the semaphore, so that a checkin in between isn't missed
+            with self._lock:
+                self._waiters.append(wake)
+            try:
+                if self._slots.acquire(blocking=False):
+                    break
+                remaining=None if deadline is None else deadline-loop.time()
+                if remaining is not None and remaining<=0:
+                    raise TimeoutError(f'No agent available within {timeout}s ({self.max_size} checked out)')
+                try:
+                    await asyncio.wait_for(wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._lock:
+                    self._waiters.remove(wake)
+        return self._take()
+
+    def checkin(self, agent: BaseAgent):
+        '''
+        Resets an agent returned by checkout and makes it available again.
+        '''
+        agent.reset()
+        with self._lock:
+            self._idle.append(agent)
+        self._slots.release()
+        with self._lock:
+            waiters=list(self._waiters)
+        for wake in waiters:
+            wake()
+
+    def _take(self)->BaseAgent:
+        # called with a slot acquired, released if no agent can be handed out
+        try:
+            with self._lock:
+                if self._idle:
+                    # the most recently used agent, its caches being the warmest
+                    return self._idle.pop()
+                self.created+=1
+            return self.prototype.clone()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    @contextmanager
+    def agent(self, timeout: float = None):
+        '''
+        Context manager checking out an agent and returning it on exit.
+        '''
+        agent=self.checkout(timeout)
+        try:
+            yield agent
+        finally:
+            self.checkin(agent)
+
+    @asynccontextmanager
+    async def aagent(self, timeout: float = None):
+        agent=await self.acheckout(timeout)
+        try:
+            yield agent
+        finally:
+            self.checkin(agent)
+
+    def stats(self)->dict:
+        '''
+        Returns the number of agents created, idle and checked out.
+        '''
+        with self._lock:
+            idle=len(self._idle)
+        return {'created': self.created,
+                'idle': idle,
+                'checked_out': self.created-idle,
+                'max_size': self.max_size}
+
+    def close(self):
+        '''
+        Closes the connections shared by the agents.
+        '''
+        self.prototype.close()
+
+    async def aclose(self):
+        await self.prototype.aclose()
+
+    def __repr__(self):
+        return f'AgentPool({self.prototype.__class__.__name__}, max_size={self.max_size})'
@@ -0,0 +1,339 @@
+import heapq
+import asyncio
+import sqlite3
+import threading
+from itertools import count
+from time import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+# (name, rate in units per second, capacity, amount) of a bucket in a request
+BucketRequest=Tuple[str, float, float, float]
+
+class MemoryBucketStore:
+    '''
+    Token buckets of the process.
+    '''
+    # consume doesn't wait for other processes, it can be called from the event loop
+    blocking: bool = False
+
+    def __init__(self):
+        # name -> (tokens, updated)
+        self._buckets: Dict[str, Tuple[float, float]]={}
+        self._lock=threading.Lock()
+
+    def consume(self, requests: List[BucketRequest])->float:
+        '''
+        Takes the amounts from all the buckets, or from none of them. Returns 0 if the amounts are
+        taken, otherwise the seconds before they are available.
+        '''
+        with self._lock:
+            now=time()
+            levels=[self._level(name, rate, capacity, now) for name, rate, capacity, _ in requests]
+            wait=_get_wait(requests, levels)
+            if wait==0:
+                for (name, _, _, amount), tokens in zip(requests, levels):
+                    self._buckets[name]=(tokens-amount, now)
+            return wait
+
+    def adjust(self, name: str, rate: float, capacity: float, amount: float):
+        '''
+        Takes amount (possibly negative) from the bucket, the level can go below 0.
+        '''
+        with self._lock:
+            now=time()
+            self._buckets[name]=(self._level(name, rate, capacity, now)-amount, now)
+
+    def _level(self, name: str, rate: float, capacity: float, now: float)->float:
+        tokens, updated=self._buckets.get(name, (capacity, now))
+        return min(capacity, tokens+(now-updated)*rate)
+
+class SQLiteBucketStore:
+    '''
+    Token buckets stored in a SQLite database, shared by the processes using the same file.
+
+    Args:
+        path (str): Path of the SQLite database.
+    '''
+    # consume waits for the write lock of the database held by other processes
+    blocking: bool = True
+
+    def __init__(self, path: str):
+        self.path=path
+        self._connection=sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock=threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                                     'name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def consume(self, requests: List[BucketRequest])->float:
+        with self._lock:
+            # the write lock of the database is taken before reading the levels
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                now=time()
+                levels=[self._level(name, rate, capacity, now) for name, rate, capacity, _ in requests]
+                wait=_get_wait(requests, levels)
+                if wait==0:
+                    self._connection.executemany('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                                                 [(name, tokens-amount, now) for (name, _, _, amount), tokens in zip(requests, levels)])
+                self._connection.execute('COMMIT')
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            return wait
+
+    def adjust(self, name: str, rate: float, capacity: float, amount: float):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                now=time()
+                tokens=self._level(name, rate, capacity, now)
+                self._connection.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (name, tokens-amount, now))
+                self._connection.execute('COMMIT')
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def _level(self, name: str, rate: float, capacity: float, now: float)->float:
+        row=self._connection.execute('SELECT tokens, updated FROM buckets WHERE name=?', (name,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated=row
+        return min(capacity, tokens+max(now-updated, 0.0)*rate)
+
+def _get_wait(requests: List[BucketRequest], levels: List[float])->float:
+    wait=0.0
+    for (_, rate, _, amount), tokens in zip(requests, levels):
+        if tokens<amount:
+            wait=max(wait, (amount-tokens)/rate)
+    return wait
+
+class _Ticket:
+    __slots__=('key', 'granted', 'wake')
+
+    def __init__(self, key: tuple):
+        self.key=key
+        self.granted=False
+        # wakes up a coroutine waiting for the ticket, the threads wait on the condition
+        self.wake: Optional[Callable[[], None]]=None
+
+class RateLimiter:
+    '''
+    Client-side rate limiter keeping the requests within the requests/min and tokens/min budgets
+    of each API key and model.
+
+    The budgets are token buckets refilled continuously, holding at most burst seconds of budget,
+    so that the requests are spread at the quota rate instead of alternating bursts and rate limit
+    errors. The requests waiting for a budget are served by priority (lower values first) and,
+    within a priority, fairly between the clients (e.g. the agents of the process) in a round robin
+    fashion. With a SQLiteBucketStore the budgets are shared by several processes.
+
+    Args:
+        rpm (float): Requests per minute of each key and model, None for no limit.
+        tpm (float): Tokens per minute of each key and model, None for no limit.
+        limits (Dict[str, Tuple[float, float]]): (rpm, tpm) overriding the defaults for some models.
+        burst (float): Seconds of budget which can be used at once.
+        store: MemoryBucketStore (default) or SQLiteBucketStore for cross-process budgets.
+    '''
+    def __init__(self,
+                 rpm: Optional[float] = None,
+                 tpm: Optional[float] = None,
+                 limits: Dict[str, Tuple[Optional[float], Optional[float]]] = None,
+                 burst: float = 10.0,
+                 store=None):
+        self.rpm=rpm
+        self.tpm=tpm
+        self.limits=dict(limits or {})
+        self.burst=burst
+        self.store=MemoryBucketStore() if store is None else store
+
+        self._lock=threading.Lock()
+        self._condition=threading.Condition(self._lock)
+        # waiting tickets per budget, ordered by (priority, virtual start, arrival)
+        self._queues: Dict[str, List[Tuple[tuple, _Ticket]]]={}
+        # fair queuing: virtual time of each budget and virtual finish of each client
+        self._virtual_time: Dict[str, float]={}
+        self._finish: Dict[Tuple[str, Hashable], float]={}
+        self._arrivals=count()
+
+    def acquire(self,
+                key: str,
+                model: str,
+                tokens: float = 0,
+                client: Hashable = None,
+                priority: int = 0,
+                timeout: float = None)->bool:
+        '''
+        Waits till a request of tokens (estimated) fits the budgets of the key and model.
+        Returns False if the timeout expires first.
+        '''
+        requests=self._get_requests(key, model, tokens)
+        if not requests:
+            return True
+
+        budget=f'{key}:{model}'
+        deadline=None if timeout is None else time()+timeout
+        with self._condition:
+            ticket=self._enqueue(budget, client, priority)
+            try:
+                while True:
+                    wait=self._poll(budget, ticket, requests)
+                    if ticket.granted:
+                        return True
+                    if deadline is not None:
+                        remaining=deadline-time()
+                        if remaining<=0:
+                            return False
+                        wait=remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            finally:
+                if not ticket.granted:
+                    self._remove(budget, ticket)
+                self._cleanup(budget)
+
+    async def aacquire(self,
+                       key: str,
+                       model: str,
+                       tokens: float = 0,
+                       client: Hashable = None,
+                       priority: int = 0,
+                       timeout: float = None)->bool:
+        '''
+        Async version of acquire, the coroutine waits on the event loop without holding a thread.
+        The budgets of a blocking store (SQLiteBucketStore) are consumed in the default executor.
+        '''
+        requests=self._get_requests(key, model, tokens)
+        if not requests:
+            return True
+
+        budget=f'{key}:{model}'
+        deadline=None if timeout is None else time()+timeout
+        loop=asyncio.get_running_loop()
+        blocking=getattr(self.store, 'blocking', True)
+        wakeup=asyncio.Event()
+        with self._lock:
+            ticket=self._enqueue(budget, client, priority)
+            ticket.wake=lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            while True:
+                with self._lock:
+                    # cleared under the lock, a ticket served after the poll sets it again
+                    wakeup.clear()
+                    if blocking:
+                        wait=None if self._queues[budget][0][1] is not ticket else 0
+                    else:
+                        wait=self._poll(budget, ticket, requests)
+                if blocking and wait==0:
+                    # a store shared by several processes (SQLite) can wait for their locks, out of the loop
+                    wait=await loop.run_in_executor(None, self.store.consume, requests)
+                    if wait==0:
+                        with self._lock:
+                            self._grant(budget, ticket)
+                if ticket.granted:
+                    return True
+                if deadline is not None:
+                    remaining=deadline-time()
+                    if remaining<=0:
+                        return False
+                    wait=remaining if wait is None else min(wait, remaining)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # also on cancellation, the ticket leaves the queue
+            with self._lock:
+                if not ticket.granted:
+                    self._remove(budget, ticket)
+                self._cleanup(budget)
+
+    def record(self, key: str, model: str, estimated_tokens: float, tokens: float):
+        '''
+        Corrects the tokens budget with the actual tokens of a response.
+        '''
+        limit=self._get_limit(model)[1]
+        if limit is not None and tokens is not None:
+            rate, capacity=self._get_bucket(limit)
+            self.store.adjust(f'{key}:{model}:tokens', rate, capacity, tokens-min(estimated_tokens, capacity))
+
+    def penalize(self, key: str, model: str, delay: float):
+        '''
+        Empties the requests budget of the key and model for delay seconds, e.g. after a rate limit.
+        '''
+        limit=self._get_limit(model)[0]
+        if limit is not None:
+            rate, capacity=self._get_bucket(limit)
+            self.store.adjust(f'{key}:{model}:requests', rate, capacity, capacity+rate*delay)
+
+    def _get_limit(self, model: str)->Tuple[Optional[float], Optional[float]]:
+        return self.limits.get(model, (self.rpm, self.tpm))
+
+    def _get_bucket(self, per_minute: float)->Tuple[float, float]:
+        # refill rate per second and capacity (at least one request)
+        rate=per_minute/60
+        return rate, max(rate*self.burst, 1.0)
+
+    def _get_requests(self, key: str, model: str, tokens: float)->List[BucketRequest]:
+        rpm, tpm=self._get_limit(model)
+        requests=[]
+        if rpm is not None:
+            rate, capacity=self._get_bucket(rpm)
+            requests.append((f'{key}:{model}:requests', rate, capacity, 1))
+        if tpm is not None and tokens:
+            rate, capacity=self._get_bucket(tpm)
+            # a request larger than the bucket waits for a full bucket
+            requests.append((f'{key}:{model}:tokens', rate, capacity, min(tokens, capacity)))
+        return requests
+
+    def _poll(self, budget: str, ticket: _Ticket, requests: List[BucketRequest])->Optional[float]:
+        # called with the lock held, grants the ticket at the head of the queue if the budgets allow
+        # it, otherwise returns the seconds to wait (None till the ticket reaches the head)
+        queue=self._queues[budget]
+        if queue[0][1] is not ticket:
+            return None
+        wait=self.store.consume(requests)
+        if wait==0:
+            self._grant(budget, ticket)
+        return wait
+
+    def _grant(self, budget: str, ticket: _Ticket):
+        queue=self._queues[budget]
+        if queue[0][1] is ticket:
+            heapq.heappop(queue)
+        else:
+            # a ticket of a higher priority arrived while the budgets were consumed out of the lock
+            queue.remove((ticket.key, ticket))
+            heapq.heapify(queue)
+        self._virtual_time[budget]=ticket.key[1]
+        ticket.granted=True
+        self._notify(budget)
+
+    def _notify(self, budget: str):
+        self._condition.notify_all()
+        for _, ticket in self._queues.get(budget, []):
+            if ticket.wake is not None:
+                ticket.wake()
+
+    def _enqueue(self, budget: str, client: Hashable, priority: int)->_Ticket:
+        # start time fair queuing: a client is served after the requests of the other clients
+        # which arrived while its previous request was waiting
+        start=max(self._virtual_time.get(budget, 0.0), self._finish.get((budget, client), 0.0))
+        self._finish[(budget, client)]=start+1
+        ticket=_Ticket((priority, start, next(self._arrivals)))
+        heapq.heappush(self._queues.setdefault(budget, []), (ticket.key, ticket))
+        return ticket
+
+    def _remove(self, budget: str, ticket: _Ticket):
+        queue=self._queues[budget]
+        queue.remove((ticket.key, ticket))
+        heapq.heapify(queue)
+        self._notify(budget)
+
+    def _cleanup(self, budget: str):
+        if not self._queues[budget]:
+            # no request waiting, the fairness history can be dropped
+            del self._queues[budget]
+            self._virtual_time.pop(budget, None)
+            for finish_key in [finish_key for finish_key in self._finish if finish_key[0]==budget]:
+                del self._finish[finish_key]
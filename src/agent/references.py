@@ -0,0 +1,128 @@
+import re
+import ast
+from typing import Any, Callable, Container, List, Optional, Set, Tuple
+
+# a reference starts with $ followed by the id of a previous action
+_REFERENCE=re.compile(r'\$([\w\-]+)')
+# accessors following a reference: [0], ['key'], ["key"] or .attr
+_ACCESSOR=re.compile(r'''\[\s*('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|-?\d+)\s*\]|\.([A-Za-z_]\w*)''')
+
+Lookup=Callable[[str], Any]
+
+class Reference:
+    '''
+    Compiled ``$id``, ``$id[...]`` or ``$id.attr`` expression.
+
+    Calling the reference with a lookup function, returning the result of an action from its id,
+    applies the chain of accessors to the result.
+    '''
+    __slots__=('id', 'accessors')
+
+    def __init__(self, id: str, accessors: List[Tuple[bool, Any]]):
+        self.id=id
+        # (is_item, key) pairs
+        self.accessors=accessors
+
+    def __call__(self, lookup: Lookup)->Any:
+        value=lookup(self.id)
+        for is_item, key in self.accessors:
+            if is_item or (isinstance(value, dict) and key in value):
+                value=value[key]
+            else:
+                value=getattr(value, key)
+        return value
+
+    def __repr__(self):
+        return f'Reference(id={self.id!r}, accessors={self.accessors!r})'
+
+class CompiledArguments:
+    '''
+    Arguments of an action with their references compiled once per plan.
+
+    Args:
+        arguments: Arguments of the action (dictionaries and lists are walked recursively).
+        ids (Container[str]): Ids of the actions which can be referenced.
+    '''
+    def __init__(self, arguments: Any, ids: Container[str]):
+        self.references: Set[str]=set()
+        self._resolve=self._compile(arguments, ids) or _constant(arguments)
+
+    def resolve(self, lookup: Lookup)->Any:
+        '''
+        Returns the arguments with the references replaced by the results returned by lookup.
+        '''
+        return self._resolve(lookup)
+
+    def _compile(self, value: Any, ids: Container[str])->Optional[Callable[[Lookup], Any]]:
+        # returns None if the value doesn't contain references
+        if isinstance(value, str):
+            return self._compile_string(value, ids)
+
+        if isinstance(value, dict):
+            items=[(key, self._compile(item, ids)) for key, item in value.items()]
+            if all(resolver is None for _, resolver in items):
+                return None
+            items=[(key, resolver or _constant(value[key])) for key, resolver in items]
+            return lambda lookup: {key: resolver(lookup) for key, resolver in items}
+
+        if isinstance(value, (list, tuple)):
+            items=[self._compile(item, ids) for item in value]
+            if all(resolver is None for resolver in items):
+                return None
+            items=[resolver or _constant(item) for resolver, item in zip(items, value)]
+            return lambda lookup: [resolver(lookup) for resolver in items]
+
+        return None
+
+    def _compile_string(self, value: str, ids: Container[str])->Optional[Callable[[Lookup], Any]]:
+        parts: List[Any]=[]
+        pos=0
+        start=0
+        while True:
+            match=_REFERENCE.search(value, pos)
+            if match is None:
+                break
+
+            id=_match_id(match.group(1), ids)
+            if id is None:
+                pos=match.end()
+                continue
+
+            end=match.start(1)+len(id)
+            accessors=[]
+            while True:
+                accessor=_ACCESSOR.match(value, end)
+                if accessor is None:
+                    break
+                if accessor.group(1) is not None:
+                    accessors.append((True, ast.literal_eval(accessor.group(1))))
+                else:
+                    accessors.append((False, accessor.group(2)))
+                end=accessor.end()
+
+            if match.start()>start:
+                parts.append(value[start:match.start()])
+            parts.append(Reference(id, accessors))
+            self.references.add(id)
+            start=pos=end
+
+        if not parts:
+            return None
+        if start<len(value):
+            parts.append(value[start:])
+
+        # a string made of a single reference is replaced by the referenced object
+        if len(parts)==1:
+            return parts[0]
+        # references embedded in text are formatted as strings
+        return lambda lookup: ''.join(part if isinstance(part, str) else str(part(lookup)) for part in parts)
+
+def _constant(value: Any)->Callable[[Lookup], Any]:
+    return lambda lookup: value
+
+def _match_id(token: str, ids: Container[str])->str:
+    # the longest prefix of the token which is an action id
+    for end in range(len(token), 0, -1):
+        if token[:end] in ids:
+            return token[:end]
+    return None
@@ -0,0 +1,133 @@
+import random
+import asyncio
+import contextvars
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Iterable, Optional, Union
+import requests
+
+# set by a PooledChatbot while a backend sends a request: the transport and HTTP failures are raised at
+# once so that the pool fails over to another backend, the responses not satisfying the format are
+# still retried according to the policy of the backend
+FAIL_FAST: contextvars.ContextVar=contextvars.ContextVar('fail_fast', default=False)
+
+class RetryError(ValueError):
+    '''
+    Raised when a request is still failing after the attempts or the deadline of the retry policy.
+
+    Attributes:
+        attempts (int): Number of attempts performed.
+        last_error: Last error encountered.
+        status_code (int): Status code of the last failed response (or provider error code), None for
+            transport errors and responses not satisfying the format.
+    '''
+    def __init__(self, message: str, attempts: int, last_error=None, status_code: int = None):
+        super().__init__(message)
+        self.attempts=attempts
+        self.last_error=last_error
+        self.status_code=status_code
+
+class RetryPolicy:
+    '''
+    Bounded exponential backoff with jitter.
+
+    The delay before the attempt n+1 is drawn in [delay*(1-jitter), delay] with
+    delay=min(base_delay*multiplier**(n-1), max_delay), unless the server provides a Retry-After.
+
+    Args:
+        max_attempts (int): Maximum number of attempts (the first request included).
+        base_delay (float): Delay after the first failed attempt in seconds.
+        max_delay (float): Maximum delay between two attempts in seconds.
+        multiplier (float): Growth factor of the delay.
+        jitter (float): Fraction of the delay randomized, between 0 and 1.
+        deadline (float): Overall time budget of a request in seconds, None for no deadline.
+        retry_statuses (Iterable[int]): Status codes which are retried (rate limits and server errors).
+    '''
+    # network errors which are retried
+    retry_exceptions=(requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError, asyncio.TimeoutError)
+
+    def __init__(self,
+                 max_attempts: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 multiplier: float = 2.0,
+                 jitter: float = 0.5,
+                 deadline: float = 120.0,
+                 retry_statuses: Iterable[int] = (408, 429, 500, 502, 503, 504)):
+        self.max_attempts=max_attempts
+        self.base_delay=base_delay
+        self.max_delay=max_delay
+        self.multiplier=multiplier
+        self.jitter=jitter
+        self.deadline=deadline
+        self.retry_statuses=set(retry_statuses)
+
+    def is_retryable(self, status_code: int, json_response: Optional[dict] = None)->bool:
+        '''
+        Returns True if the response is a rate limit or a server error, also when reported in the body
+        of a 200 response.
+        '''
+        if status_code in self.retry_statuses:
+            return True
+        if isinstance(json_response, dict) and isinstance(json_response.get('error'), dict):
+            return json_response['error'].get('code') in self.retry_statuses
+        return False
+
+    def get_delay(self, attempt: int, retry_after: Union[str, float] = None)->float:
+        retry_after=parse_retry_after(retry_after)
+        if retry_after is not None:
+            return retry_after
+        delay=min(self.base_delay*self.multiplier**(attempt-1), self.max_delay)
+        return delay*(1-self.jitter*random.random())
+
+    def start(self)->'RetryState':
+        '''
+        Returns the retry state of a new request.
+        '''
+        return RetryState(self)
+
+class RetryState:
+    '''
+    Attempts and elapsed time of a request retried according to a RetryPolicy.
+    '''
+    def __init__(self, policy: RetryPolicy):
+        self.policy=policy
+        self.attempts=0
+        self.start_time=monotonic()
+
+    def next_delay(self, error=None, status_code: int = None, retry_after: Union[str, float] = None)->float:
+        '''
+        Records a failed attempt and returns the delay before the next one.
+
+        Raises:
+            RetryError: If the attempts or the deadline of the policy are exhausted.
+        '''
+        self.attempts+=1
+        if self.attempts>=self.policy.max_attempts:
+            raise RetryError(f'Request failed after {self.attempts} attempts: {error}',
+                             self.attempts, error, status_code)
+
+        delay=self.policy.get_delay(self.attempts, retry_after)
+        if self.policy.deadline is not None and (monotonic()-self.start_time+delay)>self.policy.deadline:
+            raise RetryError(f'Request deadline of {self.policy.deadline}s exceeded after {self.attempts} attempts: {error}',
+                             self.attempts, error, status_code)
+        return delay
+
+def parse_retry_after(retry_after: Union[str, float, None])->Optional[float]:
+    '''
+    Returns the delay in seconds of a Retry-After header, given either in seconds or as an HTTP date.
+    '''
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        date=parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date=date.replace(tzinfo=timezone.utc)
+    return max((date-datetime.now(timezone.utc)).total_seconds(), 0.0)
@@ -0,0 +1,345 @@
+import logging
+import threading
+from time import monotonic
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from .chatbot import BaseChatbot, Formats
+from .instrumentation import Instrumentation
+from .models import Message, Tool
+from .retry import FAIL_FAST, RetryError, RetryPolicy
+
+class CircuitBreaker:
+    '''
+    Stops routing requests to a failing backend.
+
+    After failure_threshold consecutive failures the circuit opens and the backend is skipped for
+    recovery_time seconds. Then a single trial request is let through (half open): the circuit
+    closes if it succeeds and opens again otherwise. A rate limited backend is opened for the
+    duration of the limit with trip.
+
+    Args:
+        failure_threshold (int): Consecutive failures opening the circuit.
+        recovery_time (float): Seconds before a trial request is let through.
+    '''
+    CLOSED='closed'
+    OPEN='open'
+    HALF_OPEN='half_open'
+
+    def __init__(self,
+                 failure_threshold: int = 3,
+                 recovery_time: float = 30.0):
+        self.failure_threshold=failure_threshold
+        self.recovery_time=recovery_time
+        self.state=self.CLOSED
+        self.failures=0
+        self._open_until=0.0
+        self._trial=False
+        self._lock=threading.Lock()
+
+    def allow(self)->bool:
+        '''
+        Returns True if a request can be sent to the backend.
+        '''
+        with self._lock:
+            if self.state==self.CLOSED:
+                return True
+            if self.state==self.OPEN and monotonic()>=self._open_until:
+                self.state=self.HALF_OPEN
+                self._trial=False
+            if self.state==self.HALF_OPEN and not self._trial:
+                self._trial=True
+                return True
+            return False
+
+    def available(self)->bool:
+        '''
+        Returns True if the backend would accept a request, without taking the trial request.
+        '''
+        with self._lock:
+            if self.state==self.CLOSED:
+                return True
+            if self.state==self.OPEN:
+                return monotonic()>=self._open_until
+            return not self._trial
+
+    def retry_in(self)->float:
+        '''
+        Seconds before the backend accepts requests again.
+        '''
+        with self._lock:
+            return max(self._open_until-monotonic(), 0.0) if self.state==self.OPEN else 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.state=self.CLOSED
+            self.failures=0
+            self._trial=False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures+=1
+            if self.state==self.HALF_OPEN or self.failures>=self.failure_threshold:
+                self._open(self.recovery_time)
+
+    def trip(self, duration: float = None):
+        '''
+        Opens the circuit for duration seconds (recovery_time by default), e.g. after a rate limit.
+        '''
+        with self._lock:
+            self._open(self.recovery_time if duration is None else duration)
+
+    def _open(self, duration: float):
+        self.state=self.OPEN
+        self._open_until=monotonic()+duration
+        self._trial=False
+
+    def __repr__(self):
+        return f'CircuitBreaker(state={self.state}, failures={self.failures})'
+
+class Backend:
+    '''
+    Chatbot of a PooledChatbot with its routing statistics.
+
+    Args:
+        chatbot (BaseChatbot): Chatbot sending the requests (e.g. an OpenRouterChatbot with its own key,
+            endpoint and model).
+        name (str): Name of the backend in the logs and the stats.
+        weight (float): Relative capacity of the backend, a backend with weight 2 gets twice the
+            outstanding requests of a backend with weight 1.
+        breaker (CircuitBreaker): Circuit breaker of the backend.
+    '''
+    # smoothing factor of the latency moving average
+    alpha: float = 0.2
+
+    def __init__(self,
+                 chatbot: BaseChatbot,
+                 name: str = None,
+                 weight: float = 1.0,
+                 breaker: CircuitBreaker = None):
+        self.chatbot=chatbot
+        self.name=name or _get_name(chatbot)
+        self.weight=weight
+        self.breaker=CircuitBreaker() if breaker is None else breaker
+        self.outstanding=0
+        self.requests=0
+        self.errors=0
+        self.rate_limits=0
+        # exponential moving average of the latency of the successful requests
+        self.latency: Optional[float]=None
+
+    def record_latency(self, latency: float):
+        self.latency=latency if self.latency is None else self.alpha*latency+(1-self.alpha)*self.latency
+
+    def stats(self)->dict:
+        return {'state': self.breaker.state,
+                'outstanding': self.outstanding,
+                'requests': self.requests,
+                'errors': self.errors,
+                'rate_limits': self.rate_limits,
+                'latency': self.latency}
+
+    def __repr__(self):
+        return f'Backend(name={self.name!r}, state={self.breaker.state}, outstanding={self.outstanding})'
+
+def _get_name(chatbot: BaseChatbot)->str:
+    model=getattr(chatbot, 'model', None)
+    base_url=getattr(chatbot, 'base_url', None)
+    name='@'.join(str(part) for part in (model, base_url) if part is not None) or chatbot.__class__.__name__
+    # several API keys on the same model and endpoint are told apart by a digest of the key
+    key=getattr(chatbot, '_rate_limit_key', None)
+    return f'{name}#{key[:8]}' if key else name
+
+class PooledChatbot(BaseChatbot):
+    '''
+    Chatbot spreading the requests over several backends (API keys, endpoints, models) with
+    failover.
+
+    Each request is routed to the available backend with the best score: the least outstanding
+    requests (relative to the weight of the backend), or with strategy='latency' the outstanding
+    requests weighted by the average latency of the backend. A backend failing or rate limited is
+    skipped by its circuit breaker and the request is sent to the next backend. When all the
+    backends are unavailable the request waits for the first one to recover, within the retry
+    policy of the pool.
+
+    With fail_fast=True the backends don't retry the rate limits, the HTTP errors and the network
+    errors, which fail over to another backend instead, while the responses not satisfying the
+    format are still retried by the backend. Only the rate limits, HTTP and network errors count as
+    failures of a backend for its circuit breaker.
+
+    Args:
+        backends (Sequence[Union[BaseChatbot, Backend]]): Backends in order of preference.
+        strategy (str): 'least_outstanding' or 'latency'.
+        retry_policy (RetryPolicy): Retries of a request once all the backends have failed.
+        rate_limit_cooldown (float): Seconds a rate limited backend is skipped.
+        fail_fast (bool): If True the backends don't retry the failed requests themselves.
+    '''
+    STRATEGIES=('least_outstanding', 'latency')
+
+    def __init__(self,
+                 backends: Sequence[Union[BaseChatbot, Backend]],
+                 strategy: str = 'least_outstanding',
+                 retry_policy: RetryPolicy = None,
+                 rate_limit_cooldown: float = 10.0,
+                 fail_fast: bool = True,
+                 verbose: int = logging.INFO,
+                 instrumentation: Instrumentation = None):
+        if not backends:
+            raise ValueError('At least one backend is required')
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Unknown strategy {strategy}, expected one of {self.STRATEGIES}')
+
+        # the backends keep their own connection pools
+        super().__init__(verbose, session=None, instrumentation=instrumentation)
+
+        self.backends: List[Backend]=[backend if isinstance(backend, Backend) else Backend(backend) for backend in backends]
+        # the names identify the backends in the logs and the stats, the duplicates get their index
+        names=[backend.name for backend in self.backends]
+        for index, backend in enumerate(self.backends):
+            if names.count(backend.name)>1:
+                backend.name=f'{backend.name}[{index}]'
+        self.strategy=strategy
+        self.retry_policy=RetryPolicy() if retry_policy is None else retry_policy
+        self.rate_limit_cooldown=rate_limit_cooldown
+        self.fail_fast=fail_fast
+        self._lock=threading.Lock()
+
+    def chat(self,
+             messages: List[Message],
+             tools: List[Tool]=None,
+             format: Formats=Formats.STRING,
+             stream: bool = False,
+             **kwargs)->Any:
+        '''
+        Queries the model of the selected backend, see the chat method of the backends.
+        '''
+        return self._dispatch(lambda chatbot: chatbot.chat(messages, tools, format, stream, **kwargs))
+
+    def complete(self,
+                 messages: List[Message],
+                 tools: List[Tool]=None,
+                 format: Formats=Formats.STRING,
+                 **kwargs)->tuple:
+        return self._dispatch(lambda chatbot: chatbot.complete(messages, tools, format, **kwargs))
+
+    async def achat(self,
+                    messages: List[Message],
+                    tools: List[Tool]=None,
+                    format: Formats=Formats.STRING,
+                    stream: bool = False,
+                    **kwargs)->Any:
+        retry=self.retry_policy.start()
+        tried=set()
+        while True:
+            backend, delay=self._next_backend(retry, tried)
+            if backend is None:
+                await self._asleep(delay)
+                continue
+            start=monotonic()
+            token=FAIL_FAST.set(self.fail_fast)
+            try:
+                with self.instrumentation.span('pool.request', backend=backend.name):
+                    result=await backend.chatbot.achat(messages, tools, format, stream, **kwargs)
+            except (RetryError,)+self.retry_policy.retry_exceptions as e:
+                self._on_failure(backend, e)
+                continue
+            finally:
+                FAIL_FAST.reset(token)
+                self._release(backend)
+            self._on_success(backend, monotonic()-start)
+            return result
+
+    def stats(self)->dict:
+        '''
+        Returns the state, outstanding requests, requests, errors, rate limits and latency of each backend.
+        '''
+        return {backend.name: backend.stats() for backend in self.backends}
+
+    def close(self):
+        for backend in self.backends:
+            backend.chatbot.close()
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.chatbot.aclose()
+
+    def _dispatch(self, request: Callable[[BaseChatbot], Any])->Any:
+        retry=self.retry_policy.start()
+        # backends which failed the request, tried again only once all the backends have failed
+        tried=set()
+        while True:
+            backend, delay=self._next_backend(retry, tried)
+            if backend is None:
+                self._sleep(delay)
+                continue
+            start=monotonic()
+            token=FAIL_FAST.set(self.fail_fast)
+            try:
+                with self.instrumentation.span('pool.request', backend=backend.name):
+                    result=request(backend.chatbot)
+            except (RetryError,)+self.retry_policy.retry_exceptions as e:
+                self._on_failure(backend, e)
+                continue
+            finally:
+                FAIL_FAST.reset(token)
+                self._release(backend)
+            self._on_success(backend, monotonic()-start)
+            return result
+
+    def _next_backend(self, retry, tried: set)->tuple:
+        # returns the selected backend, or None with the delay before the next attempt
+        with self._lock:
+            candidates=[backend for backend in self.backends if backend not in tried and backend.breaker.available()]
+            if not candidates and tried:
+                # all the backends have failed the request, start a new round after a backoff
+                tried.clear()
+                return None, retry.next_delay('all the backends failed')
+            for backend in sorted(candidates, key=self._score):
+                if backend.breaker.allow():
+                    backend.outstanding+=1
+                    backend.requests+=1
+                    tried.add(backend)
+                    return backend, None
+
+        # all the circuits are open (or in trial), wait for the first backend to recover
+        delay=retry.next_delay('no backend available')
+        recovery=min(backend.breaker.retry_in() for backend in self.backends)
+        if recovery>0:
+            delay=recovery
+        self.logger.warning(f'No backend available, waiting {delay:.2f}s')
+        return None, delay
+
+    def _score(self, backend: Backend)->float:
+        load=(backend.outstanding+1)/backend.weight
+        if self.strategy=='latency':
+            # backends without latency samples are tried first
+            return load*(backend.latency or 0.0)
+        return load
+
+    def _release(self, backend: Backend):
+        with self._lock:
+            backend.outstanding-=1
+
+    def _on_success(self, backend: Backend, latency: float):
+        with self._lock:
+            backend.record_latency(latency)
+        backend.breaker.record_success()
+
+    def _is_backend_failure(self, error: Exception)->bool:
+        # rate limits, HTTP and network errors, not the responses which didn't satisfy the format
+        if isinstance(error, RetryError):
+            return error.status_code is not None or isinstance(error.last_error, self.retry_policy.retry_exceptions)
+        return True
+
+    def _on_failure(self, backend: Backend, error: Exception):
+        rate_limited=getattr(error, 'status_code', None)==429
+        with self._lock:
+            backend.errors+=1
+            backend.rate_limits+=rate_limited
+        if rate_limited:
+            backend.breaker.trip(self.rate_limit_cooldown)
+            self.logger.warning(f'Backend {backend.name} rate limited, failing over')
+        elif not self._is_backend_failure(error):
+            self.logger.warning(f'Backend {backend.name} returned no valid response ({error}), failing over')
+        else:
+            backend.breaker.record_failure()
+            self.logger.warning(f'Backend {backend.name} failed ({error}), failing over')
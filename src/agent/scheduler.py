@@ -0,0 +1,149 @@
+import queue
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Set, Tuple
+
+from .references import CompiledArguments
+
+class ActionScheduler:
+    '''
+    Runs the actions of a plan as soon as the actions they reference are completed.
+
+    Actions are added one at a time, so that a plan can be executed while it is still being
+    received. The references of each action to the previous ones are compiled when it is added
+    and define its dependencies. Independent actions run concurrently on a thread pool, with
+    max_concurrency=1 they are run inline in the order they are added.
+
+    Args:
+        run (Callable): Function (action, compiled_arguments, state) executing an action.
+        state (dict): State where the actions are registered.
+        max_concurrency (int): Maximum number of actions running at the same time.
+        make_entry (Callable): Function returning the initial state entry of an action.
+    '''
+    def __init__(self,
+                 run: Callable[[dict, CompiledArguments, dict], None],
+                 state: dict,
+                 max_concurrency: int,
+                 make_entry: Callable[[dict], dict]):
+        self.run=run
+        self.state=state
+        self.make_entry=make_entry
+        self._executor=ThreadPoolExecutor(max_workers=max_concurrency) if max_concurrency>1 else None
+        # reentrant as the callback of an already completed future runs in the submitting thread
+        self._lock=threading.RLock()
+        self._idle=threading.Condition(self._lock)
+        self._ids: Set[str]=set()
+        self._done: Set[str]=set()
+        self._waiting: Dict[str, Tuple[dict, CompiledArguments, Set[str]]]={}
+        self._dependents: Dict[str, List[str]]=defaultdict(list)
+        self._running=0
+        # context of the caller (e.g. the current instrumentation span) where the actions are run,
+        # copied for each action as a context can be entered by one thread at a time
+        self._context=contextvars.copy_context()
+
+    def add(self, action: dict):
+        action_id=action['id']
+        if action_id in self._ids:
+            # a duplicated id can't be told apart in the graph, wait for the previous actions
+            self.join()
+            self._done.discard(action_id)
+
+        # compile the references of the action to the previous actions
+        compiled_arguments=CompiledArguments(action["function"]["arguments"], self._ids)
+        self._ids.add(action_id)
+        self.state[action_id]=self.make_entry(action)
+
+        if self._executor is None:
+            self.run(action, compiled_arguments, self.state)
+            return
+
+        with self._lock:
+            remaining={ref for ref in compiled_arguments.references if ref not in self._done}
+            if remaining:
+                self._waiting[action_id]=(action, compiled_arguments, remaining)
+                for ref in remaining:
+                    self._dependents[ref].append(action_id)
+            else:
+                self._submit(action, compiled_arguments)
+
+    def join(self):
+        '''
+        Waits till all the actions added are completed.
+        '''
+        with self._lock:
+            while self._running:
+                self._idle.wait()
+
+    def close(self):
+        self.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _submit(self, action: dict, compiled_arguments: CompiledArguments):
+        self._running+=1
+        future=self._executor.submit(self._context.copy().run, self.run, action, compiled_arguments, self.state)
+        future.add_done_callback(lambda _, action_id=action['id']: self._on_done(action_id))
+
+    def _on_done(self, action_id: str):
+        with self._lock:
+            self._running-=1
+            self._done.add(action_id)
+            # submit the actions whose dependencies are completed
+            for dependent in self._dependents.pop(action_id, []):
+                action, compiled_arguments, remaining=self._waiting[dependent]
+                remaining.discard(action_id)
+                if not remaining:
+                    del self._waiting[dependent]
+                    self._submit(action, compiled_arguments)
+            self._idle.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ToolExecutor:
+    '''
+    Bounded pool of daemon threads running the tools with a time limit.
+
+    A tool exceeding its time limit can't be interrupted and keeps its thread till it returns, so at
+    most max_workers threads are created and the next tools wait in the queue (and time out there
+    without being started if no thread becomes available). The threads don't prevent the interpreter
+    from exiting.
+
+    Args:
+        max_workers (int): Maximum number of threads.
+    '''
+    def __init__(self, max_workers: int = 32):
+        self.max_workers=max_workers
+        self._queue: queue.SimpleQueue=queue.SimpleQueue()
+        self._idle=threading.Semaphore(0)
+        self._lock=threading.Lock()
+        self._threads: List[threading.Thread]=[]
+
+    def submit(self, fn: Callable, *args, **kwargs)->Future:
+        future=Future()
+        self._queue.put((future, fn, args, kwargs))
+        # reuse an idle thread, otherwise start a new one below the limit
+        if not self._idle.acquire(blocking=False):
+            with self._lock:
+                if len(self._threads)<self.max_workers:
+                    thread=threading.Thread(target=self._work, daemon=True, name=f'tool-{len(self._threads)}')
+                    self._threads.append(thread)
+                    thread.start()
+        return future
+
+    def _work(self):
+        while True:
+            future, fn, args, kwargs=self._queue.get()
+            # a tool cancelled while waiting (timed out in the queue) is not started
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del future, fn, args, kwargs
+            self._idle.release()
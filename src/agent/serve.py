@@ -0,0 +1,336 @@
+'''
+Serving entry point running agents in pre-forked worker processes.
+
+Usage:
+    python -m agent.serve my_package.agents:WeatherAgent --workers 4 --agents 2 --port 8000
+    python -m agent.serve my_package.agents:WeatherAgent --unix /tmp/agent.sock --kwargs '{"model": "..."}'
+
+Endpoints (JSON bodies):
+    POST /chat     {"content": "...", "format": "string"|"json"|"dict"} -> {"response": ...}
+    POST /execute  {"content": "...", "run_id": "..."}                  -> {"state": {...}, "answer": ..., "run_id": ...}
+    GET  /health                                                         -> {"status": "ok", "pid": ..., "pending": ...}
+
+An invalid body is answered with 400, a failure of the provider or an invalid plan from the model
+with 502 (503 with a Retry-After header when the provider is still rate limiting after the retries).
+
+The agent class is instantiated once in the parent process before forking, so that the model catalog
+and the tool schemas are already built in the workers. Each worker hands out up to --agents clones of
+a warm agent (see AgentPool) and answers 503 with a Retry-After header when more than --max-pending
+requests are in progress (backpressure). SIGTERM or SIGINT stop accepting new connections and let the workers drain the
+requests in progress for up to --drain-timeout seconds.
+'''
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+import argparse
+import importlib
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from time import monotonic, sleep
+from typing import Callable, Tuple
+
+from .agent import BaseAgent
+from .chatbot import Formats
+from .logs import flush_logging
+from .pool import AgentPool
+from .retry import RetryError
+
+logger=logging.getLogger('agent.serve')
+
+def load_class(target: str)->type:
+    '''
+    Returns the class of a 'module:Class' or 'module.Class' target.
+    '''
+    if ':' in target:
+        module_name, class_name=target.split(':', 1)
+    else:
+        module_name, _, class_name=target.rpartition('.')
+    if not module_name:
+        raise ValueError(f'Invalid target {target}, expected module:Class')
+    return getattr(importlib.import_module(module_name), class_name)
+
+class AgentWorker:
+    '''
+    Warm agents of a worker process and accounting of the requests in progress.
+
+    Args:
+        factory (Callable): Function returning the prototype agent, cloned for the requests.
+        agents (int): Number of agents, i.e. of requests processed at the same time.
+        max_pending (int): Maximum number of requests in progress or waiting for an agent.
+    '''
+    def __init__(self, factory: Callable[[], BaseAgent], agents: int, max_pending: int):
+        self.agents=AgentPool(factory, max_size=agents)
+        self.max_pending=max_pending
+        self.pending=0
+        self.draining=False
+        self._lock=threading.Lock()
+        self._idle=threading.Condition(self._lock)
+
+    def try_enter(self)->bool:
+        with self._lock:
+            if self.draining or self.pending>=self.max_pending:
+                return False
+            self.pending+=1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.pending-=1
+            self._idle.notify_all()
+
+    def wait_idle(self, timeout: float)->bool:
+        '''
+        Waits till the requests in progress are completed, returns False if the timeout expires first.
+        '''
+        deadline=monotonic()+timeout
+        with self._lock:
+            while self.pending:
+                remaining=deadline-monotonic()
+                if remaining<=0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def handle(self, path: str, body: dict)->Tuple[int, dict]:
+        content=body.get('content')
+        if path not in ('/chat', '/execute'):
+            return 404, {'error': f'Unknown endpoint {path}'}
+        if not isinstance(content, str):
+            return 400, {'error': 'The body should contain a content string'}
+        if path=='/chat':
+            try:
+                format=Formats(body.get('format', Formats.STRING.value))
+            except ValueError:
+                return 400, {'error': f'Invalid format, expected one of {[format.value for format in Formats]}'}
+            with self.agents.agent() as agent:
+                response=agent.chat(content, format=format)
+            return 200, {'response': response}
+        if path=='/execute':
+            if not isinstance(body.get('run_id'), (str, type(None))):
+                return 400, {'error': 'The run_id should be a string'}
+            with self.agents.agent() as agent:
+                state=agent.execute(content, run_id=body.get('run_id'))
+                return 200, {'state': state,
+                             'answer': agent.answer,
+                             'run_id': agent.run_id}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version='HTTP/1.1'
+    worker: AgentWorker=None
+
+    def do_GET(self):
+        if self.path=='/health':
+            self._send(200, {'status': 'draining' if self.worker.draining else 'ok',
+                             'pid': os.getpid(),
+                             'pending': self.worker.pending})
+        else:
+            self._send(404, {'error': f'Unknown endpoint {self.path}'})
+
+    def do_POST(self):
+        try:
+            body=json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as e:
+            self._send(400, {'error': f'Invalid JSON body: {e}'})
+            return
+
+        if not self.worker.try_enter():
+            # backpressure: the client retries later, possibly on another worker
+            self._send(503, {'error': 'Too many requests in progress'}, {'Retry-After': '1'})
+            return
+        headers=None
+        try:
+            status_code, payload=self.worker.handle(self.path, body)
+        except RetryError as e:
+            # the provider is still failing after the retries (a subclass of ValueError)
+            status_code=503 if e.status_code==429 else 502
+            payload={'error': str(e), 'status_code': e.status_code}
+            headers={'Retry-After': '1'}
+        except ValueError as e:
+            # the body is validated by handle, the other errors come from the provider (e.g. an invalid
+            # key) or from the model (e.g. a plan which isn't valid)
+            status_code, payload=502, {'error': str(e)}
+        except Exception as e:
+            logger.exception(f'Request {self.path} failed')
+            status_code, payload=500, {'error': str(e)}
+        finally:
+            self.worker.leave()
+        self._send(status_code, payload, headers)
+
+    def _send(self, status_code: int, payload: dict, headers: dict = None):
+        data=json.dumps(payload, default=repr).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if self.worker.draining:
+            self.send_header('Connection', 'close')
+            self.close_connection=True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self)->str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug('%s '+format, self.address_string(), *args)
+
+class _SharedListenerMixIn:
+    # the listening socket is non-blocking: all the workers are woken up by a new connection and
+    # those losing the race get a BlockingIOError (ignored by socketserver as an OSError) instead of
+    # blocking in accept, where they wouldn't see the shutdown
+    def get_request(self):
+        connection, address=self.socket.accept()
+        connection.setblocking(True)
+        return connection, address
+
+class _TCPServer(_SharedListenerMixIn, ThreadingMixIn, HTTPServer):
+    daemon_threads=True
+
+class _UnixServer(_SharedListenerMixIn, ThreadingMixIn, UnixStreamServer):
+    daemon_threads=True
+
+def _listen(host: str, port: int, unix: str = None, backlog: int = 128)->socket.socket:
+    if unix is None:
+        return socket.create_server((host, port), backlog=backlog)
+    if os.path.exists(unix):
+        os.remove(unix)
+    listener=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(unix)
+    listener.listen(backlog)
+    return listener
+
+def _make_server(listener: socket.socket, handler: type):
+    # the listening socket is shared with the other workers, the kernel balances the connections
+    server_class=_TCPServer if listener.family!=socket.AF_UNIX else _UnixServer
+    server=server_class(listener.getsockname(), handler, bind_and_activate=False)
+    server.socket.close()
+    listener.setblocking(False)
+    server.socket=listener
+    return server
+
+def _run_worker(listener: socket.socket, factory: Callable[[], BaseAgent], args: argparse.Namespace):
+    # the parent process handles SIGINT and forwards a SIGTERM to drain the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker=AgentWorker(factory, args.agents, args.max_pending)
+    handler=type('Handler', (_Handler,), {'worker': worker})
+
+    server=_make_server(listener, handler)
+
+    def drain(signum, frame):
+        worker.draining=True
+        # shutdown waits for the serving loop, which runs in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, drain)
+
+    logger.info(f'Worker {os.getpid()} ready with {args.agents} agents')
+    server.serve_forever()
+    if not worker.wait_idle(args.drain_timeout):
+        logger.warning(f'Worker {os.getpid()} stopped with {worker.pending} requests in progress')
+    server.server_close()
+    worker.agents.close()
+
+def serve(factory: Callable[[], BaseAgent], args: argparse.Namespace):
+    '''
+    Pre-forks the workers and restarts them if they die, till SIGTERM or SIGINT.
+    '''
+    if not hasattr(os, 'fork'):
+        raise RuntimeError('agent.serve requires a platform supporting fork')
+
+    # warm the shared state (model catalog, tool schemas) before forking
+    prototype=factory()
+    if hasattr(prototype, 'close'):
+        prototype.close()
+    del prototype
+
+    listener=_listen(args.host, args.port, args.unix)
+    address=args.unix or f'http://{args.host}:{listener.getsockname()[1]}'
+    logger.info(f'Serving on {address} with {args.workers} workers')
+
+    children=set()
+    stopping=False
+
+    def spawn():
+        pid=os.fork()
+        if pid==0:
+            code=0
+            try:
+                _run_worker(listener, factory, args)
+            except Exception:
+                logger.exception('Worker failed')
+                code=1
+            finally:
+                flush_logging()
+                logging.shutdown()
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping=True
+        logger.info('Draining the workers')
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn()
+
+    stop_time=None
+    while children:
+        pid, status=os.waitpid(-1, os.WNOHANG)
+        if pid==0:
+            if stopping:
+                stop_time=stop_time or monotonic()
+                if monotonic()-stop_time>args.drain_timeout+5:
+                    # workers stuck after the drain timeout
+                    for pid in children:
+                        os.kill(pid, signal.SIGKILL)
+            sleep(0.1)
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f'Worker {pid} exited with status {status}, restarting it')
+            spawn()
+
+    listener.close()
+    if args.unix is not None and os.path.exists(args.unix):
+        os.remove(args.unix)
+    logger.info('Stopped')
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(prog='python -m agent.serve',
+                                   description='Serves an agent class from pre-forked worker processes.')
+    parser.add_argument('target', help='agent class, as module:Class')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--agents', type=int, default=2, help='warm agents per worker')
+    parser.add_argument('--max-pending', type=int, default=None, help='requests in progress per worker before answering 503 (default 2*agents)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', default=None, help='path of a Unix socket to listen on instead of TCP')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='seconds granted to the requests in progress on shutdown')
+    parser.add_argument('--kwargs', default='{}', help='JSON keyword arguments of the agent class')
+    parser.add_argument('--log-level', default='INFO')
+    args=parser.parse_args(argv)
+    if args.max_pending is None:
+        args.max_pending=2*args.agents
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s [%(levelname)s] %(process)d %(message)s')
+    sys.path.insert(0, os.getcwd())
+    agent_class=load_class(args.target)
+    kwargs=json.loads(args.kwargs)
+    serve(lambda: agent_class(**kwargs), args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,266 @@
+import json
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Union
+
+DONE='[DONE]'
+
+class SSEParser:
+    '''
+    Incremental parser of a server-sent events stream.
+
+    Lines are fed one at a time and the data payload of an event is returned once the event is
+    complete (i.e. on the blank line terminating it). Comment lines (starting with ':'), used by
+    OpenRouter as keep-alive, are ignored.
+    '''
+    def __init__(self):
+        self._data: List[str]=[]
+
+    def feed(self, line: Union[str, bytes])->Optional[str]:
+        if isinstance(line, bytes):
+            line=line.decode('utf-8')
+        line=line.rstrip('\r\n')
+
+        if line=='':
+            return self.flush()
+        if line.startswith(':'):
+            return None
+
+        field, _, value=line.partition(':')
+        if value.startswith(' '):
+            value=value[1:]
+        if field=='data':
+            self._data.append(value)
+        return None
+
+    def flush(self)->Optional[str]:
+        if not self._data:
+            return None
+        data='\n'.join(self._data)
+        self._data=[]
+        return data
+
+def iter_sse_events(lines: Iterable[Union[str, bytes]])->Iterator[str]:
+    '''
+    Yields the data payloads of the events of a server-sent events stream till [DONE].
+    '''
+    parser=SSEParser()
+    for line in lines:
+        data=parser.feed(line)
+        if data is not None:
+            if data==DONE:
+                return
+            yield data
+
+    data=parser.flush()
+    if data is not None and data!=DONE:
+        yield data
+
+class ToolCallAssembler:
+    '''
+    Assembles the tool calls of a streamed completion from their deltas.
+
+    Each delta carries the index of the tool call it belongs to and fragments of its id, name and
+    arguments, which are concatenated in order of arrival.
+    '''
+    def __init__(self):
+        self._tool_calls: dict={}
+
+    def feed(self, deltas: List[dict]):
+        for delta in deltas:
+            index=delta.get('index', len(self._tool_calls))
+            tool_call=self._tool_calls.setdefault(index, {'id': '',
+                                                          'type': 'function',
+                                                          'function': {'name': '', 'arguments': ''}})
+            if delta.get('id'):
+                tool_call['id']+=delta['id']
+            if delta.get('type'):
+                tool_call['type']=delta['type']
+
+            function=delta.get('function') or {}
+            if function.get('name'):
+                tool_call['function']['name']+=function['name']
+            if function.get('arguments'):
+                tool_call['function']['arguments']+=function['arguments']
+
+    @property
+    def tool_calls(self)->List[dict]:
+        return [self._tool_calls[index] for index in sorted(self._tool_calls)]
+
+class JSONArrayStreamParser:
+    '''
+    Incremental parser returning the elements of the first JSON array of objects in a text, as soon
+    as each of them is complete.
+
+    Text before the array (e.g. prose or a code fence) is ignored, so that the actions of a plan can
+    be executed while the rest of the plan is still being generated. Malformed elements are skipped
+    and collected in ``errors``.
+    '''
+    def __init__(self):
+        self._buffer=''
+        self._pos=0
+        self._opening=False
+        self._in_array=False
+        self._depth=0
+        self._in_string=False
+        self._escape=False
+        self._start=0
+        self.done=False
+        self.count=0
+        self.errors: List[str]=[]
+
+    def feed(self, chunk: str)->List[Any]:
+        '''
+        Feeds a chunk of text and returns the elements completed by it.
+        '''
+        elements=[]
+        if self.done:
+            return elements
+
+        buffer=self._buffer+chunk
+        i=self._pos
+        while i<len(buffer):
+            char=buffer[i]
+            if not self._in_array:
+                if self._opening and not char.isspace():
+                    # an array is started only by [ followed by {
+                    self._opening=False
+                    if char=='{':
+                        self._in_array=True
+                        self._depth=1
+                        continue
+                if char=='[':
+                    self._opening=True
+                i+=1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape=False
+                elif char=='\\':
+                    self._escape=True
+                elif char=='"':
+                    self._in_string=False
+            elif char=='"':
+                self._in_string=True
+            elif char in '[{':
+                if self._depth==1:
+                    self._start=i
+                self._depth+=1
+            elif char in ']}':
+                self._depth-=1
+                if self._depth==1:
+                    element=buffer[self._start:i+1]
+                    try:
+                        elements.append(json.loads(element))
+                        self.count+=1
+                    except ValueError:
+                        self.errors.append(element)
+                    # drop the consumed text
+                    buffer=buffer[i+1:]
+                    i=0
+                    continue
+                if self._depth==0:
+                    self.done=True
+                    break
+            i+=1
+
+        if self._in_array:
+            self._buffer=buffer
+            self._pos=i
+        else:
+            # outside the array only the last character matters
+            self._buffer=''
+            self._pos=0
+        return elements
+
+class _ChatStreamState:
+    def __init__(self):
+        self.content=''
+        self.tool_call_assembler=ToolCallAssembler()
+        self.finish_reason=None
+        self.usage=None
+
+    @property
+    def tool_calls(self)->List[dict]:
+        return self.tool_call_assembler.tool_calls
+
+    def _consume(self, data: str)->str:
+        chunk=json.loads(data)
+        if 'error' in chunk:
+            raise ValueError(f'Error in querying LLM: {chunk["error"]["message"]}')
+
+        if chunk.get('usage'):
+            self.usage=chunk['usage']
+        if not chunk.get('choices'):
+            return ''
+
+        choice=chunk['choices'][0]
+        if choice.get('finish_reason'):
+            self.finish_reason=choice['finish_reason']
+
+        delta=choice.get('delta') or {}
+        if delta.get('tool_calls'):
+            self.tool_call_assembler.feed(delta['tool_calls'])
+
+        content=delta.get('content') or ''
+        self.content+=content
+        return content
+
+class ChatStream(_ChatStreamState):
+    '''
+    Iterator over the content deltas of a streamed chat completion.
+
+    Once the stream is exhausted the full ``content``, the assembled ``tool_calls``, the
+    ``finish_reason`` and the ``usage`` of the completion are available as attributes.
+
+    Args:
+        lines (Iterable): Lines of the server-sent events stream.
+        close (Callable): Optional callback releasing the underlying connection.
+    '''
+    def __init__(self, lines: Iterable[Union[str, bytes]], close: Callable=None):
+        super().__init__()
+        self._lines=lines
+        self._close=close
+
+    def __iter__(self)->Iterator[str]:
+        try:
+            for data in iter_sse_events(self._lines):
+                content=self._consume(data)
+                if content:
+                    yield content
+        finally:
+            if self._close is not None:
+                self._close()
+
+class AsyncChatStream(_ChatStreamState):
+    '''
+    Async iterator over the content deltas of a streamed chat completion.
+
+    Args:
+        lines (AsyncIterator): Lines of the server-sent events stream.
+    '''
+    def __init__(self, lines: AsyncIterator[Union[str, bytes]]):
+        super().__init__()
+        self._lines=lines
+
+    async def __aiter__(self)->AsyncIterator[str]:
+        parser=SSEParser()
+        try:
+            async for line in self._lines:
+                data=parser.feed(line)
+                if data is None:
+                    continue
+                if data==DONE:
+                    return
+                content=self._consume(data)
+                if content:
+                    yield content
+
+            data=parser.flush()
+            if data is not None and data!=DONE:
+                content=self._consume(data)
+                if content:
+                    yield content
+        finally:
+            # release the connection if the iteration is interrupted
+            if hasattr(self._lines, 'aclose'):
+                await self._lines.aclose()
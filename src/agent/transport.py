@@ -0,0 +1,178 @@
+import json
+import asyncio
+import threading
+from typing import AsyncIterator, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+
+class HTTPSession:
+    '''
+    Pooled keep-alive HTTP session used by the sync request helpers.
+
+    Wraps a ``requests.Session`` mounted with a connection pool, so that consecutive requests to
+    the same host reuse the TCP/TLS connection. The same instance can be shared by several
+    chatbots of the process.
+
+    Args:
+        pool_connections (int): Number of hosts for which a connection pool is kept.
+        pool_maxsize (int): Maximum number of connections kept per host.
+        keep_alive (bool): If False connections are closed after each request.
+        connect_timeout (float): Connection timeout in seconds.
+        read_timeout (float): Read timeout in seconds.
+        compression (bool): If True gzip/deflate compressed responses are requested.
+    '''
+    def __init__(self,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 keep_alive: bool = True,
+                 connect_timeout: float = 10,
+                 read_timeout: float = 300,
+                 compression: bool = True):
+        self.timeout=(connect_timeout, read_timeout)
+        self.adapter=HTTPAdapter(pool_connections=pool_connections,
+                                 pool_maxsize=pool_maxsize)
+        
+        self.session=requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers['Connection']='keep-alive' if keep_alive else 'close'
+        self.session.headers['Accept-Encoding']='gzip, deflate' if compression else 'identity'
+
+        self._lock=threading.Lock()
+        self._requests=0
+
+    def request(self, method: str, url: Union[str, bytes], *args, **kwargs)->requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self._requests+=1
+        return self.session.request(method, url, *args, **kwargs)
+
+    def get(self, url: Union[str, bytes], *args, **kwargs)->requests.Response:
+        return self.request('GET', url, *args, **kwargs)
+
+    def post(self, url: Union[str, bytes], *args, **kwargs)->requests.Response:
+        return self.request('POST', url, *args, **kwargs)
+
+    def stats(self)->dict:
+        '''
+        Returns the connection pool metrics: number of requests, connections opened, connections
+        reused and the ratio of requests served by an already open connection.
+        '''
+        pools=self.adapter.poolmanager.pools
+        pool_requests=0
+        connections=0
+        for key in pools.keys():
+            pool=pools[key]
+            pool_requests+=pool.num_requests
+            connections+=pool.num_connections
+
+        reused=max(pool_requests-connections, 0)
+        return {'requests': self._requests,
+                'connections': connections,
+                'reused': reused,
+                'pool_hit_rate': reused/pool_requests if pool_requests else 0.0}
+
+    def close(self):
+        self.session.close()
+
+class AsyncHTTPClient:
+    '''
+    Pooled keep-alive HTTP client used by the async chat path.
+
+    The underlying ``aiohttp.ClientSession`` is created lazily inside the running event loop and
+    re-created if the client is used from a different loop. Connections are kept alive and reused
+    across requests, so a single event loop can drive many concurrent conversations.
+
+    Args:
+        limit (int): Maximum number of simultaneous connections.
+        limit_per_host (int): Maximum number of simultaneous connections to the same host (0 for no limit).
+        keepalive_timeout (float): Seconds an idle connection is kept open.
+        timeout (float): Total timeout of a request in seconds.
+    '''
+    def __init__(self,
+                 limit: int = 100,
+                 limit_per_host: int = 0,
+                 keepalive_timeout: float = 30,
+                 timeout: float = 300):
+        self.limit=limit
+        self.limit_per_host=limit_per_host
+        self.keepalive_timeout=keepalive_timeout
+        self.timeout=timeout
+        self._session=None
+        self._loop=None
+
+    def _get_session(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError('The async client requires aiohttp. Install it with `pip install agent[async]`') from e
+
+        loop=asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is not loop:
+            self._discard_session()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector=aiohttp.TCPConnector(limit=self.limit,
+                                           limit_per_host=self.limit_per_host,
+                                           keepalive_timeout=self.keepalive_timeout)
+            self._session=aiohttp.ClientSession(connector=connector,
+                                                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop=loop
+        return self._session
+
+    def _discard_session(self):
+        # a session can only be closed by the event loop it was created in
+        session, loop=self._session, self._loop
+        self._session=None
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        elif not loop.is_closed():
+            loop.run_until_complete(session.close())
+        else:
+            # the loop is gone (e.g. a previous asyncio.run): detach the session and mark its connector
+            # closed; the connections of a closed loop can't be shut down and are released with it
+            connector=session.connector
+            session.detach()
+            if connector is not None:
+                connector._close()
+
+    async def request(self, method: str, url: Union[str, bytes], **kwargs)->Tuple[Optional[dict], int, dict]:
+        '''
+        Performs a request and returns the decoded JSON body (None if the body is not JSON), 
+        the status code and the headers.
+
+        Raises:
+            ConnectionError: If the connection fails.
+        '''
+        import aiohttp
+
+        session=self._get_session()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                text=await response.text()
+                try:
+                    data=json.loads(text)
+                except ValueError:
+                    data=None
+                return data, response.status, response.headers.copy()
+        except aiohttp.ClientError as e:
+            raise ConnectionError(str(e)) from e
+
+    async def stream_lines(self, method: str, url: Union[str, bytes], **kwargs)->AsyncIterator[bytes]:
+        '''
+        Performs a request and yields the lines of the response body as they arrive.
+
+        Raises:
+            ValueError: If the response status is not 200.
+        '''
+        session=self._get_session()
+        async with session.request(method, url, **kwargs) as response:
+            if response.status != 200:
+                raise ValueError(f'Error {response.status}: {await response.text()}')
+            async for line in response.content:
+                yield line
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session=None
+        self._loop=None
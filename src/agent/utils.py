@@ -1,35 +1,137 @@
+import re
 import json
-from typing import List, Callable, Union
+from typing import List, Callable, Iterator, Union
 import pickle
 from types import SimpleNamespace
 from functools import wraps
 import inspect
 
 from .models import FunctionCall, ToolCall, Tool, Property, Function, Parameters, Descriptions
+from .cache import BaseCache, MISS, make_key
+
+_FENCED_BLOCK=re.compile(r'```[a-zA-Z]*[ \t]*\n(.*?)```', re.DOTALL)
+
+def is_structured(value)->bool:
+    '''
+    Returns True for a JSON object or a non-empty array of objects, as a plan or a record.
+    '''
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, list) and len(value)>0 and all(isinstance(item, dict) for item in value)
+
+def extract_json(string: str, accept: Callable = is_structured):
+    '''
+    Returns the JSON value embedded in the string: the first fenced code block holding an accepted
+    value, otherwise the first accepted value in the text. By default only objects and arrays of
+    objects are accepted, so that bracketed prose (e.g. "Step [1]") is skipped.
+
+    Raises:
+        ValueError: If the string doesn't contain any accepted JSON value.
+    '''
+    for block in _FENCED_BLOCK.findall(string):
+        try:
+            value=json.loads(block)
+        except ValueError:
+            continue
+        if accept(value):
+            return value
+
+    decoder=json.JSONDecoder()
+    start=0
+    while True:
+        # first candidate opening bracket
+        starts=[index for index in (string.find('[', start), string.find('{', start)) if index>=0]
+        if not starts:
+            raise ValueError('No JSON array or object found')
+        start=min(starts)
+        try:
+            value, _=decoder.raw_decode(string, start)
+            if accept(value):
+                return value
+        except ValueError:
+            pass
+        start+=1
 
 def to_json(string: str):
-    string = string.replace('\n```', '')
-    string = string.replace('```json\n', '')
-    return json.dumps(string, indent=2)
+    return json.dumps(to_dict(string), indent=2)
 
 def to_dict(string: str):
-    string = string.replace('\n```', '')
-    string = string.replace('```json\n', '')
-    return json.loads(string)
+    try:
+        # fast path for a response made only of (fenced) JSON
+        string_=string.replace('\n```', '')
+        string_=string_.replace('```json\n', '')
+        return json.loads(string_)
+    except ValueError:
+        return extract_json(string)
+
+def to_plan(value)->List[dict]:
+    '''
+    Returns the actions of a plan (an action or a list of actions) after checking their shape.
+
+    Raises:
+        ValueError: If the value is not a list of actions with an id and a function name.
+    '''
+    actions=[value] if isinstance(value, dict) else value
+    if not isinstance(actions, list):
+        raise ValueError(f'Invalid plan, expected a list of actions: {str(value)[:200]}')
+    for action in actions:
+        if not (isinstance(action, dict)
+                and isinstance(action.get('id'), str)
+                and isinstance(action.get('function'), dict)
+                and isinstance(action['function'].get('name'), str)):
+            raise ValueError(f'Invalid action, expected an id and a function name: {str(action)[:200]}')
+        arguments=action['function'].get('arguments')
+        if isinstance(arguments, str):
+            # arguments encoded as a JSON string, as in the native tool calls
+            arguments=json.loads(arguments) if arguments.strip() else {}
+        if arguments is None:
+            arguments={}
+        if not isinstance(arguments, dict):
+            raise ValueError(f'Invalid arguments of the action {action["id"]}')
+        action['function']['arguments']=arguments
+    return actions
+
+def flatten_dict(dictionary: dict, sep: str = '_', prefix: str = '')->dict:
+    '''
+    Flattens the nested dictionaries joining the keys with sep, with the same keys and order as 
+    pandas.json_normalize (the top level fields come first and empty dictionaries are dropped).
+    '''
+    flat={}
+    nested={}
+    for key, value in dictionary.items():
+        key=f'{prefix}{sep}{key}' if prefix else key
+        if isinstance(value, dict):
+            nested.update(flatten_dict(value, sep, key))
+        elif prefix:
+            nested[key]=value
+        else:
+            flat[key]=value
+    flat.update(nested)
+    return flat
 
-def parse_tool_calls(tool_calls: str) -> List[ToolCall]:
+def to_dataframe(records: List[dict]):
+    '''
+    Converts a list of records to a pandas DataFrame, pandas is imported only when needed.
+    '''
     try:
-        # Convert JSON string to Python list
-        data = json.loads(tool_calls)
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError('DataFrames require pandas. Install it with `pip install agent[pandas]`') from e
+    return pd.DataFrame.from_records(records)
+
+def parse_tool_calls(tool_calls: Union[str, list]) -> List[ToolCall]:
+    try:
+        # Convert JSON string to Python list, the tool_calls of a response are already decoded
+        data = json.loads(tool_calls) if isinstance(tool_calls, str) else tool_calls
         tool_calls = []
 
         # Loop through each item in the list
         for item in data:
             func = item.get("function", {})
-            arguments_str = func.get("arguments", "{}")
+            arguments_str = func.get("arguments") or "{}"
             
             # Parse the arguments JSON string into a dictionary
-            arguments = json.loads(arguments_str)
+            arguments = json.loads(arguments_str) if isinstance(arguments_str, str) else arguments_str
 
             # Create Function and ToolCall instances
             function = FunctionCall(name=func.get("name"), arguments=arguments)
@@ -91,7 +193,26 @@ def load_pickle(file_path):
 def dict_to_object(dictionary: dict):
     return json.loads(json.dumps(dictionary), object_hook=lambda d: SimpleNamespace(**d))
 
-def generate_tool(descriptions: Descriptions):
+def generate_tool(descriptions: Descriptions,
+                  cache: BaseCache=None,
+                  cache_key: Callable=None,
+                  timeout: float=None,
+                  instance_key: Callable=None):
+    '''
+    Decorator turning a method into a tool available to the agent.
+
+    Args:
+        descriptions (Descriptions): Descriptions of the function and of its arguments.
+        cache (BaseCache): Optional cache (e.g. MemoryCache or SQLiteCache) memoizing the results of the tool.
+            The key is made of the function and its arguments, so the cache is shared by all the instances
+            unless instance_key is provided. Iterators (e.g. of generator tools) are never cached.
+        cache_key (Callable): Optional normalizer of the arguments dictionary applied before computing 
+            the cache key (e.g. round_floats(2) to round coordinates).
+        timeout (float): Optional time limit of the tool in seconds when it is called by the agent,
+            overriding the tool_timeout of the agent.
+        instance_key (Callable): Optional function of the instance returning the settings the results
+            depend on (e.g. lambda self: self.units), added to the cache key.
+    '''
     def decorator(func: Callable):
         sig = inspect.signature(func)
         properties = {}
@@ -126,10 +247,40 @@ def generate_tool(descriptions: Descriptions):
             )
         )
 
-        # Wrapping the function with the tool functionality
+        # Wrapping the function with the tool functionality, the iterators of a generator can't be cached
+        if cache is None or inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return func(*args, **kwargs)
+            
+            wrapper.timeout=timeout
+            return wrapper
+
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
+        def cached_wrapper(*args, **kwargs):
+            try:
+                bound=sig.bind(*args, **kwargs)
+            except TypeError:
+                # let the function raise the error
+                return func(*args, **kwargs)
+            bound.apply_defaults()
+            arguments={name: value for name, value in bound.arguments.items() if name not in ['self', 'cls']}
+            if cache_key is not None:
+                arguments=cache_key(arguments)
+            
+            key_parts=[func.__module__, func.__qualname__, arguments]
+            if instance_key is not None and args:
+                key_parts.append(instance_key(args[0]))
+            key=make_key(*key_parts)
+            result=cache.get(key)
+            if result is MISS:
+                result=func(*args, **kwargs)
+                # an iterator would be cached exhausted (and can't be pickled)
+                if not isinstance(result, Iterator):
+                    cache.set(key, result)
+            return result
 
-        return wrapper
+        cached_wrapper.cache=cache
+        cached_wrapper.timeout=timeout
+        return cached_wrapper
     return decorator
@@ -0,0 +1,37 @@
+import time
+import logging
+
+from agent.agent import OpenRouterAgent
+from agent.utils import generate_tool
+from agent.models import Descriptions
+from benchmarks.stub_server import PAID_MODEL
+
+class StubAgent(OpenRouterAgent):
+    '''
+    Agent of the tests, to be pointed at a StubOpenRouterServer with base_url.
+    '''
+    def __init__(self, **kwargs):
+        kwargs.setdefault('model', PAID_MODEL)
+        super().__init__('You are a test agent.', 'test-key', verbose=logging.CRITICAL, **kwargs)
+        self.calls=[]
+
+    @generate_tool(Descriptions('Adds two numbers.', {'a': 'first number', 'b': 'second number'}))
+    def add(self, a, b):
+        self.calls.append(('add', a, b))
+        return a+b
+
+    @generate_tool(Descriptions('Returns its argument.', {'value': 'value to return'}))
+    def echo(self, value):
+        self.calls.append(('echo', value))
+        return value
+
+    @generate_tool(Descriptions('Sleeps and returns the seconds slept.', {'seconds': 'seconds to sleep'}))
+    def slow(self, seconds):
+        self.calls.append(('slow', seconds))
+        time.sleep(seconds)
+        return seconds
+
+    @generate_tool(Descriptions('Returns the first numbers.', {'n': 'count of numbers'}))
+    def numbers(self, n):
+        for i in range(n):
+            yield i
@@ -0,0 +1,25 @@
+import pytest
+
+from benchmarks.stub_server import StubOpenRouterServer
+from tests.agents import StubAgent
+
+@pytest.fixture
+def stub():
+    '''
+    Returns a function starting a StubOpenRouterServer, stopped at the end of the test.
+    '''
+    servers=[]
+    def start(**kwargs)->StubOpenRouterServer:
+        server=StubOpenRouterServer(**kwargs).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def agent(stub):
+    server=stub()
+    agent=StubAgent(base_url=server.base_url)
+    yield agent
+    agent.close()
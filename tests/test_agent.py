@@ -0,0 +1,49 @@
+import json
+
+from agent.agent import BaseAgent, StatusCode
+from agent.utils import generate_tool
+from agent.models import Descriptions
+
+class LocalAgent(BaseAgent):
+    '''
+    Agent without a chatbot, running the plans it is given.
+    '''
+    @generate_tool(Descriptions('Adds two numbers.', {'a': 'first number', 'b': 'second number'}))
+    def add(self, a, b):
+        return a+b
+
+def test_base_agent_without_chatbot():
+    agent=LocalAgent('You add numbers.')
+    actions=[{'id': 'a', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}},
+             {'id': 'b', 'function': {'name': 'add', 'arguments': {'a': '$a', 'b': 3}}}]
+    state=agent.call(actions)
+    assert state['b']['status']==StatusCode.SUCCESS.value and state['b']['result']==6
+    assert agent.call(actions, timeout=5)['b']['result']==6
+    assert agent.get_metrics()=={}
+    assert agent.clone().call(actions, state={})['b']['result']==6
+
+def test_tool_results_behind_handles_are_sent_to_the_model(agent):
+    from agent.blobs import BlobStore
+    agent.blob_store=BlobStore(threshold=100)
+    state=agent.call([{'id': 'n', 'function': {'name': 'numbers', 'arguments': {'n': 5}}},
+                      {'id': 's', 'function': {'name': 'add', 'arguments': {'a': 'x'*200, 'b': 'y'}}}])
+    assert agent._get_tool_result(state['n'])=='[0, 1, 2, 3, 4]'
+    assert agent._get_tool_result(state['s'])==json.dumps('x'*200+'y')
+
+    agent.max_tool_result_length=10
+    state=agent.call([{'id': 'n', 'function': {'name': 'numbers', 'arguments': {'n': 10**9}}}])
+    # only the items fitting in the tool message are read from the iterator
+    result=agent._get_tool_result(state['n'])
+    assert result.startswith('[0, 1, 2') and result.endswith('more characters)')
+    assert state['n']['result'].count<10
+    assert agent._get_tool_result({'status': StatusCode.TIMEOUT.value, 'result': None})=='{"status": "timeout"}'
+
+def test_state_keeps_the_references_of_the_arguments(agent):
+    from agent.blobs import BlobStore, BlobHandle
+    agent.blob_store=BlobStore(threshold=100)
+    state=agent.call([{'id': 'a', 'function': {'name': 'echo', 'arguments': {'value': 'x'*200}}},
+                      {'id': 'b', 'function': {'name': 'add', 'arguments': {'a': '$a', 'b': 'y'}}}])
+    assert isinstance(state['a']['result'], BlobHandle)
+    assert agent.calls[-1]==('add', 'x'*200, 'y')
+    # the value loaded from the handle isn't kept in the state
+    assert state['b']['action']['function']['arguments']=={'a': '$a', 'b': 'y'}
@@ -0,0 +1,48 @@
+import asyncio
+
+from agent.agent import StatusCode
+from agent.transport import AsyncHTTPClient
+from tests.agents import StubAgent
+
+PLAN_A=[{'id': 'a', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}},
+        {'id': 'b', 'function': {'name': 'slow', 'arguments': {'seconds': 0.2}}}]
+PLAN_B=[{'id': 'c', 'function': {'name': 'add', 'arguments': {'a': 10, 'b': 20}}},
+        {'id': 'd', 'function': {'name': 'add', 'arguments': {'a': '$c', 'b': 1}}}]
+
+def _run(agent: StubAgent, *coroutines)->list:
+    async def run():
+        try:
+            return await asyncio.gather(*coroutines)
+        finally:
+            await agent.aclose()
+    try:
+        return asyncio.run(run())
+    finally:
+        agent.close()
+
+def test_aexecute(stub):
+    agent=StubAgent(base_url=stub(plans=[PLAN_B]).base_url)
+    state,=_run(agent, agent.aexecute('run the plan'))
+    assert state['d']['status']==StatusCode.SUCCESS.value and state['d']['result']==31
+
+def test_concurrent_aexecute_have_their_own_state(stub):
+    agent=StubAgent(base_url=stub(plans=[PLAN_A, PLAN_B]).base_url)
+    states=_run(agent, agent.aexecute('first'), agent.aexecute('second'))
+    assert sorted(sorted(state) for state in states)==[['a', 'b'], ['c', 'd']]
+    for state in states:
+        assert all(entry['status']==StatusCode.SUCCESS.value for entry in state.values())
+
+def test_achat(stub):
+    agent=StubAgent(base_url=stub(text='hello').base_url)
+    assert _run(agent, agent.achat('hi'))==['hello']
+
+def test_session_of_a_previous_loop_is_closed(stub):
+    server=stub()
+    client=AsyncHTTPClient()
+    async def request():
+        await client.request('GET', server.base_url+'/models')
+        return client._session
+    first=asyncio.run(request())
+    second=asyncio.run(request())
+    asyncio.run(client.close())
+    assert first is not second and first.closed and second.closed
@@ -0,0 +1,90 @@
+import logging
+from time import sleep
+
+import pytest
+
+from agent.agent import OpenRouterAgent
+from agent.cache import BaseCache, MemoryCache, SQLiteCache, MISS, make_key, round_floats
+from agent.models import Descriptions
+from agent.utils import generate_tool
+from benchmarks.stub_server import PAID_MODEL
+
+def test_base_cache_is_abstract():
+    with pytest.raises(TypeError):
+        BaseCache()
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_lru_eviction_and_ttl(backend, tmp_path):
+    def make(**kwargs)->BaseCache:
+        return MemoryCache(**kwargs) if backend=='memory' else SQLiteCache(str(tmp_path/'cache.db'), **kwargs)
+
+    cache=make(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', {'value': 2})
+    sleep(0.01)
+    # a is the most recently used once read, b is evicted
+    assert cache.get('a')==1
+    sleep(0.01)
+    cache.set('c', None)
+    assert cache.get('b') is MISS and cache.get('c') is None and len(cache)==2
+    assert cache.stats()=={'hits': 2, 'misses': 1, 'hit_rate': 2/3}
+    cache.clear()
+    assert len(cache)==0
+
+    cache=make(ttl=0.05)
+    cache.set('a', 1)
+    assert cache.get('a')==1
+    sleep(0.1)
+    assert cache.get('a') is MISS
+
+def test_sqlite_cache_is_persistent(tmp_path):
+    path=str(tmp_path/'cache.db')
+    SQLiteCache(path).set(make_key('f', {'x': 1}), [1, 2])
+    assert SQLiteCache(path).get(make_key('f', {'x': 1}))==[1, 2]
+
+def test_round_floats():
+    normalize=round_floats(2)
+    assert normalize({'lat': 45.4642, 'points': [(1.005, 2), {'lon': 9.18999}], 'name': 'x'})==\
+           {'lat': 45.46, 'points': [[1.0, 2], {'lon': 9.19}], 'name': 'x'}
+    assert make_key(normalize({'lat': 45.4642}))==make_key(normalize({'lat': 45.4639}))
+
+class CachedAgent(OpenRouterAgent):
+    results=MemoryCache()
+    numbers_cache=SQLiteCache(':memory:')
+
+    def __init__(self, units: str, **kwargs):
+        super().__init__('You are a test agent.', 'test-key', PAID_MODEL, logging.CRITICAL, **kwargs)
+        self.units=units
+        self.calls=0
+
+    @generate_tool(Descriptions('Converts a temperature.', {'celsius': 'temperature'}),
+                   cache=results, cache_key=round_floats(1), instance_key=lambda self: self.units)
+    def convert(self, celsius: float):
+        self.calls+=1
+        return celsius if self.units=='C' else celsius*9/5+32
+
+    @generate_tool(Descriptions('Returns the first numbers.', {'n': 'count of numbers'}), cache=numbers_cache)
+    def numbers(self, n: int):
+        yield from range(n)
+
+    @generate_tool(Descriptions('Returns the first numbers.', {'n': 'count of numbers'}), cache=numbers_cache)
+    def numbers_iterator(self, n: int):
+        self.calls+=1
+        return iter(range(n))
+
+def test_tool_cache(stub):
+    base_url=stub().base_url
+    celsius, fahrenheit=CachedAgent('C', base_url=base_url), CachedAgent('F', base_url=base_url)
+    try:
+        assert celsius.convert(10.01)==10.01 and celsius.convert(10.04)==10.01
+        assert celsius.calls==1
+        # the instances with other settings don't share the results
+        assert fahrenheit.convert(10.0)==50.0 and fahrenheit.calls==1
+
+        # the iterators are returned fresh and never cached
+        assert list(celsius.numbers(3))==list(celsius.numbers(3))==[0, 1, 2]
+        assert list(celsius.numbers_iterator(3))==list(celsius.numbers_iterator(3))==[0, 1, 2]
+        assert celsius.calls==3 and len(CachedAgent.numbers_cache)==0
+    finally:
+        celsius.close()
+        fahrenheit.close()
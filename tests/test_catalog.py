@@ -0,0 +1,30 @@
+from benchmarks.stub_server import MODELS, PAID_MODEL
+from agent.chatbot import OpenRouterChatbot
+from agent.catalog import ModelCatalog
+
+def test_catalog_per_endpoint(stub):
+    openrouter=stub()
+    local=stub(models=[{'id': 'local/llama', 'pricing': {'prompt': '0', 'completion': '0'}}])
+    chatbot=OpenRouterChatbot(PAID_MODEL, 'test-key', base_url=openrouter.base_url)
+    local_chatbot=OpenRouterChatbot('local/llama', 'test-key', base_url=local.base_url+'/')
+    try:
+        assert chatbot.get_model_list()==sorted(model['id'] for model in MODELS)
+        assert local_chatbot.get_model_list()==['local/llama'] and local_chatbot.is_model_free
+        # the chatbots of an endpoint share its catalog
+        assert OpenRouterChatbot('local/llama', 'test-key', base_url=local.base_url).catalog is local_chatbot.catalog
+    finally:
+        chatbot.close()
+        local_chatbot.close()
+
+def test_catalog_is_fetched_once_per_ttl():
+    catalog=ModelCatalog(ttl=60)
+    fetches=[]
+    def fetch():
+        fetches.append(1)
+        return MODELS
+    assert catalog.get_index(fetch)[PAID_MODEL]==MODELS[0]
+    catalog.get_models(fetch)
+    assert len(fetches)==1
+    catalog.invalidate()
+    catalog.get_models(fetch)
+    assert len(fetches)==2
@@ -0,0 +1,53 @@
+from agent.models import Message
+from agent.conversation import Session
+
+def _count_tokens(content: str)->int:
+    return 10
+
+def _tool_call(call_id: str)->dict:
+    return {'id': call_id, 'type': 'function', 'function': {'name': 'add', 'arguments': '{}'}}
+
+def test_window_keeps_the_last_messages():
+    session=Session('system', max_tokens=30, count_tokens=_count_tokens)
+    for i in range(5):
+        session.add('user', str(i))
+    assert [message.content for message in session.messages()]==['system', '3', '4']
+    assert session.tokens==30 and len(session)==5
+
+def test_tool_calls_leave_the_window_with_their_results():
+    session=Session(max_tokens=40, count_tokens=_count_tokens)
+    session.add('user', 'question')
+    session.append(Message('assistant', '', tool_calls=[_tool_call('a'), _tool_call('b')]))
+    session.append(Message('tool', '1', tool_call_id='a'))
+    session.append(Message('tool', '2', tool_call_id='b'))
+    session.add('assistant', 'answer')
+    messages=session.messages()
+    # the assistant message can't leave the window without its results
+    assert [message.role for message in messages]==['assistant', 'tool', 'tool', 'assistant']
+
+    session.add('user', 'next question')
+    messages=session.messages()
+    assert [message.role for message in messages]==['assistant', 'user']
+    assert session.tokens==20
+
+def test_tool_calls_are_kept_while_their_results_are_the_last_messages():
+    session=Session(max_tokens=10, count_tokens=_count_tokens)
+    session.add('user', 'question')
+    session.append(Message('assistant', '', tool_calls=[_tool_call('a')]))
+    session.append(Message('tool', '1', tool_call_id='a'))
+    assert [message.role for message in session.messages()]==['assistant', 'tool']
+
+def test_summary_of_the_evicted_messages():
+    summaries=[]
+    def summarize(summary, messages):
+        summaries.append([message.content for message in messages])
+        return 'summary'
+    session=Session(max_tokens=40, count_tokens=_count_tokens, summarize=summarize)
+    for i in range(5):
+        session.add('user', str(i))
+    messages=session.messages()
+    # the summary takes room in the window, the message it evicts is summarized in the same request
+    assert summaries==[['0'], ['1']]
+    assert [message.content for message in messages][1:]==['2', '3', '4'] and 'summary' in messages[0].content
+    session.messages()
+    assert summaries==[['0'], ['1']]
@@ -0,0 +1,78 @@
+import json
+
+from agent.agent import StatusCode
+from agent.journal import Journal
+
+PLAN=[{'id': 'a', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}},
+      {'id': 'b', 'function': {'name': 'add', 'arguments': {'a': '$a', 'b': 10}}}]
+
+def test_execute_records_the_run_and_replays_it(stub, tmp_path):
+    from tests.agents import StubAgent
+    server=stub(plans=[PLAN])
+    agent=StubAgent(base_url=server.base_url)
+    agent.journal=Journal(str(tmp_path/'runs.jsonl'))
+    try:
+        state=agent.execute('run the plan')
+        run=agent.journal.open_run(agent.run_id)
+        assert run.finished and run.content=='run the plan' and run.actions==PLAN
+        assert run.results['b']=={'status': StatusCode.SUCCESS.value, 'result': 13, 'restorable': True}
+
+        # the plan is run again without requesting the model
+        agent.calls.clear()
+        replayed=agent.replay(agent.run_id)
+        assert server.requests==1
+        assert replayed['b']['result']==state['b']['result']==13
+        assert agent.calls==[('add', 1, 2), ('add', 3, 10)]
+    finally:
+        agent.journal.close()
+        agent.close()
+
+def test_resume_restores_the_completed_actions(agent, tmp_path):
+    journal=Journal(str(tmp_path/'runs.jsonl'))
+    # a run interrupted after its first action
+    run=journal.open_run()
+    run.record_plan(PLAN, 'run the plan')
+    run.record('a', {'status': StatusCode.SUCCESS.value, 'result': 3})
+    agent.journal=journal
+    try:
+        state=agent.resume(run.run_id)
+        assert agent.calls==[('add', 3, 10)]
+        assert state['a']['result']==3 and state['b']['result']==13
+        assert journal.open_run(run.run_id).finished
+        # execute with the run id resumes the run too, without requesting the model
+        agent.calls.clear()
+        agent.execute('ignored', run_id=run.run_id)
+        assert agent.calls==[]
+    finally:
+        journal.close()
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path=tmp_path/'runs.jsonl'
+    with Journal(str(path)) as journal:
+        run=journal.open_run('run')
+        run.record_plan(PLAN, 'run the plan')
+    with open(path, 'a') as file:
+        file.write('{"run": "run", "type": "act')
+    with Journal(str(path)) as journal:
+        run=journal.open_run('run')
+        assert run.actions==PLAN and not run.results
+        run.record('a', {'status': StatusCode.SUCCESS.value, 'result': 3})
+        # the record appended after the truncated line is read back
+        assert journal.open_run('run').results['a']['result']==3
+    lines=path.read_text().splitlines()
+    assert len(lines)==3 and json.loads(lines[-1])['id']=='a'
+
+def test_results_which_are_not_json_are_run_again(agent, tmp_path):
+    journal=Journal(str(tmp_path/'runs.jsonl'))
+    run=journal.open_run()
+    run.record_plan(PLAN)
+    run.record('a', {'status': StatusCode.SUCCESS.value, 'result': object()})
+    try:
+        loaded=journal.open_run(run.run_id)
+        assert loaded.results['a']['restorable'] is False and loaded.results['a']['result'].startswith('<object')
+        agent.journal=journal
+        state=agent.resume(run.run_id)
+        assert agent.calls==[('add', 1, 2), ('add', 3, 10)]
+        assert state['b']['result']==13
+    finally:
+        journal.close()
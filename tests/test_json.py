@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from agent.agent import StatusCode
+from agent.chatbot import OpenRouterChatbot
+from agent.streaming import ChatStream
+from agent.utils import extract_json, to_dict, to_plan
+
+PLAN=[{'id': 'a', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}}]
+
+def test_fenced_block_is_preferred_to_bracketed_prose():
+    text=f'Step [1] of the plan:\n```json\n{json.dumps(PLAN)}\n```\nThen [2].'
+    assert extract_json(text)==PLAN
+    assert to_dict(text)==PLAN
+
+def test_arrays_of_scalars_in_prose_are_skipped():
+    assert extract_json(f'See [1] and {{"x": [1]}} then {json.dumps(PLAN)}')=={'x': [1]}
+    assert extract_json(f'See [1, 2] then {json.dumps(PLAN)}')==PLAN
+    with pytest.raises(ValueError):
+        extract_json('Step [1] of [2]')
+
+def test_whole_json_response():
+    assert to_dict('[1, 2]')==[1, 2]
+    assert to_dict(f'```json\n{json.dumps(PLAN)}\n```')==PLAN
+
+def test_to_plan():
+    assert to_plan(PLAN[0])==PLAN
+    assert to_plan([{'id': 'a', 'function': {'name': 'add'}}])[0]['function']['arguments']=={}
+    assert to_plan([{'id': 'a', 'function': {'name': 'add', 'arguments': '{"a": 1}'}}])[0]['function']['arguments']=={'a': 1}
+    for invalid in ([1], '', [{'id': 'a'}], [{'id': 'a', 'function': {'name': 'add', 'arguments': [1]}}], {'foo': 1}):
+        with pytest.raises(ValueError):
+            to_plan(invalid)
+
+def test_execute_plan_in_prose(stub):
+    from tests.agents import StubAgent
+    server=stub(text=f'Step [1] of the plan:\n```json\n{json.dumps(PLAN)}\n```')
+    agent=StubAgent(base_url=server.base_url)
+    state=agent.execute('add 1 and 2')
+    assert state['a']['status']==StatusCode.SUCCESS.value and state['a']['result']==3
+
+def test_execute_invalid_plan_raises_value_error(stub):
+    from tests.agents import StubAgent
+    server=stub(text='{"foo": 1}')
+    agent=StubAgent(base_url=server.base_url)
+    with pytest.raises(ValueError):
+        agent.execute('add 1 and 2')
+
+def test_streamed_plan_is_recorded_before_it_runs(agent, monkeypatch):
+    plan=[{'id': 'n', 'function': {'name': 'numbers', 'arguments': {'n': 3}}},
+          {'id': 's', 'function': {'name': 'add', 'arguments': {'a': 1, 'b': 2}}},
+          {'id': 'r', 'function': {'name': 'add', 'arguments': {'a': '$s', 'b': 1}}}]
+    content=json.dumps(plan)
+    def chat(self, messages, tools=None, format=None, stream=False, **kwargs):
+        lines=[]
+        for i in range(0, len(content), 10):
+            lines+=[f'data: {json.dumps({"choices": [{"delta": {"content": content[i:i+10]}}]})}', '']
+        return ChatStream(lines+['data: [DONE]', ''])
+    monkeypatch.setattr(OpenRouterChatbot, 'chat', chat)
+
+    session=agent.new_session()
+    state=agent.execute('run', session=session, stream=True)
+    assert state['r']['result']==4
+    # the session holds the plan with its references, not the resolved arguments
+    assert json.loads(session.messages()[-1].content)==plan
+
+def test_execute_streamed_tool_calls(stub, monkeypatch):
+    from tests.agents import StubAgent
+    server=stub(text='The sum is 3.')
+    agent=StubAgent(base_url=server.base_url)
+    streams=[]
+    chat=OpenRouterChatbot.chat
+    def stream_chat(self, messages, tools=None, format=None, stream=False, **kwargs):
+        if not stream:
+            return chat(self, messages, tools, format, stream, **kwargs)
+        # tool calls streamed in fragments, the arguments as a json string
+        deltas=[[{'index': 0, 'id': 'call_1', 'type': 'function', 'function': {'name': 'add', 'arguments': '{"a": 1,'}}],
+                [{'index': 0, 'function': {'arguments': ' "b": 2}'}}]]
+        lines=[]
+        for delta in deltas:
+            lines+=[f'data: {json.dumps({"choices": [{"delta": {"tool_calls": delta}}]})}', '']
+        streams.append(1)
+        return ChatStream(lines+[f'data: {json.dumps({"choices": [{"delta": {}, "finish_reason": "tool_calls"}]})}', '',
+                                 'data: [DONE]', ''])
+    monkeypatch.setattr(OpenRouterChatbot, 'chat', stream_chat)
+    try:
+        state=agent.execute('add 1 and 2', stream=True)
+    finally:
+        agent.close()
+    assert state['call_1']['status']==StatusCode.SUCCESS.value and state['call_1']['result']==3
+    assert agent.answer=='The sum is 3.'
+    # the plan isn't requested again, the tool result is sent back for the answer
+    assert len(streams)==1 and server.requests==1
+    assert server.bodies[0]['messages'][-1]=={'role': 'tool', 'content': '3', 'tool_call_id': 'call_1'}
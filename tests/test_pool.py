@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import pytest
+
+from agent.pool import AgentPool
+
+def test_acheckout_waits_for_a_checkin(agent):
+    pool=AgentPool(agent, max_size=1)
+    checked_out=pool.checkout()
+
+    async def run():
+        threads=threading.active_count()
+        task=asyncio.ensure_future(pool.acheckout())
+        await asyncio.sleep(0.05)
+        assert not task.done() and threading.active_count()==threads
+        threading.Timer(0.05, pool.checkin, (checked_out,)).start()
+        return await asyncio.wait_for(task, 2)
+
+    assert asyncio.run(run()) is checked_out
+    assert pool.stats()['checked_out']==1 and not pool._waiters
+
+def test_acheckout_timeout_and_cancellation(agent):
+    pool=AgentPool(agent, max_size=1)
+    checked_out=pool.checkout()
+
+    async def run():
+        with pytest.raises(TimeoutError):
+            await pool.acheckout(timeout=0.05)
+        task=asyncio.ensure_future(pool.acheckout())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert not pool._waiters
+    # the cancelled checkout didn't take the slot
+    pool.checkin(checked_out)
+    assert pool.checkout(timeout=0.1) is checked_out
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from time import monotonic
+
+from agent.ratelimit import RateLimiter
+
+def test_aacquire_waits_without_threads():
+    # 10 requests per second, one at a time
+    limiter=RateLimiter(rpm=600, burst=0.1)
+
+    async def run():
+        threads=threading.active_count()
+        tasks=[asyncio.ensure_future(limiter.aacquire('key', 'model', client=i)) for i in range(5)]
+        await asyncio.sleep(0.1)
+        assert threading.active_count()==threads
+        return await asyncio.gather(*tasks)
+
+    start=monotonic()
+    assert asyncio.run(run())==[True]*5
+    assert 0.3<monotonic()-start<1.5
+    assert not limiter._queues
+
+def test_aacquire_timeout_and_cancellation():
+    limiter=RateLimiter(rpm=6, burst=1)
+
+    async def run():
+        assert await limiter.aacquire('key', 'model')
+        assert not await limiter.aacquire('key', 'model', timeout=0.1)
+        task=asyncio.ensure_future(limiter.aacquire('key', 'model'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    # the cancelled request left the queue
+    assert not limiter._queues
+
+def test_aacquire_is_woken_when_the_head_is_served():
+    limiter=RateLimiter(rpm=600, burst=0.1)
+    order=[]
+
+    async def request(name: str, priority: int):
+        await limiter.aacquire('key', 'model', priority=priority)
+        order.append(name)
+
+    def thread_request():
+        limiter.acquire('key', 'model', priority=-1)
+        order.append('thread')
+
+    async def run():
+        await limiter.aacquire('key', 'model')
+        # the thread request is served first, then the coroutines by priority
+        thread=threading.Thread(target=thread_request)
+        thread.start()
+        await asyncio.sleep(0.01)
+        await asyncio.gather(request('low', 1), request('high', 0))
+        thread.join()
+
+    asyncio.run(run())
+    assert order==['thread', 'high', 'low']
+
+def test_aacquire_doesnt_block_the_loop_on_the_sqlite_lock(tmp_path):
+    import sqlite3
+    from agent.ratelimit import SQLiteBucketStore
+    path=str(tmp_path/'buckets.db')
+    limiter=RateLimiter(rpm=600, store=SQLiteBucketStore(path))
+    # another process holds the write lock of the database
+    connection=sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.3, connection.execute, ('COMMIT',)).start()
+
+    async def run():
+        ticks=0
+        task=asyncio.ensure_future(limiter.aacquire('key', 'model'))
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks+=1
+        return task.result(), ticks
+
+    granted, ticks=asyncio.run(run())
+    connection.close()
+    assert granted and ticks>=10
+    assert not limiter._queues
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from agent.references import CompiledArguments
+
+def test_references_are_resolved():
+    results={'a': {'items': [1, {'key': 'x'}]}, 'b': SimpleNamespace(name='paris'), 'c': 3}
+    arguments=CompiledArguments({'whole': '$a',
+                                 'item': "$a['items'][1]['key']",
+                                 'attr': '$b.name',
+                                 'key': '$a.items',
+                                 'nested': [{'value': '$c'}],
+                                 'text': 'weather in $b.name: $c degrees',
+                                 'unknown': '$d costs 5$'},
+                                ids={'a', 'b', 'c'})
+    assert arguments.references=={'a', 'b', 'c'}
+    assert arguments.resolve(results.__getitem__)=={'whole': results['a'],
+                                                    'item': 'x',
+                                                    'attr': 'paris',
+                                                    'key': [1, {'key': 'x'}],
+                                                    'nested': [{'value': 3}],
+                                                    'text': 'weather in paris: 3 degrees',
+                                                    'unknown': '$d costs 5$'}
+
+def test_arguments_without_references_are_constant():
+    arguments=CompiledArguments({'a': 1, 'b': ['x', {'c': 'y'}]}, ids={'a'})
+    assert not arguments.references
+    assert arguments.resolve(None)=={'a': 1, 'b': ['x', {'c': 'y'}]}
@@ -0,0 +1,42 @@
+import logging
+
+from agent.cache import MemoryCache
+from agent.chatbot import OpenRouterChatbot, Formats
+from agent.models import Message
+from agent.retry import RetryPolicy
+from benchmarks.stub_server import PAID_MODEL
+
+def _chatbot(server, cache: MemoryCache)->OpenRouterChatbot:
+    return OpenRouterChatbot(PAID_MODEL, 'test-key', logging.CRITICAL, base_url=server.base_url,
+                             response_cache=cache, retry_policy=RetryPolicy(base_delay=0.001))
+
+def test_cache_hit_skips_the_request(stub):
+    server=stub(text='cached answer')
+    cache=MemoryCache()
+    chatbot=_chatbot(server, cache)
+    try:
+        assert chatbot.chat([Message('user', 'hi')])=='cached answer'
+        assert chatbot.chat([Message('user', 'hi')])=='cached answer'
+        assert server.requests==1 and cache.stats()['hits']==1
+        # another request is a miss
+        chatbot.chat([Message('user', 'hello')])
+        assert server.requests==2
+        # use_cache=False bypasses the cache
+        chatbot.chat([Message('user', 'hi')], use_cache=False)
+        assert server.requests==3 and cache.stats()['hits']==1
+    finally:
+        chatbot.close()
+
+def test_only_responses_satisfying_the_format_are_cached(stub):
+    server=stub(messages=[{'role': 'assistant', 'content': 'not json'},
+                          {'role': 'assistant', 'content': '{"a": 1}'}])
+    cache=MemoryCache()
+    chatbot=_chatbot(server, cache)
+    try:
+        assert chatbot.chat([Message('user', 'hi')], format=Formats.DICT)=={'a': 1}
+        assert server.requests==2 and len(cache)==1
+        # the cached response is served, not the invalid one
+        assert chatbot.chat([Message('user', 'hi')], format=Formats.DICT)=={'a': 1}
+        assert server.requests==2
+    finally:
+        chatbot.close()
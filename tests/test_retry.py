@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from agent.chatbot import OpenRouterChatbot, Formats
+from agent.models import Message
+from agent.retry import RetryError, RetryPolicy, parse_retry_after
+from benchmarks.stub_server import PAID_MODEL
+
+def test_backoff_grows_within_the_jitter_bounds():
+    policy=RetryPolicy(base_delay=1.0, multiplier=2.0, max_delay=5.0, jitter=0.5)
+    for attempt, delay in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)):
+        for _ in range(50):
+            assert delay*0.5<=policy.get_delay(attempt)<=delay
+    assert RetryPolicy(jitter=0.0).get_delay(3)==4.0
+
+def test_retry_after():
+    assert parse_retry_after('3')==3.0 and parse_retry_after(1.5)==1.5
+    assert parse_retry_after('-2')==0.0
+    assert parse_retry_after(None) is None and parse_retry_after('soon') is None
+    date=format_datetime(datetime.now(timezone.utc)+timedelta(seconds=10), usegmt=True)
+    assert 8<=parse_retry_after(date)<=10
+    assert parse_retry_after(format_datetime(datetime(2000, 1, 1, tzinfo=timezone.utc), usegmt=True))==0.0
+    # the Retry-After of the server replaces the backoff
+    assert RetryPolicy().get_delay(1, '7')==7.0
+
+def test_max_attempts():
+    retry=RetryPolicy(max_attempts=3, base_delay=0.0, deadline=None).start()
+    retry.next_delay('first')
+    retry.next_delay('second')
+    with pytest.raises(RetryError) as error:
+        retry.next_delay('third', status_code=503)
+    assert error.value.attempts==3 and error.value.status_code==503 and error.value.last_error=='third'
+
+def test_deadline():
+    retry=RetryPolicy(base_delay=2.0, jitter=0.0, deadline=1.0).start()
+    with pytest.raises(RetryError, match='deadline'):
+        retry.next_delay('error')
+    # a Retry-After within the deadline is waited for
+    assert RetryPolicy(deadline=1.0).start().next_delay('error', retry_after='0.5')==0.5
+
+def test_retryable_responses():
+    policy=RetryPolicy()
+    for status_code in (408, 429, 500, 502, 503, 504):
+        assert policy.is_retryable(status_code)
+    assert not policy.is_retryable(400) and not policy.is_retryable(401) and not policy.is_retryable(200, {'choices': []})
+    # errors reported in the body of a 200 response
+    assert policy.is_retryable(200, {'error': {'code': 429, 'message': 'rate limited'}})
+    assert not policy.is_retryable(200, {'error': {'code': 400, 'message': 'bad request'}})
+
+def test_chat_gives_up_after_the_attempts(stub):
+    server=stub(error_rate=1.0)
+    chatbot=OpenRouterChatbot(PAID_MODEL, 'test-key', logging.CRITICAL, base_url=server.base_url,
+                              retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001))
+    try:
+        with pytest.raises(RetryError) as error:
+            chatbot.chat([Message('user', 'hi')])
+    finally:
+        chatbot.close()
+    assert server.requests==3
+    assert error.value.attempts==3 and error.value.status_code in (429, 500)
+
+def test_error_in_a_200_body_is_retried(stub):
+    chatbot=OpenRouterChatbot(PAID_MODEL, 'test-key', logging.CRITICAL, base_url=stub().base_url,
+                              retry_policy=RetryPolicy(max_attempts=2, base_delay=0.001))
+    try:
+        retry=chatbot.retry_policy.start()
+        body={'error': {'code': 502, 'message': 'upstream error'}}
+        content, tool_calls, delay=chatbot._process_response(retry, 200, body, None, Formats.STRING, None)
+        assert delay is not None and content==''
+        with pytest.raises(RetryError) as error:
+            chatbot._process_response(retry, 200, body, None, Formats.STRING, None)
+        assert error.value.status_code==502
+        # a non retryable error is reported at once
+        with pytest.raises(ValueError):
+            chatbot._process_response(chatbot.retry_policy.start(), 401, None, None, Formats.STRING, None)
+    finally:
+        chatbot.close()
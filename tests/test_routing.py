@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from agent.chatbot import OpenRouterChatbot, Formats
+from agent.retry import RetryError, RetryPolicy
+from agent.routing import PooledChatbot
+from agent.models import Message
+from benchmarks.stub_server import PAID_MODEL
+
+def _chatbot(server, api_key: str)->OpenRouterChatbot:
+    return OpenRouterChatbot(PAID_MODEL, api_key, logging.CRITICAL, base_url=server.base_url)
+
+def test_keys_on_the_same_model_fail_over(stub):
+    server=stub()
+    failing, healthy=_chatbot(server, 'key_1'), _chatbot(server, 'key_2')
+    def fail(*args, **kwargs):
+        raise RetryError('stub failure', 1, status_code=500)
+    failing.chat=fail
+    pool=PooledChatbot([failing, healthy], retry_policy=RetryPolicy(max_attempts=1, deadline=None), verbose=logging.CRITICAL)
+
+    stats=pool.stats()
+    assert len(stats)==2
+    for _ in range(3):
+        assert pool.chat([Message('user', 'hi')])=='Hello from the stub server.'
+    assert server.requests==3
+    # each request failed over to the healthy key, till the circuit of the failing one opened
+    assert pool.backends[1].requests==3
+    assert pool.backends[0].breaker.state=='open'
+
+def test_duplicated_names_are_made_unique(stub):
+    server=stub()
+    chatbots=[_chatbot(server, 'key_1'), _chatbot(server, 'key_1')]
+    pool=PooledChatbot(chatbots, verbose=logging.CRITICAL)
+    names=[backend.name for backend in pool.backends]
+    assert len(set(names))==2 and len(pool.stats())==2
+
+def test_backends_retry_the_format_and_fail_over_on_errors(stub):
+    server=stub(messages=[{'role': 'assistant', 'content': 'not json'},
+                          {'role': 'assistant', 'content': '{"a": 1}'}])
+    policy=RetryPolicy(base_delay=0.01)
+    chatbot=OpenRouterChatbot(PAID_MODEL, 'key_1', logging.CRITICAL, base_url=server.base_url, retry_policy=policy)
+    pool=PooledChatbot([chatbot], retry_policy=RetryPolicy(max_attempts=1, deadline=None), verbose=logging.CRITICAL)
+    # the chatbots given to the pool are not modified
+    assert chatbot.retry_policy is policy and policy.max_attempts==5
+
+    # a response not satisfying the format is retried by the backend
+    assert pool.chat([Message('user', 'hi')], format=Formats.DICT)=={'a': 1}
+    assert server.requests==2 and pool.backends[0].requests==1
+
+def test_invalid_responses_dont_open_the_breaker(stub):
+    server=stub(text='not json')
+    chatbot=OpenRouterChatbot(PAID_MODEL, 'key_1', logging.CRITICAL, base_url=server.base_url,
+                              retry_policy=RetryPolicy(max_attempts=1, deadline=None))
+    pool=PooledChatbot([chatbot], retry_policy=RetryPolicy(max_attempts=1, deadline=None), verbose=logging.CRITICAL)
+    for _ in range(3):
+        with pytest.raises(RetryError):
+            pool.chat([Message('user', 'hi')], format=Formats.DICT)
+    assert pool.backends[0].breaker.state=='closed'
+
+def test_http_errors_fail_over_without_retries(stub):
+    failing, healthy=stub(error_rate=1.0), stub()
+    chatbots=[OpenRouterChatbot(PAID_MODEL, 'key', logging.CRITICAL, base_url=server.base_url,
+                                retry_policy=RetryPolicy(base_delay=0.01))
+              for server in (failing, healthy)]
+    pool=PooledChatbot(chatbots, verbose=logging.CRITICAL)
+    assert pool.chat([Message('user', 'hi')])=='Hello from the stub server.'
+    # a single request to the failing backend, counted as a failure
+    assert failing.requests==1 and pool.backends[0].errors==1
+    # the stub fails with a rate limit, tripping the breaker, or a server error
+    assert pool.backends[0].rate_limits+pool.backends[0].breaker.failures==1
@@ -0,0 +1,41 @@
+from time import monotonic
+
+from agent.agent import StatusCode
+
+def _action(action_id: str, name: str, **arguments)->dict:
+    return {'id': action_id, 'function': {'name': name, 'arguments': arguments}}
+
+def test_dependencies_are_run_in_order(agent):
+    state=agent.call([_action('a', 'echo', value={'n': 1}),
+                      _action('b', 'add', a='$a.n', b=1),
+                      _action('c', 'add', a='$b', b='$a["n"]'),
+                      _action('d', 'echo', value='total $c')],
+                     max_concurrency=4)
+    assert all(entry['status']==StatusCode.SUCCESS.value for entry in state.values())
+    assert state['c']['result']==3 and state['d']['result']=='total 3'
+    assert [call[0] for call in agent.calls]==['echo', 'add', 'add', 'echo']
+
+def test_independent_actions_run_concurrently(agent):
+    start=monotonic()
+    state=agent.call([_action(str(i), 'slow', seconds=0.3) for i in range(4)], max_concurrency=4)
+    assert all(entry['status']==StatusCode.SUCCESS.value for entry in state.values())
+    # the plan takes about the time of one tool
+    assert monotonic()-start<0.9
+
+def test_duplicated_ids_reference_the_previous_action(agent):
+    state=agent.call([_action('a', 'echo', value=1),
+                      _action('b', 'add', a='$a', b=10),
+                      _action('a', 'add', a='$b', b=100),
+                      _action('c', 'add', a='$a', b=1000)],
+                     max_concurrency=4)
+    assert state['b']['result']==11
+    assert state['a']['result']==111
+    assert state['c']['result']==1111
+
+def test_max_concurrency_one_runs_the_actions_inline_in_order(agent):
+    state=agent.call([_action('a', 'echo', value='x'),
+                      _action('b', 'echo', value='y'),
+                      _action('c', 'echo', value='$a$b')],
+                     max_concurrency=1)
+    assert agent.calls==[('echo', 'x'), ('echo', 'y'), ('echo', 'xy')]
+    assert state['c']['result']=='xy'
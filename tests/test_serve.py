@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from time import monotonic, sleep
+
+import pytest
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAN=[{'id': 'a', 'function': {'name': 'slow', 'arguments': {'seconds': 0.05}}}]
+
+def _free_port()->int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _request(url: str, path: str, body: dict = None, with_headers: bool = False)->tuple:
+    data=None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(url+path, data, timeout=30) as response:
+            result=(response.status, json.loads(response.read()), response.headers)
+    except urllib.error.HTTPError as e:
+        result=(e.code, json.loads(e.read()), e.headers)
+    return result if with_headers else result[:2]
+
+@pytest.fixture
+def server(stub):
+    '''
+    Returns a function starting agent.serve with 2 workers against a stub server.
+    '''
+    processes=[]
+    def start(latency: float = 0.0, max_pending: int = 4, plans: list = None, **stub_kwargs):
+        backend=stub(latency=latency, plans=plans or [PLAN], **stub_kwargs)
+        port=_free_port()
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT, 'src'), ROOT]))
+        process=subprocess.Popen([sys.executable, '-m', 'agent.serve', 'tests.agents:StubAgent',
+                                  '--workers', '2', '--agents', '2', '--max-pending', str(max_pending),
+                                  '--port', str(port), '--drain-timeout', '10', '--log-level', 'WARNING',
+                                  '--kwargs', json.dumps({'base_url': backend.base_url})],
+                                 env=env, cwd=ROOT)
+        processes.append(process)
+        url=f'http://127.0.0.1:{port}'
+        deadline=monotonic()+20
+        while True:
+            try:
+                _request(url, '/health')
+                break
+            except OSError:
+                if monotonic()>deadline or process.poll() is not None:
+                    raise RuntimeError('agent.serve did not start')
+                sleep(0.05)
+        return process, url
+    yield start
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+def test_chat_and_execute(server):
+    process, url=server()
+    status_code, payload=_request(url, '/execute', {'content': 'run the plan'})
+    assert status_code==200
+    assert payload['state']['a']['status']=='success'
+    status_code, payload=_request(url, '/chat', {'content': 'hello'})
+    assert status_code==200 and payload['response']==json.dumps(PLAN)
+
+def test_invalid_content(server):
+    process, url=server()
+    assert _request(url, '/chat', {})[0]==400
+    assert _request(url, '/execute', {'content': 42})[0]==400
+    assert _request(url, '/chat', {'content': 'hello', 'format': 'xml'})[0]==400
+    assert _request(url, '/execute', {'content': 'hello', 'run_id': 1})[0]==400
+
+def test_invalid_plan_is_a_bad_gateway(server):
+    # the model returns a plan which isn't valid, the client isn't at fault
+    process, url=server(plans=[[{'id': 'a', 'function': {'arguments': {}}}]])
+    status_code, payload=_request(url, '/execute', {'content': 'run the plan'})
+    assert status_code==502 and 'error' in payload
+
+def test_provider_failure_is_a_bad_gateway(server):
+    process, url=server(error_rate=1.0)
+    status_code, payload, headers=_request(url, '/chat', {'content': 'hello'}, with_headers=True)
+    assert status_code in (502, 503)
+    assert headers['Retry-After']
+
+def test_backpressure(server):
+    process, url=server(latency=0.5, max_pending=1)
+    results=[]
+    threads=[threading.Thread(target=lambda: results.append(_request(url, '/chat', {'content': 'x'})[0])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 503 in results and 200 in results
+
+def test_worker_losing_the_accept_race_does_not_block():
+    from agent.serve import _Handler, _listen, _make_server
+    listener=_listen('127.0.0.1', 0)
+    server=_make_server(listener, _Handler)
+    try:
+        # a worker woken for a connection accepted by another worker finds no connection
+        thread=threading.Thread(target=server._handle_request_noblock, daemon=True)
+        thread.start()
+        thread.join(2)
+        assert not thread.is_alive()
+    finally:
+        server.server_close()
+
+@pytest.mark.parametrize('run', range(3))
+def test_drain_on_sigterm(server, run):
+    process, url=server(latency=0.3)
+    # single connections wake both workers, the one losing the accept must still see the shutdown
+    for _ in range(4):
+        assert _request(url, '/health')[0]==200
+    results=[]
+    threads=[threading.Thread(target=lambda: results.append(_request(url, '/chat', {'content': 'x'})[0])) for _ in range(1)]
+    for thread in threads:
+        thread.start()
+    sleep(0.1)
+    start=monotonic()
+    process.send_signal(signal.SIGTERM)
+    for thread in threads:
+        thread.join()
+    # the requests in progress complete and all the workers stop, well before the drain timeout
+    assert process.wait(timeout=8)==0
+    assert monotonic()-start<5
+    assert results==[200]
@@ -0,0 +1,76 @@
+import json
+import asyncio
+
+import pytest
+
+from agent.streaming import SSEParser, ToolCallAssembler, ChatStream, AsyncChatStream, iter_sse_events
+
+def _event(chunk: dict)->list:
+    return [f'data: {json.dumps(chunk)}', '']
+
+def _lines()->list:
+    return [': OPENROUTER PROCESSING', '',
+            *_event({'choices': [{'delta': {'role': 'assistant', 'content': 'Hel'}}]}),
+            *_event({'choices': [{'delta': {'content': 'lo'}}]}),
+            ': keep-alive',
+            *_event({'choices': [{'delta': {}, 'finish_reason': 'stop'}],
+                     'usage': {'prompt_tokens': 3, 'completion_tokens': 2, 'total_tokens': 5}}),
+            'data: [DONE]', '',
+            *_event({'choices': [{'delta': {'content': 'after done'}}]})]
+
+def test_sse_parser():
+    parser=SSEParser()
+    assert parser.feed(': comment')==parser.feed(b'event: message')==None
+    assert parser.feed('data: first line')==parser.feed(b'data:second line\r\n')==None
+    # the data lines of an event are joined on the blank line terminating it
+    assert parser.feed('\n')=='first line\nsecond line'
+    assert parser.feed('')==None
+    assert list(iter_sse_events(['data: 1', '', ': ping', 'data: 2', '', 'data: [DONE]', '', 'data: 3', '']))==['1', '2']
+    # a last event without a blank line is flushed
+    assert list(iter_sse_events(['data: 1']))==['1']
+
+def test_tool_call_assembler():
+    assembler=ToolCallAssembler()
+    assembler.feed([{'index': 1, 'id': 'call_2', 'function': {'name': 'second', 'arguments': ''}}])
+    assembler.feed([{'index': 0, 'id': 'call_1', 'type': 'function', 'function': {'name': 'first', 'arguments': '{"a":'}}])
+    assembler.feed([{'index': 0, 'function': {'arguments': ' 1}'}}, {'index': 1, 'function': {'arguments': '{}'}}])
+    assert assembler.tool_calls==[{'id': 'call_1', 'type': 'function', 'function': {'name': 'first', 'arguments': '{"a": 1}'}},
+                                  {'id': 'call_2', 'type': 'function', 'function': {'name': 'second', 'arguments': '{}'}}]
+
+def test_chat_stream():
+    closed=[]
+    stream=ChatStream(_lines(), close=lambda: closed.append(True))
+    assert list(stream)==['Hel', 'lo']
+    assert stream.content=='Hello' and stream.finish_reason=='stop' and stream.usage['total_tokens']==5
+    assert closed==[True]
+
+    with pytest.raises(ValueError, match='overloaded'):
+        list(ChatStream(_event({'error': {'code': 502, 'message': 'overloaded'}})))
+
+def test_async_chat_stream():
+    class Lines:
+        def __init__(self, lines):
+            self._lines=iter(lines)
+            self.closed=False
+        def __aiter__(self):
+            return self
+        async def __anext__(self):
+            try:
+                return next(self._lines)
+            except StopIteration:
+                raise StopAsyncIteration
+        async def aclose(self):
+            self.closed=True
+
+    async def run(lines):
+        stream=AsyncChatStream(lines)
+        return [content async for content in stream], stream
+
+    lines=Lines(_lines())
+    deltas, stream=asyncio.run(run(lines))
+    assert deltas==['Hel', 'lo'] and stream.content=='Hello' and stream.usage['total_tokens']==5
+    assert lines.closed
+
+    tool_calls=_event({'choices': [{'delta': {'tool_calls': [{'index': 0, 'id': 'call_1', 'function': {'name': 'add', 'arguments': '{}'}}]}}]})
+    deltas, stream=asyncio.run(run(Lines(tool_calls)))
+    assert deltas==[] and stream.tool_calls[0]['function']['name']=='add'
@@ -0,0 +1,43 @@
+import threading
+from time import monotonic, sleep
+
+from agent.agent import StatusCode
+from agent.scheduler import ToolExecutor
+
+def _slow(action_id: str, seconds: float, **arguments)->dict:
+    return {'id': action_id, 'function': {'name': 'slow', 'arguments': {'seconds': seconds, **arguments}}}
+
+def test_tool_timeout(agent):
+    agent.tool_timeout=0.1
+    state=agent.call([_slow('a', 0.5), _slow('b', 0.01)])
+    assert state['a']['status']==StatusCode.TIMEOUT.value
+    assert state['b']['status']==StatusCode.SUCCESS.value and state['b']['result']==0.01
+
+def test_actions_after_the_plan_deadline_are_not_started(agent):
+    start=monotonic()
+    state=agent.call([_slow(str(i), 0.3) for i in range(4)], timeout=0.2, max_concurrency=1)
+    assert [entry['status'] for entry in state.values()]==[StatusCode.TIMEOUT.value]*4
+    # only the first tool was started
+    assert agent.calls==[('slow', 0.3)]
+    assert monotonic()-start<0.5
+
+def test_dependents_of_a_timed_out_action_are_skipped(agent):
+    state=agent.call([_slow('a', 0.3),
+                      {'id': 'b', 'function': {'name': 'add', 'arguments': {'a': '$a', 'b': 1}}}],
+                     timeout=0.1)
+    assert state['a']['status']==StatusCode.TIMEOUT.value
+    assert state['b']['status']==StatusCode.SKIPPED.value
+    assert all(call[0]!='add' for call in agent.calls)
+
+def test_tool_executor_is_bounded():
+    executor=ToolExecutor(max_workers=2)
+    release=threading.Event()
+    futures=[executor.submit(release.wait) for _ in range(5)]
+    sleep(0.1)
+    assert len(executor._threads)==2
+    assert sum(future.running() for future in futures)==2
+    # a queued tool cancelled after its timeout is never started
+    assert futures[-1].cancel()
+    release.set()
+    assert all(future.result(1) for future in futures[:-1])
+    assert len(executor._threads)==2
@@ -0,0 +1,40 @@
+from agent.agent import StatusCode
+from tests.agents import StubAgent
+
+def _tool_calls(call_id: str, a: int, b: int)->dict:
+    return {'role': 'assistant', 'content': '',
+            'tool_calls': [{'id': call_id, 'type': 'function',
+                            'function': {'name': 'add', 'arguments': f'{{"a": {a}, "b": {b}}}'}}]}
+
+def test_tool_results_are_sent_back_till_the_answer(stub):
+    server=stub(messages=[_tool_calls('call_1', 1, 2), _tool_calls('call_2', 3, 4),
+                          {'role': 'assistant', 'content': 'The results are 3 and 7.'}])
+    agent=StubAgent(base_url=server.base_url)
+    try:
+        state=agent.execute('add the numbers')
+    finally:
+        agent.close()
+    assert agent.answer=='The results are 3 and 7.'
+    assert state['call_1']['result']==3 and state['call_2']['result']==7
+    assert server.requests==3
+    # the tools are sent natively, not described in the prompt
+    assert server.bodies[0]['tools'] and 'Tools Description' not in server.bodies[0]['messages'][-1]['content']
+
+    messages=server.bodies[2]['messages']
+    assert messages[-4]['role']=='assistant' and messages[-4]['tool_calls'][0]['id']=='call_1'
+    assert messages[-3]=={'role': 'tool', 'content': '3', 'tool_call_id': 'call_1'}
+    assert messages[-2]['tool_calls'][0]['function']=={'name': 'add', 'arguments': '{"a": 3, "b": 4}'}
+    assert messages[-1]=={'role': 'tool', 'content': '7', 'tool_call_id': 'call_2'}
+
+def test_tool_rounds_are_capped(stub):
+    server=stub(messages=[_tool_calls('call_1', 1, 2)])
+    agent=StubAgent(base_url=server.base_url)
+    agent.max_tool_rounds=2
+    try:
+        state=agent.execute('add the numbers forever')
+    finally:
+        agent.close()
+    assert agent.answer is None
+    assert state['call_1']['status']==StatusCode.SUCCESS.value
+    # the first request and one per round
+    assert server.requests==3 and len(agent.calls)==2